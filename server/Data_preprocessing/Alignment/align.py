@@ -0,0 +1,398 @@
+"""
+Incremental, parallel alignment of ERA5, VIIRS, DEM and LULC rasters to one grid.
+
+    # Reproject every source onto the VIIRS grid (the resample_*.ipynb notebooks)
+    python align.py run --grid-ref VIIRS_fire_time_stack.tif --out aligned/ \\
+        --source era5_t2m="ERA5_fast_tif_stacks/ERA5_t2m_*.tif" \\
+        --source era5_d2m="ERA5_fast_tif_stacks/ERA5_d2m_*.tif" \\
+        --source era5_tp="ERA5_fast_tif_stacks/ERA5_tp_*.tif" \\
+        --source era5_u10="ERA5_fast_tif_stacks/ERA5_u10_*.tif" \\
+        --source era5_v10="ERA5_fast_tif_stacks/ERA5_v10_*.tif" \\
+        --source dem="merged_DEM_30m_32644.tif" \\
+        --source lulc="lulc_maps_tif/LULC_*_clipped.tif" \\
+        --normalize era5_t2m era5_d2m era5_tp era5_u10 era5_v10 dem
+
+    # Write the sequence index CSV that Sequence_generation/main.py trains from
+    python align.py index --manifest aligned/alignment_manifest.json \\
+        --out sequence_index_hourly_binary.csv --start-time 2015-01-01T00:00
+
+The target grid is either a reference raster (--grid-ref) or a JSON spec
+(--grid) holding "crs" plus either "transform", "width" and "height" or
+"bounds" and "resolution". Files are reprojected in a process pool, each to
+OUT/NAME/<its path below the common directory of NAME's files>_aligned.tif. A file is
+skipped when the manifest already records its output for the same source
+content hash and parameters, so re-running after new hourly data arrives only
+processes the new or changed files. A file that fails to align is listed
+under "failed" in the manifest (and retried next run) instead of stopping
+the others.
+"""
+import argparse
+import glob
+import hashlib
+import json
+import math
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import rasterio
+from rasterio.transform import Affine, from_origin
+from rasterio.warp import Resampling, reproject
+
+MANIFEST_NAME = "alignment_manifest.json"
+# Bump when the output of align_file changes for the same inputs, to redo everything
+ALIGN_VERSION = 1
+# Categorical sources keep their classes; the rest are interpolated
+CATEGORICAL_PREFIXES = ("lulc", "viirs")
+HASH_BLOCK_BYTES = 8 * 1024 * 1024
+
+# Defaults of time_sequences_csv.ipynb
+SEQ_LEN = 6
+HORIZONS = [1, 2, 3]
+ERA5_VARS = ["t2m", "d2m", "tp", "u10", "v10"]
+
+
+# --- 1. Target grid ---
+
+def grid_from_reference(path):
+    """The grid of an existing raster; a missing CRS is taken as EPSG:4326, as in the notebooks."""
+    with rasterio.open(path) as ref:
+        crs = ref.crs.to_string() if ref.crs is not None else "EPSG:4326"
+        return {"crs": crs, "transform": list(ref.transform)[:6], "width": ref.width, "height": ref.height}
+
+def grid_from_spec(spec):
+    """Normalizes a JSON grid spec to crs/transform/width/height."""
+    if "transform" in spec:
+        return {"crs": spec["crs"], "transform": list(spec["transform"])[:6],
+                "width": int(spec["width"]), "height": int(spec["height"])}
+    left, bottom, right, top = spec["bounds"]
+    res = spec["resolution"]
+    res_x, res_y = (res, res) if np.isscalar(res) else res
+    return {
+        "crs": spec["crs"],
+        "transform": list(from_origin(left, top, res_x, res_y))[:6],
+        "width": math.ceil((right - left) / res_x),
+        "height": math.ceil((top - bottom) / res_y),
+    }
+
+
+# --- 2. Per-file alignment (runs in the worker processes) ---
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_BYTES), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def params_hash(params):
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()[:16]
+
+def _normalize(data):
+    """Min-max scaling across all bands, as normalize_raster in time_sequences_csv.ipynb."""
+    if not np.isfinite(data).any():  # Nothing of the source falls inside the grid
+        return data
+    low, high = np.nanmin(data), np.nanmax(data)
+    if high - low > 1e-6:
+        return (data - low) / (high - low)
+    return np.zeros_like(data)
+
+def align_file(task):
+    """
+    Reprojects one source file onto the grid unless `task["previous"]` (its
+    manifest entry from the last run) shows the output is up to date. Returns
+    the file's new manifest entry.
+    """
+    source, output, params, previous = task["source"], task["output"], task["params"], task["previous"]
+    stat = os.stat(source)
+    # An unchanged size and mtime means an unchanged hash; skip re-reading big stacks
+    if previous and previous["source_size"] == stat.st_size and previous["source_mtime_ns"] == stat.st_mtime_ns:
+        content_hash = previous["source_sha256"]
+    else:
+        content_hash = file_sha256(source)
+    entry = {
+        "name": task["name"],
+        "source": source,
+        "output": output,
+        "source_sha256": content_hash,
+        "source_size": stat.st_size,
+        "source_mtime_ns": stat.st_mtime_ns,
+        "params_hash": params_hash(params),
+    }
+    if (
+        previous
+        and previous["source_sha256"] == content_hash
+        and previous["params_hash"] == entry["params_hash"]
+        and os.path.exists(output)
+    ):
+        return {**previous, **entry, "skipped": True}
+
+    start = time.perf_counter()
+    grid = params["grid"]
+    resampling = Resampling[params["resampling"]]
+    with rasterio.open(source) as src:
+        dtype = src.dtypes[0] if resampling == Resampling.nearest and not params["normalize"] else "float32"
+        nodata = src.nodata
+        if nodata is None and np.dtype(dtype).kind == "f":
+            nodata = np.nan
+        resampled = np.empty((src.count, grid["height"], grid["width"]), dtype=dtype)
+        reproject(
+            source=rasterio.band(src, list(range(1, src.count + 1))),
+            destination=resampled,
+            src_transform=src.transform,
+            src_crs=src.crs if src.crs is not None else "EPSG:4326",
+            src_nodata=src.nodata,
+            dst_transform=Affine(*grid["transform"]),
+            dst_crs=grid["crs"],
+            dst_nodata=nodata,
+            resampling=resampling,
+        )
+        bands = src.count
+    if params["normalize"]:
+        resampled = _normalize(resampled)
+
+    profile = {
+        "driver": "GTiff",
+        "height": grid["height"],
+        "width": grid["width"],
+        "count": bands,
+        "dtype": dtype,
+        "crs": grid["crs"],
+        "transform": Affine(*grid["transform"]),
+        "nodata": nodata,
+        "compress": "lzw",
+    }
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    # Written aside and moved into place, so an interrupted run never leaves a partial output
+    partial = f"{output}.partial"
+    with rasterio.open(partial, "w", **profile) as dst:
+        dst.write(resampled)
+    os.replace(partial, output)
+    return {**entry, "bands": bands, "dtype": dtype, "resampling": params["resampling"],
+            "normalize": params["normalize"], "seconds": round(time.perf_counter() - start, 3), "skipped": False}
+
+
+# --- 3. Pipeline ---
+
+def parse_sources(specs):
+    """NAME=GLOB pairs -> {name: [files]}, in sorted file order."""
+    sources = {}
+    for spec in specs:
+        name, sep, pattern = spec.partition("=")
+        if not sep or not name:
+            raise ValueError(f"--source must look like NAME=GLOB, got '{spec}'")
+        files = sorted(glob.glob(pattern))
+        if not files:
+            print(f"WARNING: no files match {pattern} for '{name}'")
+        sources.setdefault(name, []).extend(files)
+    return sources
+
+def default_resampling(name):
+    return "nearest" if name.lower().startswith(CATEGORICAL_PREFIXES) else "bilinear"
+
+def load_manifest(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def run(grid, grid_ref, sources, out_dir, resampling=None, normalize=(), workers=None):
+    """Aligns every source file onto `grid` and writes the manifest, failures included; returns it."""
+    resampling = resampling or {}
+    manifest_path = os.path.join(out_dir, MANIFEST_NAME)
+    last = load_manifest(manifest_path) or {}
+    previous = {e["source"]: e for e in last.get("outputs", [])}
+
+    tasks = []
+    for name, files in sources.items():
+        params = {
+            "grid": grid,
+            "resampling": resampling.get(name, default_resampling(name)),
+            "normalize": name in normalize,
+            "version": ALIGN_VERSION,
+        }
+        files = sorted({os.path.abspath(f) for f in files})
+        # Outputs mirror the files' paths below their common directory, so equal
+        # file names in different subdirectories never share an output
+        root = os.path.commonpath([os.path.dirname(f) for f in files]) if files else ""
+        for source in files:
+            stem = os.path.splitext(os.path.relpath(source, root))[0]
+            tasks.append({
+                "name": name,
+                "source": source,
+                "output": os.path.abspath(os.path.join(out_dir, name, f"{stem}_aligned.tif")),
+                "params": params,
+                "previous": previous.get(source),
+            })
+
+    start = time.perf_counter()
+    outputs, failed = [], []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(align_file, task): task for task in tasks}
+        for done, future in enumerate(as_completed(futures), 1):
+            task = futures[future]
+            try:
+                entry = future.result()
+            except Exception as e:
+                # Recorded instead of raised, so the files that did align still reach the manifest
+                failed.append({"name": task["name"], "source": task["source"], "error": repr(e)})
+                print(f"[{done}/{len(tasks)}] {task['name']}: {os.path.basename(task['source'])} FAILED: {e!r}")
+                continue
+            outputs.append(entry)
+            status = "unchanged" if entry["skipped"] else f"aligned in {entry['seconds']:.1f}s"
+            print(f"[{done}/{len(tasks)}] {entry['name']}: {os.path.basename(entry['source'])} {status}")
+
+    # Sources not named in this run stay in the manifest while their grid is still the target
+    if last.get("grid") == grid:
+        outputs += [{**e, "skipped": True} for e in previous.values() if e["name"] not in sources]
+    outputs.sort(key=lambda e: (e["name"], e["source"]))
+    manifest = {
+        "version": ALIGN_VERSION,
+        "grid": grid,
+        "grid_ref": os.path.abspath(grid_ref) if grid_ref else None,
+        "outputs": [{k: v for k, v in e.items() if k != "skipped"} for e in outputs],
+        # Left out of "outputs", so the next run processes them from scratch
+        "failed": sorted(failed, key=lambda e: (e["name"], e["source"])),
+    }
+    os.makedirs(out_dir, exist_ok=True)
+    with open(f"{manifest_path}.partial", "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(f"{manifest_path}.partial", manifest_path)
+    aligned = sum(not e["skipped"] for e in outputs)
+    print(f"Aligned {aligned} of {len(tasks)} files ({len(tasks) - aligned - len(failed)} unchanged, "
+          f"{len(failed)} failed) in {time.perf_counter() - start:.1f}s; manifest: {manifest_path}")
+    return manifest
+
+
+# --- 4. Sequence index ---
+
+def _pick(entries, role, year):
+    """The role's single output, or the one whose file name carries `year` (e.g. LULC_2016)."""
+    if len(entries) == 1:
+        return entries[0]["output"]
+    matches = [e["output"] for e in entries if re.search(rf"(?<!\d){year}(?!\d)", os.path.basename(e["source"]))]
+    if len(matches) != 1:
+        raise ValueError(f"Cannot choose a '{role}' file for {year}: {len(matches)} of {len(entries)} match")
+    return matches[0]
+
+def _timeline(entries):
+    """
+    (first hour, band count, output) of each file of a time-varying role, in
+    file name order (e.g. ERA5_t2m_2015, ERA5_t2m_2016): each file's bands
+    continue the hours of the one before.
+    """
+    timeline, offset = [], 0
+    for entry in sorted(entries, key=lambda e: e["source"]):
+        count = entry.get("bands")
+        if count is None:  # The grid reference has no manifest entry of its own
+            with rasterio.open(entry["output"]) as src:
+                count = src.count
+        timeline.append((offset, count, entry["output"]))
+        offset += count
+    return timeline
+
+def _locate(timeline, hour):
+    """(first hour, band count, output) of the file holding `hour`, or None past the end."""
+    for first, count, output in timeline:
+        if first <= hour < first + count:
+            return first, count, output
+    return None
+
+def build_sequence_index(manifest, start_time, seq_len=SEQ_LEN, horizons=HORIZONS):
+    """
+    The sequence index of time_sequences_csv.ipynb (center_time,
+    seq_band_idxs, target_band_idxs and one *_file column per input) with the
+    aligned files from the manifest. Without a "viirs" source the grid
+    reference raster is the VIIRS stack.
+
+    ERA5 and VIIRS may each be split over several stacks: band indices count
+    from the start of the row's own file, and sequences whose input hours or
+    target hours would span two files are left out.
+    """
+    by_name = {}
+    for entry in manifest["outputs"]:
+        by_name.setdefault(entry["name"], []).append(entry)
+    if "viirs" not in by_name and manifest.get("grid_ref"):
+        by_name["viirs"] = [{"source": manifest["grid_ref"], "output": manifest["grid_ref"]}]
+    roles = [f"era5_{v}" for v in ERA5_VARS] + ["viirs", "dem", "lulc"]
+    missing = [r for r in roles if r not in by_name]
+    if missing:
+        raise ValueError(f"The manifest has no sources named {', '.join(missing)}")
+
+    era5 = {v: _timeline(by_name[f"era5_{v}"]) for v in ERA5_VARS}
+    for v in ERA5_VARS[1:]:
+        if [t[:2] for t in era5[v]] != [t[:2] for t in era5["t2m"]]:
+            raise ValueError(f"era5_{v} is not split into stacks of the same hours as era5_t2m")
+    viirs = _timeline(by_name["viirs"])
+
+    rows = []
+    for center in range(seq_len, sum(count for _, count, _ in era5["t2m"])):
+        inputs, targets = _locate(era5["t2m"], center), _locate(viirs, center)
+        if targets is None:
+            break
+        era5_first, _, _ = inputs
+        viirs_first, viirs_count, viirs_file = targets
+        # Same bounds as the single-stack notebook, applied within each file
+        if center - era5_first < seq_len or center - viirs_first + max(horizons) >= viirs_count:
+            continue
+        center_time = start_time + timedelta(hours=center)
+        row = {
+            "center_time": center_time,
+            "seq_band_idxs": list(range(center - era5_first - seq_len + 1, center - era5_first + 1)),
+            "target_band_idxs": [center - viirs_first + h for h in horizons],
+        }
+        for v in ERA5_VARS:
+            row[f"era5_{v}_file"] = _locate(era5[v], center)[2]
+        row["viirs_file"] = viirs_file
+        for role in ("dem", "lulc"):
+            row[f"{role}_file"] = _pick(by_name[role], role, center_time.year)
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("run", help="Align source rasters to the target grid")
+    grid_arg = p.add_mutually_exclusive_group(required=True)
+    grid_arg.add_argument("--grid-ref", help="Raster whose grid the sources are aligned to")
+    grid_arg.add_argument("--grid", help="JSON target grid spec")
+    p.add_argument("--source", action="append", required=True, help="NAME=GLOB; repeat per input")
+    p.add_argument("--out", required=True, help="Output directory (holds the manifest)")
+    p.add_argument("--resampling", action="append", default=[],
+                   help="NAME=METHOD (default: nearest for lulc*/viirs*, else bilinear)")
+    p.add_argument("--normalize", nargs="*", default=[], help="Sources to min-max scale after alignment")
+    p.add_argument("--workers", type=int, default=None, help="Processes (default: CPU count)")
+
+    p = sub.add_parser("index", help="Write the sequence index CSV from a manifest")
+    p.add_argument("--manifest", required=True)
+    p.add_argument("--out", required=True, help="Sequence index CSV")
+    p.add_argument("--start-time", required=True, help="Time of band 1, e.g. 2015-01-01T00:00")
+    p.add_argument("--seq-len", type=int, default=SEQ_LEN)
+    p.add_argument("--horizons", type=int, nargs="+", default=HORIZONS)
+
+    args = parser.parse_args()
+    if args.command == "run":
+        if args.grid_ref:
+            grid = grid_from_reference(args.grid_ref)
+        else:
+            with open(args.grid) as f:
+                grid = grid_from_spec(json.load(f))
+        resampling = dict(spec.split("=", 1) for spec in args.resampling)
+        manifest = run(grid, args.grid_ref, parse_sources(args.source), args.out,
+                       resampling=resampling, normalize=set(args.normalize), workers=args.workers)
+        if manifest["failed"]:
+            parser.exit(1, f"{len(manifest['failed'])} file(s) failed to align; see \"failed\" in the manifest\n")
+    else:
+        manifest = load_manifest(args.manifest)
+        if manifest is None:
+            parser.error(f"No manifest at {args.manifest}")
+        df = build_sequence_index(manifest, datetime.fromisoformat(args.start_time), args.seq_len, args.horizons)
+        df.to_csv(args.out, index=False)
+        print(f"Saved {len(df)} sequences to {args.out}")
+        print(f"Time range: {df['center_time'].min()} → {df['center_time'].max()}")
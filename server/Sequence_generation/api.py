@@ -1,10 +1,18 @@
 import os
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
 import numpy as np
 import tensorflow as tf
 from tensorflow.keras import layers, models, callbacks
 
+from batching import MicroBatcher
+from engine import DEFAULT_BUCKETS, InferenceEngine, TFLiteEngine
+from tiling import ArrayRegion, CubeRegion, RasterRegion, predict_region
+from wire_format import (
+    BINARY_FORMATS, JSON, OUTPUT_DTYPES, WireFormatError,
+    available_formats, decode_tensor, encode_tensor, negotiate,
+)
+
 # --- 1. Model Configuration ---
 # Match these constants to your trained model's architecture
 SEQ_LEN = 6      
@@ -13,6 +21,28 @@ PATCH_H = 13
 PATCH_W = 13     
 CHANNELS = 7     
 
+# Serving mode: "keras" serves MODEL_PATH in float32, "tflite" serves the quantized
+# export written by quantize.py from QUANTIZED_MODEL_PATH instead
+SERVING_MODE = os.environ.get("SERVING_MODE", "keras")
+QUANTIZED_MODEL_PATH = os.environ.get("QUANTIZED_MODEL_PATH", "final_model_dynamic.tflite")
+TFLITE_NUM_THREADS = int(os.environ.get("TFLITE_NUM_THREADS", os.cpu_count() or 1))
+
+# Graph-mode inference: one traced function per batch-size bucket, warmed up at startup
+INFERENCE_BUCKETS = [
+    int(b) for b in os.environ.get("INFERENCE_BUCKETS", ",".join(map(str, DEFAULT_BUCKETS))).split(",")
+]
+INFERENCE_JIT_COMPILE = os.environ.get("INFERENCE_JIT_COMPILE", "0") == "1"
+
+# Micro-batching: concurrent /predict calls are grouped into one forward pass
+MAX_BATCH_SIZE = int(os.environ.get("PREDICT_MAX_BATCH_SIZE", 32))
+MAX_BATCH_WAIT_MS = float(os.environ.get("PREDICT_MAX_BATCH_WAIT_MS", 5.0))
+
+# Whole-region prediction: sliding-window tiling over (SEQ_LEN, H, W, CHANNELS)
+REGION_STRIDE = int(os.environ.get("REGION_STRIDE", PATCH_H // 2))
+REGION_BATCH_SIZE = int(os.environ.get("REGION_BATCH_SIZE", 128))
+# Raster references in /predict-region are resolved inside this directory
+REGION_RASTER_ROOT = os.environ.get("REGION_RASTER_ROOT")
+
 # Define custom objects required for loading the model, especially Lambda layers
 def slice_output_func(x): 
     # This must match the original function logic if used in the Lambda layer
@@ -29,6 +59,8 @@ CUSTOM_OBJECTS = {
 
 MODEL_PATH = r"C:\Users\Ankit\Downloads\final_model.h5"
 MODEL = None
+ENGINE = None
+BATCHER = None
 
 # --- 2. Flask Setup ---
 app = Flask(__name__)
@@ -52,31 +84,110 @@ def load_model():
         # If the model fails to load, the server cannot function.
         MODEL = None
         
-load_model() # Load the model immediately on server startup
+if SERVING_MODE == "keras":
+    load_model() # Load the model immediately on server startup
+
+def start_engine():
+    """Creates the inference engine for SERVING_MODE and warms it up in the background."""
+    global ENGINE
+    if SERVING_MODE == "tflite":
+        print(f"Loading quantized model from: {QUANTIZED_MODEL_PATH}")
+        try:
+            ENGINE = TFLiteEngine(QUANTIZED_MODEL_PATH, num_threads=TFLITE_NUM_THREADS)
+        except Exception as e:
+            print(f"FATAL ERROR loading quantized model: {e}")
+            ENGINE = None
+            return
+        ENGINE.start_warmup()
+        return
+
+    if MODEL is None:
+        return
+    ENGINE = InferenceEngine(
+        MODEL,
+        (SEQ_LEN, PATCH_H, PATCH_W, CHANNELS),
+        buckets=INFERENCE_BUCKETS,
+        jit_compile=INFERENCE_JIT_COMPILE,
+    )
+    ENGINE.start_warmup()
+
+start_engine()
+
+def model_predict(batch):
+    """Runs one (N, SEQ_LEN, PATCH_H, PATCH_W, CHANNELS) batch through the model."""
+    return ENGINE.predict(batch)
+
+def start_batcher():
+    """Starts the micro-batching worker that serves /predict."""
+    global BATCHER
+    if ENGINE is None:
+        return
+    BATCHER = MicroBatcher(
+        model_predict,
+        max_batch_size=MAX_BATCH_SIZE,
+        max_wait_ms=MAX_BATCH_WAIT_MS,
+    )
+    print(f"Micro-batcher started (max_batch_size={MAX_BATCH_SIZE}, max_wait_ms={MAX_BATCH_WAIT_MS}).")
+
+start_batcher()
 
 
 # --- 3. Prediction Endpoint ---
 
+# Request and response bodies may be JSON (default) or a binary tensor format.
+# Binary requests set Content-Type to one of wire_format.BINARY_FORMATS; binary
+# responses are requested with an Accept header, and ?dtype=float16 halves them.
+
+def read_input_tensor():
+    """Returns (input_array, json_body) from either a binary tensor or a JSON request."""
+    if request.mimetype in BINARY_FORMATS:
+        return decode_tensor(request.get_data(), request.mimetype), {}
+    data = request.get_json()
+    input_data = data.get('input_tensor')
+    if input_data is None:
+        return None, data
+    return np.array(input_data, dtype=np.float32), data
+
+def tensor_response(array, **extra):
+    """
+    Encodes a prediction in the format negotiated from the Accept header. Extra
+    fields go into the JSON body, or into X-<Field> headers for binary formats.
+    """
+    dtype = request.args.get('dtype', 'float32')
+    if dtype not in OUTPUT_DTYPES:
+        raise WireFormatError(f"Unsupported output dtype '{dtype}'. Use one of {sorted(OUTPUT_DTYPES)}.")
+
+    media_type = negotiate(request.headers.get('Accept'))
+    if media_type != JSON:
+        headers = {f"X-{name.replace('_', '-').title()}": str(value) for name, value in extra.items()}
+        if headers:
+            headers["Access-Control-Expose-Headers"] = ", ".join(headers)
+        return Response(encode_tensor(array, media_type, dtype), mimetype=media_type, headers=headers)
+
+    array = array.astype(OUTPUT_DTYPES[dtype])
+    return jsonify({
+        "status": "success",
+        "predicted_probabilities": array.tolist(),
+        "output_shape": array.shape,
+        **extra
+    })
+
 @app.route('/predict', methods=['POST'])
 def predict():
     """
     Accepts the 4D input tensor for a single sequence and returns the 
     3D predicted probability map.
     """
-    if MODEL is None:
+    if ENGINE is None or BATCHER is None:
         return jsonify({"error": "Model failed to load on startup."}), 500
 
     try:
-        # Get JSON data from the request body
-        data = request.get_json()
-        input_data = data.get('input_tensor')
+        # 3a. Decode the request body (binary tensor or JSON lists) to a NumPy array
+        input_array, _ = read_input_tensor()
 
-        if not input_data:
+        if input_array is None:
             return jsonify({"error": "Missing 'input_tensor' field in request body."}), 400
 
-        # 3a. Convert List (JSON) to NumPy Array
-        input_array = np.array(input_data, dtype=np.float32)
-
         # 3b. Validate the 4D shape (Time, H, W, C)
         expected_shape = (SEQ_LEN, PATCH_H, PATCH_W, CHANNELS)
         if input_array.shape != expected_shape:
@@ -86,28 +197,101 @@ def predict():
                 "expected_shape": expected_shape
             }), 400
         
-        # 3c. Add the Batch Dimension (required by Keras)
-        input_tensor_5D = np.expand_dims(input_array, axis=0) # Shape: (1, 6, 13, 13, 7)
-
-        # 3d. Run Prediction
-        # The output shape will be (1, HORIZONS, PATCH_H, PATCH_W)
-        predictions_raw = MODEL.predict(input_tensor_5D, verbose=0)
+        # 3c. Run Prediction through the micro-batcher
+        # Concurrent requests share one (N, 6, 13, 13, 7) forward pass; this
+        # call returns this request's own (HORIZONS, PATCH_H, PATCH_W) slice.
+        prediction = BATCHER.predict(input_array)
         
-        # 3e. Convert output to standard list format (remove batch dimension)
-        output_data = predictions_raw[0].tolist()
-
-        return jsonify({
-            "status": "success",
-            "predicted_probabilities": output_data, # Shape: (3, 13, 13)
-            "output_shape": predictions_raw[0].shape
-        })
+        # 3d. Encode the (3, 13, 13) output in the negotiated format
+        return tensor_response(prediction)
 
+    except WireFormatError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         # Catch any runtime errors (e.g., memory, unexpected data)
         print(f"Prediction error: {e}")
         return jsonify({"error": f"An internal error occurred during prediction: {str(e)}"}), 500
 
+@app.route('/predict-region', methods=['POST'])
+def predict_region_endpoint():
+    """
+    Accepts a whole (SEQ_LEN, H, W, CHANNELS) region stack, a SEQ_LEN x CHANNELS
+    grid of raster references under REGION_RASTER_ROOT, or a time cube under
+    REGION_RASTER_ROOT with the 'start' step (index or center_time) of the
+    sequence, and returns the blended
+    (HORIZONS, H, W) probability raster. With a binary tensor body, the tiling
+    options are passed as query parameters instead.
+    """
+    if ENGINE is None:
+        return jsonify({"error": "Model failed to load on startup."}), 500
+
+    region = None
+    try:
+        input_array, data = read_input_tensor()
+        options = {**request.args.to_dict(), **data}
+        stride = int(options.get('stride', REGION_STRIDE))
+        batch_size = int(options.get('batch_size', REGION_BATCH_SIZE))
+        blend = options.get('blend', 'tent')
+
+        if input_array is not None:
+            region = ArrayRegion(input_array)
+        elif data.get('rasters') is not None:
+            if REGION_RASTER_ROOT is None:
+                return jsonify({"error": "Raster references are disabled; set REGION_RASTER_ROOT."}), 400
+            region = RasterRegion(data['rasters'], root=REGION_RASTER_ROOT)
+        elif data.get('cube') is not None:
+            if REGION_RASTER_ROOT is None:
+                return jsonify({"error": "Raster references are disabled; set REGION_RASTER_ROOT."}), 400
+            if data.get('start') is None:
+                return jsonify({"error": "'cube' requires the 'start' time step of the sequence."}), 400
+            region = CubeRegion(data['cube'], data['start'], SEQ_LEN, root=REGION_RASTER_ROOT)
+        else:
+            return jsonify({"error": "Provide 'input_tensor', 'rasters' or 'cube' in the request body."}), 400
+
+        seq_len, h, w, channels = region.shape
+        if (seq_len, channels) != (SEQ_LEN, CHANNELS):
+            return jsonify({
+                "error": "Region shape mismatch.",
+                "received_shape": region.shape,
+                "expected_shape": (SEQ_LEN, "H", "W", CHANNELS)
+            }), 400
+        if stride < 1 or batch_size < 1:
+            return jsonify({"error": "'stride' and 'batch_size' must be positive integers."}), 400
+
+        probabilities = predict_region(
+            region, model_predict, HORIZONS, PATCH_H, PATCH_W,
+            stride=stride, batch_size=batch_size, blend=blend,
+        )
+
+        # Shape: (3, H, W)
+        return tensor_response(probabilities, stride=stride)
+
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"Region prediction error: {e}")
+        return jsonify({"error": f"An internal error occurred during region prediction: {str(e)}"}), 500
+    finally:
+        if region is not None:
+            region.close()
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    """Readiness probe: 200 only once every inference bucket has been warmed up."""
+    if ENGINE is None:
+        return jsonify({"ready": False, "error": "Model failed to load on startup."}), 503
+    status = {"serving_mode": SERVING_MODE, **ENGINE.status()}
+    return jsonify(status), (200 if status["ready"] else 503)
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Reports micro-batch occupancy and latency for the /predict endpoint."""
+    if BATCHER is None:
+        return jsonify({"error": "Model failed to load on startup."}), 500
+    return jsonify({"batching": BATCHER.stats(), "wire_formats": available_formats()})
+
 # --- 4. Server Run ---
 if __name__ == '__main__':
     # You can change the port if needed, but 5000 is standard for Flask
-    app.run(host='0.0.0.0', port=5000) 
+    # threaded=True so concurrent requests can be grouped by the micro-batcher
+    app.run(host='0.0.0.0', port=5000, threaded=True) 
@@ -0,0 +1,156 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class MicroBatcher:
+    """
+    Collects concurrent single-sample prediction requests for a few milliseconds
+    and runs them through the model as one batched forward pass.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=32, max_wait_ms=5.0, history=512):
+        # predict_fn takes an (N, SEQ_LEN, H, W, C) array and returns an (N, ...) array
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._stopped = False
+
+        # Rolling per-batch records plus lifetime counters for the metrics endpoint
+        self._history = deque(maxlen=history)
+        self._stats_lock = threading.Lock()
+        self._total_batches = 0
+        self._total_samples = 0
+        self._total_errors = 0
+
+        self._worker = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._worker.start()
+
+    # --- Public API ---
+
+    def submit(self, sample):
+        """Queues a single sample and returns a Future resolving to its prediction."""
+        future = Future()
+        with self._cond:
+            if self._stopped:
+                raise RuntimeError("MicroBatcher has been stopped.")
+            self._queue.append((sample, future, time.perf_counter()))
+            self._cond.notify()
+        return future
+
+    def predict(self, sample, timeout=None):
+        """Blocking helper: submits one sample and waits for its prediction."""
+        return self.submit(sample).result(timeout=timeout)
+
+    def stop(self):
+        """Stops the worker thread; requests still queued are failed."""
+        with self._cond:
+            self._stopped = True
+            pending = list(self._queue)
+            self._queue.clear()
+            self._cond.notify_all()
+        for _, future, _ in pending:
+            future.set_exception(RuntimeError("MicroBatcher stopped before the request was served."))
+        self._worker.join()
+
+    def stats(self):
+        """Returns lifetime counters plus occupancy/latency aggregates over recent batches."""
+        with self._stats_lock:
+            history = list(self._history)
+            totals = {
+                "total_batches": self._total_batches,
+                "total_samples": self._total_samples,
+                "total_errors": self._total_errors,
+            }
+
+        with self._cond:
+            queue_depth = len(self._queue)
+
+        summary = {
+            **totals,
+            "queue_depth": queue_depth,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "recent_batches": len(history),
+        }
+        if history:
+            sizes = np.array([b["batch_size"] for b in history], dtype=np.float64)
+            compute = np.array([b["compute_ms"] for b in history], dtype=np.float64)
+            total = np.array([b["max_latency_ms"] for b in history], dtype=np.float64)
+            summary.update({
+                "mean_batch_size": float(sizes.mean()),
+                "mean_occupancy": float(sizes.mean() / self.max_batch_size),
+                "compute_ms_p50": float(np.percentile(compute, 50)),
+                "compute_ms_p99": float(np.percentile(compute, 99)),
+                "request_latency_ms_p50": float(np.percentile(total, 50)),
+                "request_latency_ms_p99": float(np.percentile(total, 99)),
+                "last_batch": history[-1],
+            })
+        return summary
+
+    # --- Worker ---
+
+    def _collect(self):
+        """Waits for the first request, then gathers more until the batch is full or the wait expires."""
+        with self._cond:
+            while not self._queue and not self._stopped:
+                self._cond.wait()
+            if self._stopped:
+                return []
+
+            # The wait window starts when the oldest queued request arrived
+            deadline = self._queue[0][2] + self.max_wait
+            while len(self._queue) < self.max_batch_size and not self._stopped:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            n = min(len(self._queue), self.max_batch_size)
+            return [self._queue.popleft() for _ in range(n)]
+
+    def _run(self):
+        while True:
+            items = self._collect()
+            if not items:
+                if self._stopped:
+                    return
+                continue
+
+            start = time.perf_counter()
+            try:
+                batch = np.stack([sample for sample, _, _ in items], axis=0)
+                outputs = np.asarray(self.predict_fn(batch))
+                if outputs.shape[0] != len(items):
+                    raise ValueError(
+                        f"Model returned {outputs.shape[0]} outputs for a batch of {len(items)}."
+                    )
+            except Exception as e:
+                for _, future, _ in items:
+                    future.set_exception(e)
+                with self._stats_lock:
+                    self._total_errors += 1
+                continue
+            end = time.perf_counter()
+
+            # Split the batched output back to each caller
+            for i, (_, future, _) in enumerate(items):
+                future.set_result(outputs[i])
+
+            record = {
+                "batch_size": len(items),
+                "occupancy": len(items) / self.max_batch_size,
+                "queue_wait_ms": (start - items[0][2]) * 1000.0,
+                "compute_ms": (end - start) * 1000.0,
+                "max_latency_ms": (end - items[0][2]) * 1000.0,
+            }
+            with self._stats_lock:
+                self._history.append(record)
+                self._total_batches += 1
+                self._total_samples += len(items)
@@ -0,0 +1,108 @@
+"""
+Micro-benchmark: patch-read latency of the per-file GeoTIFF layout versus the time cube.
+
+    python time_cube.py build --csv sequence_index_hourly_binary.csv --out sequence_index_hourly_binary_cube.h5
+    python bench_cube.py --csv sequence_index_hourly_binary.csv --cube sequence_index_hourly_binary_cube.h5
+
+Every sample reads SEQ_LEN x CHANNELS input patches and HORIZONS target patches.
+The per-file layout does one windowed read per raster (datasets kept open, as a
+loader would); the cube reads whole batches of samples from its chunks.
+"""
+import argparse
+import ast
+import time
+
+import numpy as np
+import pandas as pd
+import rasterio
+from rasterio.windows import Window
+
+from main import HORIZONS, INPUT_COLS, PATCH_SIZE, SEQ_LEN, _safe_center
+from time_cube import CubeSampler, TimeCube
+
+
+class PerFileReader:
+    """Builds samples with windowed reads from the rasters the index references."""
+
+    def __init__(self, df, patch_size=PATCH_SIZE):
+        self.df = df
+        self.patch_size = patch_size
+        self.target_bands = [ast.literal_eval(v)[0] - 1 for v in df["target_band_idxs"]]
+        self._datasets = {}
+
+    def _read(self, path, band):
+        src = self._datasets.get(path)
+        if src is None:
+            src = self._datasets[path] = rasterio.open(path)
+        r, c = _safe_center(src.height, src.width, self.patch_size)
+        half = self.patch_size // 2
+        window = Window(int(c) - half, int(r) - half, self.patch_size, self.patch_size)
+        return src.read(1 if src.count == 1 else band + 1, window=window)
+
+    def build(self, start):
+        X = np.empty((SEQ_LEN, self.patch_size, self.patch_size, len(INPUT_COLS)), dtype=np.float32)
+        y = np.empty((HORIZONS, self.patch_size, self.patch_size), dtype=np.float32)
+        for t in range(SEQ_LEN):
+            row = self.df.iloc[start + t]
+            for ch, col in enumerate(INPUT_COLS):
+                X[t, :, :, ch] = self._read(row[col], 0)
+        for h in range(HORIZONS):
+            i = start + SEQ_LEN + h
+            y[h] = self._read(self.df["viirs_file"].iloc[i], self.target_bands[i])
+        return X, y
+
+    def close(self):
+        for src in self._datasets.values():
+            src.close()
+
+
+def latencies(build, starts, batch):
+    """Per-sample latency in ms of every batch of `batch` starts."""
+    times = []
+    for i in range(0, len(starts), batch):
+        chunk = starts[i : i + batch]
+        t0 = time.perf_counter()
+        build(chunk)
+        times.append((time.perf_counter() - t0) * 1000.0 / len(chunk))
+    return np.array(times)
+
+
+def report(name, ms):
+    print(f"{name:<28} p50 {np.percentile(ms, 50):8.3f} ms   p95 {np.percentile(ms, 95):8.3f} ms   "
+          f"{1000.0 / ms.mean():10,.0f} samples/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--csv", required=True, help="Sequence index CSV")
+    parser.add_argument("--cube", required=True, help="Time cube built from the same CSV")
+    parser.add_argument("--samples", type=int, default=500)
+    parser.add_argument("--batches", default="1,64", help="Cube batch sizes to time")
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.csv)
+    n_valid = len(df) - SEQ_LEN - HORIZONS + 1
+    starts = np.random.default_rng(0).integers(0, n_valid, size=args.samples)
+
+    per_file = PerFileReader(df)
+    cube = TimeCube(args.cube)
+    sampler = CubeSampler(cube, df)
+
+    # Both layouts must agree before their speed is worth comparing
+    for i in starts[:20]:
+        X_ref, y_ref = per_file.build(i)
+        X_cube, y_cube = sampler.build(i)
+        np.testing.assert_array_equal(X_ref, X_cube)
+        np.testing.assert_array_equal(y_ref, y_cube)
+    print("Per-file and cube samples match ✅")
+
+    report("per-file windowed reads", latencies(lambda chunk: per_file.build(chunk[0]), starts, 1))
+    for batch in [int(b) for b in args.batches.split(",")]:
+        # A fresh cube per run, so its chunk cache starts cold
+        cube.close()
+        cube = TimeCube(args.cube)
+        sampler = CubeSampler(cube, df)
+        report(f"cube, batch {batch}", latencies(sampler.build_batch, starts, batch))
+
+    per_file.close()
+    cube.close()
@@ -0,0 +1,63 @@
+"""
+CPU-only latency benchmark: MODEL.predict versus the bucketed graph-mode engine.
+
+    python bench_inference.py --model final_model.h5 --iters 100
+
+Without --model a randomly initialised model with the same architecture is used.
+"""
+import argparse
+import os
+
+os.environ.setdefault("CUDA_VISIBLE_DEVICES", "-1")  # Force CPU before TensorFlow is imported
+
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from engine import InferenceEngine
+from main import CHANNELS, CUSTOM_OBJECTS, PATCH_H, PATCH_W, SEQ_LEN, build_conv_lstm_unet_model
+
+
+def _percentiles(fn, batch, iters):
+    latencies = []
+    for _ in range(iters):
+        start = time.perf_counter()
+        fn(batch)
+        latencies.append((time.perf_counter() - start) * 1000.0)
+    return np.percentile(latencies, 50), np.percentile(latencies, 99)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--model", help="Path to a trained .h5/.keras model")
+    parser.add_argument("--iters", type=int, default=50)
+    parser.add_argument("--batch-sizes", default="1,8,32")
+    args = parser.parse_args()
+
+    if args.model:
+        model = tf.keras.models.load_model(args.model, custom_objects=CUSTOM_OBJECTS, safe_mode=False)
+    else:
+        print("No --model given; using a randomly initialised model.")
+        model = build_conv_lstm_unet_model()
+
+    batch_sizes = [int(b) for b in args.batch_sizes.split(",")]
+    engine = InferenceEngine(model, (SEQ_LEN, PATCH_H, PATCH_W, CHANNELS), buckets=batch_sizes)
+
+    # First-call cost: what the first request after startup pays on each path
+    x = np.random.rand(1, SEQ_LEN, PATCH_H, PATCH_W, CHANNELS).astype(np.float32)
+    start = time.perf_counter()
+    model.predict(x, verbose=0)
+    cold_predict = (time.perf_counter() - start) * 1000.0
+    start = time.perf_counter()
+    engine.warmup()
+    warmup_total = (time.perf_counter() - start) * 1000.0
+    print(f"\nCold MODEL.predict: {cold_predict:.1f} ms; engine warmup of {len(batch_sizes)} buckets: {warmup_total:.1f} ms")
+
+    print(f"\n{'batch':>6}{'predict p50':>14}{'predict p99':>14}{'engine p50':>13}{'engine p99':>13}{'speedup p50':>13}")
+    for b in batch_sizes:
+        x = np.random.rand(b, SEQ_LEN, PATCH_H, PATCH_W, CHANNELS).astype(np.float32)
+        np.testing.assert_allclose(engine.predict(x), model.predict(x, verbose=0), rtol=1e-4, atol=1e-5)
+        p50_a, p99_a = _percentiles(lambda batch: model.predict(batch, batch_size=b, verbose=0), x, args.iters)
+        p50_b, p99_b = _percentiles(engine.predict, x, args.iters)
+        print(f"{b:>6}{p50_a:>14.2f}{p99_a:>14.2f}{p50_b:>13.2f}{p99_b:>13.2f}{p50_a / p50_b:>12.1f}x")
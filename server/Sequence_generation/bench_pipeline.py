@@ -0,0 +1,41 @@
+"""
+Throughput of the create_dataset pipeline (samples/s) versus the number of parallel build workers.
+
+    python bench_pipeline.py --csv sequence_index_hourly_binary.csv --workers 1,2,4,8 --batches 100
+
+Without --batches one full epoch is read per configuration.
+"""
+import argparse
+
+import pandas as pd
+
+from main import REQUIRED_COLS, PatchSampler, create_dataset, load_or_build_fire_index, load_rasters
+from shards import measure_throughput
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--csv", required=True, help="Sequence index CSV")
+    parser.add_argument("--workers", default="1,2,4,8", help="Worker counts to time")
+    parser.add_argument("--build-chunk", type=int, default=64, help="Start indices per parallel build call")
+    parser.add_argument("--batches", type=int, help="Stop after this many batches")
+    parser.add_argument("--skip-reference", action="store_true", help="Only time the vectorized PatchSampler path")
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.csv)
+    cache = load_rasters(df, REQUIRED_COLS, max_workers=8)
+    fire_index = load_or_build_fire_index(args.csv, df, cache)
+    sampler = PatchSampler(df, cache, fire_index=fire_index)
+
+    builders = [("PatchSampler", True)] + ([] if args.skip_reference else [("build_sample", False)])
+    results = []
+    for name, vectorized in builders:
+        for workers in (int(w) for w in args.workers.split(",")):
+            ds = create_dataset(df, cache, sampler=sampler, vectorized=vectorized, fire_index=fire_index,
+                                num_workers=workers, build_chunk=args.build_chunk)
+            results.append((name, workers, measure_throughput(ds, args.batches)["samples_per_s"]))
+
+    print(f"\n{'builder':<16}{'workers':>8}{'samples/s':>12}{'speedup':>10}")
+    for name, workers, rate in results:
+        base = next(r for n, w, r in results if n == name)
+        print(f"{name:<16}{workers:>8}{rate:>12.0f}{rate / base if base else 0.0:>9.1f}x")
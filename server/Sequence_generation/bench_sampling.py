@@ -0,0 +1,55 @@
+"""
+Micro-benchmark: samples/second of the reference build_sample versus PatchSampler.
+
+    python bench_sampling.py --csv sequence_index_hourly_binary.csv --samples 2000
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from main import HORIZONS, REQUIRED_COLS, SEQ_LEN, PatchSampler, build_sample, load_rasters
+
+
+def reference_samples(df, cache, starts):
+    for i in starts:
+        yield build_sample(df.iloc[i : i + SEQ_LEN], df.iloc[i + SEQ_LEN : i + SEQ_LEN + HORIZONS], cache)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--csv", required=True, help="Sequence index CSV")
+    parser.add_argument("--samples", type=int, default=1000)
+    parser.add_argument("--chunks", default="1,16,64,256", help="PatchSampler batch sizes to time")
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.csv)
+    cache = load_rasters(df, REQUIRED_COLS, max_workers=8)
+    n_valid = len(df) - SEQ_LEN - HORIZONS + 1
+    starts = np.random.default_rng(0).integers(0, n_valid, size=args.samples)
+
+    start = time.perf_counter()
+    sampler = PatchSampler(df, cache)
+    setup = time.perf_counter() - start
+    print(f"PatchSampler setup (cropping {len(sampler._patches)} patches): {setup:.2f} s")
+
+    # Both builders must agree before their speed is worth comparing
+    for i in starts[:20]:
+        X_ref, y_ref = next(reference_samples(df, cache, [i]))
+        X_vec, y_vec = sampler.build(i)
+        np.testing.assert_array_equal(X_ref, X_vec)
+        np.testing.assert_array_equal(y_ref, y_vec)
+
+    start = time.perf_counter()
+    for _ in reference_samples(df, cache, starts):
+        pass
+    reference_rate = len(starts) / (time.perf_counter() - start)
+    print(f"{'build_sample (reference)':<28}{reference_rate:>12.0f} samples/s")
+
+    for chunk in (int(c) for c in args.chunks.split(",")):
+        start = time.perf_counter()
+        for offset in range(0, len(starts), chunk):
+            sampler.build_batch(starts[offset : offset + chunk])
+        rate = len(starts) / (time.perf_counter() - start)
+        print(f"{f'PatchSampler (chunk={chunk})':<28}{rate:>12.0f} samples/s  ({rate / reference_rate:.1f}x)")
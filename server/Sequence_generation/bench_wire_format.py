@@ -0,0 +1,113 @@
+"""
+Compares request latency and payload size of the /predict wire formats.
+
+Runs the Flask app in-process through its test client, so the numbers cover
+request parsing, (de)serialization and the forward pass, but not the network.
+If the trained model cannot be loaded, a randomly initialised model with the
+same architecture is used; the wire cost does not depend on the weights.
+
+    python bench_wire_format.py --requests 200
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+import api
+from wire_format import JSON, MSGPACK, NPY, RAW, available_formats, decode_tensor, encode_tensor
+
+
+def _ensure_model(timeout_s=600):
+    """Gives the app a warmed-up engine and a batcher, falling back to an untrained model."""
+    if api.ENGINE is None:
+        if api.MODEL is None and api.SERVING_MODE != "tflite":
+            from main import build_conv_lstm_unet_model
+
+            print("Trained model unavailable; benchmarking with a randomly initialised model.")
+            api.MODEL = build_conv_lstm_unet_model()
+        api.start_engine()
+        if api.ENGINE is None:
+            raise RuntimeError(f"No inference engine could be created for SERVING_MODE={api.SERVING_MODE}.")
+    # Warmup runs in the background; timings taken before it finishes would include tracing
+    deadline = time.perf_counter() + timeout_s
+    while not api.ENGINE.ready:
+        if api.ENGINE.warmup_error:
+            raise RuntimeError(f"Inference warmup failed: {api.ENGINE.warmup_error}")
+        if time.perf_counter() > deadline:
+            raise RuntimeError(f"Inference warmup did not finish within {timeout_s} s.")
+        time.sleep(0.05)
+    if api.BATCHER is None:
+        api.start_batcher()
+
+def _encode_request(array, media_type):
+    if media_type == JSON:
+        return json.dumps({"input_tensor": array.tolist()}).encode()
+    return encode_tensor(array, media_type)
+
+def _decode_response(body, media_type):
+    if media_type == JSON:
+        return np.array(json.loads(body)["predicted_probabilities"], dtype=np.float32)
+    return decode_tensor(body, media_type)
+
+def bench_format(client, media_type, dtype, n_requests):
+    """Times full client-side encode -> request -> client-side decode round trips."""
+    x = np.random.rand(api.SEQ_LEN, api.PATCH_H, api.PATCH_W, api.CHANNELS).astype(np.float32)
+    headers = {"Content-Type": media_type, "Accept": media_type}
+    latencies = []
+    request_bytes = response_bytes = 0
+
+    for _ in range(n_requests):
+        start = time.perf_counter()
+        body = _encode_request(x, media_type)
+        resp = client.post(f"/predict?dtype={dtype}", data=body, headers=headers)
+        if resp.status_code != 200:
+            raise RuntimeError(f"{media_type} request failed: {resp.get_data(as_text=True)}")
+        out = _decode_response(resp.get_data(), media_type)
+        latencies.append((time.perf_counter() - start) * 1000.0)
+        request_bytes, response_bytes = len(body), len(resp.get_data())
+
+    assert out.shape == (api.HORIZONS, api.PATCH_H, api.PATCH_W)
+    latencies = np.array(latencies)
+    return {
+        "format": media_type,
+        "dtype": dtype,
+        "request_bytes": request_bytes,
+        "response_bytes": response_bytes,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+    }
+
+def bench_codec(media_type, n_iters):
+    """Times encode + decode of one input tensor without the model or HTTP stack."""
+    x = np.random.rand(api.SEQ_LEN, api.PATCH_H, api.PATCH_W, api.CHANNELS).astype(np.float32)
+    start = time.perf_counter()
+    for _ in range(n_iters):
+        body = _encode_request(x, media_type)
+        if media_type == JSON:
+            np.array(json.loads(body)["input_tensor"], dtype=np.float32)
+        else:
+            decode_tensor(body, media_type)
+    return (time.perf_counter() - start) * 1e6 / n_iters
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--codec-iters", type=int, default=1000)
+    args = parser.parse_args()
+
+    _ensure_model()
+    client = api.app.test_client()
+    formats = [f for f in (JSON, NPY, RAW, MSGPACK) if f in available_formats()]
+
+    # Warm the model up so the first format measured is not penalised
+    bench_format(client, RAW, "float32", 5)
+
+    print(f"\n{'format':<28}{'dtype':<9}{'req bytes':>11}{'resp bytes':>12}{'p50 ms':>9}{'p99 ms':>9}{'codec us':>10}")
+    for media_type in formats:
+        codec_us = bench_codec(media_type, args.codec_iters)
+        for dtype in ("float32", "float16"):
+            r = bench_format(client, media_type, dtype, args.requests)
+            print(f"{r['format']:<28}{r['dtype']:<9}{r['request_bytes']:>11}{r['response_bytes']:>12}"
+                  f"{r['p50_ms']:>9.2f}{r['p99_ms']:>9.2f}{codec_us:>10.1f}")
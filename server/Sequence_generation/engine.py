@@ -0,0 +1,168 @@
+import threading
+import time
+
+import numpy as np
+import tensorflow as tf
+
+DEFAULT_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+
+class InferenceEngine:
+    """
+    Serves a loaded Keras model through graph-mode functions traced once per
+    batch-size bucket. Incoming batches are zero-padded up to the nearest bucket,
+    so every call hits an already-traced, fixed-shape signature.
+    """
+
+    def __init__(self, model, sample_shape, buckets=DEFAULT_BUCKETS, jit_compile=False):
+        self.model = model
+        self.sample_shape = tuple(sample_shape)
+        self.buckets = sorted(set(int(b) for b in buckets))
+        self.jit_compile = jit_compile
+
+        self._functions = {
+            b: tf.function(
+                self._forward,
+                input_signature=[tf.TensorSpec((b, *self.sample_shape), tf.float32)],
+                jit_compile=jit_compile,
+                reduce_retracing=False,
+            )
+            for b in self.buckets
+        }
+        self._ready = threading.Event()
+        self.warmup_ms = {}
+        self.warmup_error = None
+
+    def _forward(self, x):
+        return self.model(x, training=False)
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    def bucket_for(self, n):
+        """Smallest bucket that fits n samples (the largest bucket if none does)."""
+        for b in self.buckets:
+            if b >= n:
+                return b
+        return self.buckets[-1]
+
+    def warmup(self):
+        """Traces and runs every bucket once, then marks the engine ready."""
+        try:
+            for b in self.buckets:
+                start = time.perf_counter()
+                self._functions[b](tf.zeros((b, *self.sample_shape), tf.float32))
+                self.warmup_ms[b] = (time.perf_counter() - start) * 1000.0
+                print(f"Warmed up batch bucket {b} in {self.warmup_ms[b]:.1f} ms.")
+            self._ready.set()
+        except Exception as e:
+            self.warmup_error = str(e)
+            print(f"ERROR during inference warmup: {e}")
+
+    def start_warmup(self):
+        """Runs warmup on a background thread so the server can accept readiness probes."""
+        thread = threading.Thread(target=self.warmup, name="inference-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def predict(self, batch):
+        """Runs an (N, *sample_shape) batch, returning an (N, ...) NumPy array."""
+        batch = np.asarray(batch, dtype=np.float32)
+        n = batch.shape[0]
+        if batch.shape[1:] != self.sample_shape:
+            raise ValueError(f"Expected samples of shape {self.sample_shape}, got {batch.shape[1:]}.")
+        if n == 0:
+            return np.empty((0, *self.model.output_shape[1:]), dtype=np.float32)
+
+        outputs = []
+        largest = self.buckets[-1]
+        for start in range(0, n, largest):
+            chunk = batch[start:start + largest]
+            bucket = self.bucket_for(len(chunk))
+            if len(chunk) < bucket:
+                padding = np.zeros((bucket - len(chunk), *self.sample_shape), dtype=np.float32)
+                chunk = np.concatenate([chunk, padding], axis=0)
+            result = self._functions[bucket](tf.convert_to_tensor(chunk))
+            outputs.append(result.numpy()[: min(largest, n - start)])
+        return np.concatenate(outputs, axis=0)
+
+    def status(self):
+        return {
+            "ready": self.ready,
+            "buckets": self.buckets,
+            "warmup_ms": self.warmup_ms,
+            "warmup_error": self.warmup_error,
+            "jit_compile": self.jit_compile,
+        }
+
+
+class TFLiteEngine:
+    """
+    Serves a quantized .tflite export (see quantize.py) with the same interface as
+    InferenceEngine. The export has a fixed batch size, so batches are padded or
+    chunked to it. The interpreter is not thread-safe, so calls are serialised.
+    """
+
+    def __init__(self, model_path, num_threads=None):
+        self.model_path = model_path
+        self.interpreter = tf.lite.Interpreter(model_path=model_path, num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self.batch_size = int(self._input["shape"][0])
+        self.sample_shape = tuple(int(d) for d in self._input["shape"][1:])
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self.warmup_ms = {}
+        self.warmup_error = None
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    def warmup(self):
+        try:
+            start = time.perf_counter()
+            self.predict(np.zeros((self.batch_size, *self.sample_shape), dtype=np.float32))
+            self.warmup_ms[self.batch_size] = (time.perf_counter() - start) * 1000.0
+            print(f"Warmed up TFLite model '{self.model_path}' in {self.warmup_ms[self.batch_size]:.1f} ms.")
+            self._ready.set()
+        except Exception as e:
+            self.warmup_error = str(e)
+            print(f"ERROR during inference warmup: {e}")
+
+    def start_warmup(self):
+        thread = threading.Thread(target=self.warmup, name="inference-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def predict(self, batch):
+        batch = np.asarray(batch, dtype=np.float32)
+        n = batch.shape[0]
+        if batch.shape[1:] != self.sample_shape:
+            raise ValueError(f"Expected samples of shape {self.sample_shape}, got {batch.shape[1:]}.")
+        if n == 0:
+            return np.empty((0, *self._output["shape"][1:]), dtype=np.float32)
+
+        outputs = []
+        for start in range(0, n, self.batch_size):
+            chunk = batch[start:start + self.batch_size]
+            size = len(chunk)
+            if size < self.batch_size:
+                padding = np.zeros((self.batch_size - size, *self.sample_shape), dtype=np.float32)
+                chunk = np.concatenate([chunk, padding], axis=0)
+            with self._lock:
+                self.interpreter.set_tensor(self._input["index"], chunk)
+                self.interpreter.invoke()
+                outputs.append(self.interpreter.get_tensor(self._output["index"])[:size].copy())
+        return np.concatenate(outputs, axis=0)
+
+    def status(self):
+        return {
+            "ready": self.ready,
+            "model_path": self.model_path,
+            "batch_size": self.batch_size,
+            "warmup_ms": self.warmup_ms,
+            "warmup_error": self.warmup_error,
+        }
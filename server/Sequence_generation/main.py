@@ -1,3 +1,5 @@
+import ast
+import copy
 import os
 import numpy as np
 import pandas as pd
@@ -6,6 +8,8 @@ import tensorflow as tf
 from tensorflow.keras import layers, models, callbacks
 from concurrent.futures import ThreadPoolExecutor
 
+from raster_store import RasterStore
+
 # --- 1. Global Configuration ---
 # Variables are defined here, matching your notebook cells 16 and 17 definitions.
 SEQ_LEN = 6                 
@@ -32,13 +36,20 @@ def _load_single_raster(path):
     # Return 2D array if single band, otherwise 3D
     return arr[0] if arr.shape[0] == 1 else arr
 
-def load_rasters(df, raster_cols, max_workers=8):
-    """Loads all unique raster paths in parallel and caches them."""
+def load_rasters(df, raster_cols, max_workers=8, store_dir=None):
+    """
+    Loads all unique raster paths in parallel and caches them. With store_dir,
+    returns a memory-mapped RasterStore instead of an in-memory dict; rasters are
+    only read from their source files the first time (or after they change).
+    """
     all_paths = set()
     for col in raster_cols:
         if col in df.columns:
             all_paths.update(df[col].dropna().unique())
     all_paths = list(all_paths)
+
+    if store_dir is not None:
+        return RasterStore.open_or_build(store_dir, all_paths, _load_single_raster, max_workers=max_workers)
     
     cache = {}
     with ThreadPoolExecutor(max_workers=max_workers) as ex:
@@ -130,34 +141,268 @@ def build_sample(seq_rows, horizon_rows, cache, force_fire=False):
     return X.astype("float32"), y.astype("float32")
 
 
+# --- 2b. Vectorized Sample Builder ---
+# build_sample above is kept as the reference implementation. PatchSampler
+# produces identical samples, but crops every patch it can need once up front
+# and gathers whole batches of samples with a single indexing operation.
+
+INPUT_COLS = [
+    "era5_t2m_file", "era5_d2m_file", "era5_tp_file", "era5_u10_file", "era5_v10_file",
+    "dem_file", "lulc_file"
+]  # Channel order of X
+DEM_CHANNEL = INPUT_COLS.index("dem_file")
+LULC_CHANNEL = INPUT_COLS.index("lulc_file")
+
+class PatchSampler:
+    """
+    Vectorized (X, y) builder over a sequence index and its raster cache.
+
+    build_sample always crops a band at a fixed centre (the band's safe centre,
+    or the DEM centre for LULC), so each distinct (band, centre) pair is cropped
+    once into a (n_crops, P, P) table and a batch of samples is one fancy index
+    into it. Only patch windows are read from the rasters, so this works on the
+    memory-mapped RasterStore without paging whole rasters in.
+    """
+
+    def __init__(self, df, cache, patch_size=PATCH_SIZE, fire_index=None):
+        self.patch_size = patch_size
+        self.fire_index = fire_index
+        self.cache = cache
+        self._bands = {}   # (path, band) -> 2D band view
+        self._crops = {}   # (path, band, row, col) -> row of self._patches
+        self.x_crops, self.y_crops = self._row_crops(df, register=True)
+
+        self._patches = np.empty((len(self._crops), patch_size, patch_size), dtype=np.float32)
+        for (path, band, r, c), i in self._crops.items():
+            self._patches[i] = _extract_patch(self._band(path, band), r, c, patch_size)
+
+    def _band(self, path, band):
+        key = (path, band)
+        if key not in self._bands:
+            arr = self.cache[path]
+            self._bands[key] = arr if arr.ndim == 2 else arr[band]
+        return self._bands[key]
+
+    def _row_crops(self, df, register=False):
+        """Maps each index row to the crop ids of its 7 input channels and its VIIRS target."""
+        def crop(path, band, center=None):
+            if center is None:
+                center = _safe_center(*self._band(path, band).shape, self.patch_size)
+            key = (path, band, int(center[0]), int(center[1]))
+            if key not in self._crops:
+                if not register:
+                    raise KeyError(f"Crop {key} is not part of this sampler.")
+                self._crops[key] = len(self._crops)
+            return self._crops[key]
+
+        x_crops = np.empty((len(df), len(INPUT_COLS)), dtype=np.int64)
+        for i, row in enumerate(df[INPUT_COLS].itertuples(index=False)):
+            for ch, path in enumerate(row):
+                if ch != LULC_CHANNEL:
+                    x_crops[i, ch] = crop(path, 0)
+            # build_sample crops LULC around the DEM centre
+            dem_center = _safe_center(*self._band(row[DEM_CHANNEL], 0).shape, self.patch_size)
+            x_crops[i, LULC_CHANNEL] = crop(row[LULC_CHANNEL], 0, dem_center)
+
+        target_bands = [ast.literal_eval(v)[0] - 1 for v in df["target_band_idxs"]]
+        y_crops = np.array(
+            [crop(path, band) for path, band in zip(df["viirs_file"], target_bands)], dtype=np.int64
+        )
+        return x_crops, y_crops
+
+    def subset(self, df):
+        """A sampler for another index (e.g. a train/val split) sharing this crop table."""
+        sub = copy.copy(self)
+        sub.x_crops, sub.y_crops = self._row_crops(df)
+        return sub
+
+    def build_batch(self, start_indices, force_fire=False):
+        """Builds X (B, SEQ_LEN, P, P, CHANNELS) and y (B, HORIZONS, P, P) for many start rows."""
+        starts = np.asarray(start_indices, dtype=np.int64)
+        seq_rows = starts[:, None] + np.arange(SEQ_LEN)
+        horizon_rows = starts[:, None] + SEQ_LEN + np.arange(HORIZONS)
+
+        X = np.ascontiguousarray(np.moveaxis(self._patches[self.x_crops[seq_rows]], 2, -1))
+        y_crops = self.y_crops[horizon_rows]
+        y = self._patches[y_crops]
+
+        if force_fire:
+            crop_keys = list(self._crops)
+            for b, h in np.ndindex(y_crops.shape):
+                path, band, _, _ = crop_keys[y_crops[b, h]]
+                if self.fire_index is not None:
+                    fire_pos = self.fire_index.fire_pixels(path, band)
+                else:
+                    fire_pos = np.argwhere(self._band(path, band) > 0)
+                if len(fire_pos):
+                    r, c = fire_pos[np.random.randint(len(fire_pos))]
+                    y[b, h] = _extract_patch(self._band(path, band), r, c, self.patch_size)
+
+        return X, y
+
+    def build(self, start, force_fire=False):
+        """Single-sample equivalent of build_sample for the rows starting at `start`."""
+        X, y = self.build_batch([start], force_fire=force_fire)
+        return X[0], y[0]
+
+# --- 2c. Fire Index ---
+# make_generator needs to know which start indices have fire in their horizon.
+# FireIndex scans each VIIRS raster once, and can be persisted next to the
+# sequence CSV so later epochs and runs skip the scan entirely.
+
+class FireIndex:
+    """
+    Per-raster VIIRS lookup: whether each raster has any fire pixel (in any
+    band of a stack, which is what balances training), and where they are.
+    """
+
+    def __init__(self, paths, has_fire, pixels, signatures):
+        self.paths = list(paths)
+        self.has_fire = np.asarray(has_fire, dtype=bool)
+        # pixels rows are (path id, band, row, col), sorted by (path id, band)
+        self.pixels = np.asarray(pixels, dtype=np.int64).reshape(-1, 4)
+        self.signatures = np.asarray(signatures, dtype=np.int64).reshape(-1, 2)
+        self._path_ids = {p: i for i, p in enumerate(self.paths)}
+
+        self._pixel_slices = {}
+        if len(self.pixels):
+            keys = self.pixels[:, :2]
+            bounds = np.flatnonzero(np.any(keys[1:] != keys[:-1], axis=1)) + 1
+            starts = np.concatenate([[0], bounds])
+            ends = np.concatenate([bounds, [len(keys)]])
+            for s, e in zip(starts, ends):
+                self._pixel_slices[tuple(keys[s])] = slice(s, e)
+
+    @staticmethod
+    def _signature(path):
+        """(mtime_ns, size) of a raster, used to detect a stale persisted index."""
+        try:
+            st = os.stat(path)
+            return st.st_mtime_ns, st.st_size
+        except OSError:
+            return -1, -1
+
+    @classmethod
+    def build(cls, paths, cache=None):
+        """Scans each raster once, from the cache if given, otherwise from disk."""
+        paths = list(paths)
+        has_fire, pixels = [], []
+        for path_id, path in enumerate(paths):
+            arr = cache[path] if cache is not None else _load_single_raster(path)
+            stack = arr[None] if arr.ndim == 2 else arr
+            fire = np.argwhere(stack > 0)
+            has_fire.append(len(fire) > 0)
+            if len(fire):
+                pixels.append(np.column_stack([np.full(len(fire), path_id), fire]))
+        pixels = np.concatenate(pixels) if pixels else np.empty((0, 4), dtype=np.int64)
+        return cls(paths, has_fire, pixels, [cls._signature(p) for p in paths])
+
+    def save(self, path):
+        np.savez_compressed(
+            path,
+            paths=np.array(self.paths, dtype=str),
+            has_fire=self.has_fire,
+            pixels=self.pixels,
+            signatures=self.signatures,
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data["paths"].tolist(), data["has_fire"], data["pixels"], data["signatures"])
+
+    def is_current(self, paths):
+        """True if the index covers `paths` and none of them changed on disk since it was built."""
+        for path in paths:
+            i = self._path_ids.get(path)
+            if i is None or tuple(self.signatures[i]) != self._signature(path):
+                return False
+        return True
+
+    def fire_pixels(self, path, band):
+        """(row, col) of the fire pixels in one band of a raster (band 0 for 2D rasters)."""
+        s = self._pixel_slices.get((self._path_ids[path], band))
+        return self.pixels[s, 2:] if s is not None else np.empty((0, 2), dtype=np.int64)
+
+    def row_fire(self, viirs_files):
+        """Per index row: whether the row's VIIRS raster has any fire pixel, in any band."""
+        return self.has_fire[[self._path_ids[p] for p in viirs_files]]
+
+    def split_starts(self, df):
+        """
+        Start indices whose horizon window does / does not contain a fire raster,
+        from a rolling sum over the per-row flags instead of rescanning rasters.
+        """
+        return split_starts_by_fire(self.row_fire(df["viirs_file"]))
+
+def split_starts_by_fire(row_fire):
+    """
+    (fire, non-fire) start indices, given whether each index row's VIIRS
+    raster has any fire pixel. For a multi-band stack that is any band, not
+    just the row's target band, so a row counts as fire whenever its stack does.
+    """
+    n_valid = len(row_fire) - SEQ_LEN - HORIZONS + 1
+    if n_valid <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    window_fire = np.convolve(np.asarray(row_fire, dtype=np.int64), np.ones(HORIZONS, dtype=np.int64), mode="valid")
+    start_fire = window_fire[SEQ_LEN : SEQ_LEN + n_valid] > 0
+
+    starts = np.arange(n_valid)
+    return starts[start_fire], starts[~start_fire]
+
+def fire_index_path(csv_path):
+    return f"{os.path.splitext(csv_path)[0]}_fire_index.npz"
+
+def load_or_build_fire_index(csv_path, df, cache=None):
+    """Loads the fire index persisted next to the CSV, rebuilding it if it is missing or stale."""
+    paths = df["viirs_file"].dropna().unique()
+    index_path = fire_index_path(csv_path)
+    if os.path.exists(index_path):
+        fire_index = FireIndex.load(index_path)
+        if fire_index.is_current(paths):
+            print(f"Loaded fire index from {index_path}")
+            return fire_index
+        print(f"Fire index at {index_path} is stale; rebuilding.")
+
+    fire_index = FireIndex.build(paths, cache)
+    fire_index.save(index_path)
+    print(f"Built fire index for {len(paths)} VIIRS rasters and saved it to {index_path}")
+    return fire_index
+
+
 # --- 3. Generator and Dataset Functions ---
 
-def make_generator(df, cache, fire_ratio=0.5):
-    """Generator function for balanced sampling of fire and non-fire events."""
-    valid_start_indices = list(range(len(df) - SEQ_LEN - HORIZONS + 1))
-    fire_start_indices = []
-    non_fire_start_indices = []
-    
-    print("Scanning data for fire and non-fire events...")
-    for i in valid_start_indices:
-        horizon_rows = df.iloc[i + SEQ_LEN : i + SEQ_LEN + HORIZONS]
-        # This checks for fire in *any* horizon time step
-        has_fire = any(np.any(cache[row["viirs_file"]] > 0) for _, row in horizon_rows.iterrows())
-        
-        if has_fire:
-            fire_start_indices.append(i)
-        else:
-            non_fire_start_indices.append(i)
+def split_index(df, val_split=0.2, seed=42):
+    """Shuffles the sequence index and splits it into (train_df, val_df) as used for training."""
+    df = df.sample(frac=1, random_state=seed).reset_index(drop=True)
+    val_size = int(len(df) * val_split)
+    return df.iloc[val_size:].copy(), df.iloc[:val_size].copy()
+
+def balanced_non_fire_count(num_fire, num_non_fire, fire_ratio):
+    """How many non-fire samples an epoch uses so that fire samples make up `fire_ratio`."""
+    if num_fire == 0:
+        return min(num_non_fire, 1000)
+    # Calculate samples needed for the desired fire_ratio
+    return min(int((num_fire / fire_ratio) - num_fire), num_non_fire)
+
+def select_start_indices(df, cache, fire_ratio=0.5, fire_index=None):
+    """Picks one epoch's shuffled start indices: all fire windows plus a balanced non-fire subset."""
+    if fire_index is None:
+        print("Scanning data for fire and non-fire events...")
+        fire_index = FireIndex.build(df["viirs_file"].dropna().unique(), cache)
+
+    # This checks for fire in *any* horizon time step
+    fire_start_indices, non_fire_start_indices = fire_index.split_starts(df)
+    fire_start_indices = fire_start_indices.tolist()
+    non_fire_start_indices = non_fire_start_indices.tolist()
 
     num_fire_samples = len(fire_start_indices)
     
     if num_fire_samples == 0:
         print("Warning: No fire events found in the dataset.")
-        num_non_fire_samples_to_use = min(len(non_fire_start_indices), 1000) 
-    else:
-        # Calculate samples needed for the desired fire_ratio
-        num_non_fire_samples_to_use = int((num_fire_samples / fire_ratio) - num_fire_samples)
-        num_non_fire_samples_to_use = min(num_non_fire_samples_to_use, len(non_fire_start_indices))
+    num_non_fire_samples_to_use = balanced_non_fire_count(
+        num_fire_samples, len(non_fire_start_indices), fire_ratio
+    )
 
     fire_indices_to_use = fire_start_indices
 
@@ -175,6 +420,31 @@ def make_generator(df, cache, fire_ratio=0.5):
     indices_to_use = indices_to_use.astype(int)
     
     print(f"Generator initialized. Found {len(fire_indices_to_use)} fire samples and using {len(indices_to_use) - len(fire_indices_to_use)} non-fire samples.")
+    return indices_to_use
+
+def build_reference_batch(df, cache, start_indices):
+    """Stacks build_sample outputs for several start indices (the non-vectorized path)."""
+    samples = [
+        build_sample(df.iloc[i : i + SEQ_LEN], df.iloc[i + SEQ_LEN : i + SEQ_LEN + HORIZONS], cache)
+        for i in start_indices
+    ]
+    return np.stack([X for X, _ in samples]), np.stack([y for _, y in samples])
+
+def make_generator(df, cache, fire_ratio=0.5, sampler=None, build_chunk=64, fire_index=None):
+    """
+    Generator function for balanced sampling of fire and non-fire events, built
+    on a single thread. With a PatchSampler, samples are built `build_chunk`
+    start indices at a time; without one, the reference build_sample is used.
+    create_dataset uses the parallel pipeline instead.
+    """
+    indices_to_use = select_start_indices(df, cache, fire_ratio=fire_ratio, fire_index=fire_index)
+
+    if sampler is not None:
+        for start in range(0, len(indices_to_use), build_chunk):
+            X_batch, y_batch = sampler.build_batch(indices_to_use[start : start + build_chunk])
+            for X, y in zip(X_batch, y_batch):
+                yield X, y
+        return
 
     for i in indices_to_use:
         seq_rows = df.iloc[i : i + SEQ_LEN]
@@ -182,23 +452,46 @@ def make_generator(df, cache, fire_ratio=0.5):
         X, y = build_sample(seq_rows, horizon_rows, cache)
         yield X, y
 
-def create_dataset(df, cache, shuffle=True, fire_ratio=0.5, shuffle_buf=256):
-    """Creates a tf.data.Dataset from the generator."""
-    output_signature = (
-        tf.TensorSpec(shape=(SEQ_LEN, PATCH_SIZE, PATCH_SIZE, CHANNELS), dtype=tf.float32),
-        tf.TensorSpec(shape=(HORIZONS, PATCH_SIZE, PATCH_SIZE), dtype=tf.float32),
-    )
-    
-    ds = tf.data.Dataset.from_generator(
-        lambda: make_generator(df, cache, fire_ratio=fire_ratio),
-        output_signature=output_signature
+def create_dataset(df, cache, shuffle=True, fire_ratio=0.5, shuffle_buf=256, sampler=None,
+                   vectorized=True, fire_index=None, num_workers=tf.data.AUTOTUNE, build_chunk=64):
+    """
+    Creates a tf.data.Dataset of balanced (X, y) batches.
+
+    The dataset itself only yields start indices; chunks of `build_chunk` starts
+    are turned into samples by a parallel map with `num_workers` workers, so
+    sample construction is no longer tied to a single generator thread.
+
+    Pass a PatchSampler built over the full index to share its crop table between
+    splits; vectorized=False uses the reference build_sample instead. The fire
+    index is built once here (or passed in, see load_or_build_fire_index) rather
+    than on every epoch.
+    """
+    if fire_index is None:
+        fire_index = FireIndex.build(df["viirs_file"].dropna().unique(), cache)
+
+    if vectorized:
+        sampler = sampler.subset(df) if sampler is not None else PatchSampler(df, cache)
+        build_batch = lambda starts: sampler.build_batch(starts)
+    else:
+        build_batch = lambda starts: build_reference_batch(df, cache, starts)
+
+    # Start indices are re-selected (and re-shuffled) every epoch, as before
+    starts = tf.data.Dataset.from_generator(
+        lambda: iter(select_start_indices(df, cache, fire_ratio=fire_ratio, fire_index=fire_index)),
+        output_signature=tf.TensorSpec(shape=(), dtype=tf.int64),
     )
+
+    def build(start_chunk):
+        X, y = tf.numpy_function(build_batch, [start_chunk], (tf.float32, tf.float32), stateful=False)
+        X.set_shape((None, SEQ_LEN, PATCH_SIZE, PATCH_SIZE, CHANNELS))
+        y.set_shape((None, HORIZONS, PATCH_SIZE, PATCH_SIZE))
+        return X, y
+
+    ds = starts.batch(build_chunk).map(build, num_parallel_calls=num_workers, deterministic=False).unbatch()
     
     if shuffle:
         ds = ds.shuffle(shuffle_buf, reshuffle_each_iteration=True)
     
-    ds = ds.prefetch(tf.data.AUTOTUNE)
-    
     return ds.batch(BATCH_SIZE).prefetch(tf.data.AUTOTUNE)
 
 
@@ -220,34 +513,53 @@ def squeeze_output_shape(input_shape):
     # Input shape: (Batch, 3, 13, 13, 1) -> Output shape: (Batch, 3, 13, 13)
     return input_shape[:-1] 
 
+# Needed to load saved models that contain the Lambda layers above
+CUSTOM_OBJECTS = {
+    'slice_output_func': slice_output_func,
+    'slice_output_shape': slice_output_shape,
+    'squeeze_output_func': squeeze_output_func,
+    'squeeze_output_shape': squeeze_output_shape,
+}
+
 def build_conv_lstm_unet_model(
     seq_len=SEQ_LEN,
     patch_h=PATCH_H,
     patch_w=PATCH_W,
     channels=CHANNELS,
-    horizons=HORIZONS
+    horizons=HORIZONS,
+    tflite_compatible=False
 ):
+    # tflite_compatible swaps the (1, 2, 2) 3D pooling/upsampling for the equivalent
+    # per-timestep 2D layers, which TFLite supports as builtin ops. These layers
+    # have no weights, so both variants share the same weight list.
+    if tflite_compatible:
+        pool = lambda: layers.TimeDistributed(layers.MaxPooling2D(pool_size=(2, 2), padding='same'))
+        upsample = lambda: layers.TimeDistributed(layers.UpSampling2D(size=(2, 2)))
+    else:
+        pool = lambda: layers.MaxPooling3D(pool_size=(1, 2, 2), padding='same')
+        upsample = lambda: layers.UpSampling3D(size=(1, 2, 2))
+
     inp = layers.Input(shape=(seq_len, patch_h, patch_w, channels))
 
     # ENCODER 1
     enc1 = layers.ConvLSTM2D(filters=32, kernel_size=(3, 3), padding='same', return_sequences=True, activation='relu')(inp)
-    enc1_pool = layers.MaxPooling3D(pool_size=(1, 2, 2), padding='same')(enc1)
+    enc1_pool = pool()(enc1)
 
     # ENCODER 2
     enc2 = layers.ConvLSTM2D(filters=64, kernel_size=(3, 3), padding='same', return_sequences=True, activation='relu')(enc1_pool)
-    enc2_pool = layers.MaxPooling3D(pool_size=(1, 2, 2), padding='same')(enc2)
+    enc2_pool = pool()(enc2)
 
     # BOTTLENECK
     bottleneck = layers.ConvLSTM2D(filters=128, kernel_size=(3, 3), padding='same', return_sequences=True, activation='relu')(enc2_pool)
 
     # DECODER 1
-    dec1_up = layers.UpSampling3D(size=(1, 2, 2))(bottleneck)
+    dec1_up = upsample()(bottleneck)
     dec1_up = layers.Conv3D(filters=64, kernel_size=(3,3,3), padding='same', activation='relu')(dec1_up)
     dec1_up_cropped = layers.Cropping3D(cropping=((0, 0), (0, 1), (0, 1)))(dec1_up)
     dec1_concat = layers.Concatenate(axis=-1)([dec1_up_cropped, enc2])
 
     # DECODER 2
-    dec2_up = layers.UpSampling3D(size=(1, 2, 2))(dec1_concat)
+    dec2_up = upsample()(dec1_concat)
     dec2_up = layers.Conv3D(filters=32, kernel_size=(3,3,3), padding='same', activation='relu')(dec2_up)
     dec2_up_cropped = layers.Cropping3D(cropping=((0, 0), (0, 1), (0, 1)))(dec2_up)
     dec2_concat = layers.Concatenate(axis=-1)([dec2_up_cropped, enc1])
@@ -287,28 +599,41 @@ if __name__ == "__main__":
         print(f"ERROR: CSV file not found at {csv_path}. Please check the path.")
         exit()
 
-    df = df.sample(frac=1, random_state=42).reset_index(drop=True)
-
     TOTAL = len(df)
     VAL_SPLIT = 0.2
-    val_size = int(TOTAL * VAL_SPLIT)
-
-    val_df = df.iloc[:val_size].copy()
-    train_df = df.iloc[val_size:].copy()
+    train_df, val_df = split_index(df, val_split=VAL_SPLIT)
 
     print(f"Total samples: {TOTAL}")
     print(f"Train samples: {len(train_df)}")
     print(f"Validation samples: {len(val_df)}")
 
     raster_cols = REQUIRED_COLS
-    print("Loading rasters into memory...")
-    cache = load_rasters(df, raster_cols, max_workers=8)
-    print(f"Loaded {len(cache)} rasters into memory ✅")
+    # With a time cube next to the CSV (python time_cube.py build ...), patches are
+    # read from it directly; otherwise rasters are converted once into a
+    # memory-mapped store that later runs (and concurrent ones) map instead of
+    # re-reading every GeoTIFF
+    cube_path = f"{os.path.splitext(csv_path)[0]}_cube.h5"
+    if os.path.exists(cube_path):
+        from time_cube import CubeFireIndex, CubeSampler, TimeCube
+
+        print(f"Opening time cube at {cube_path}...")
+        cube = TimeCube(cube_path)
+        cache = None
+        fire_index = CubeFireIndex(cube)
+        sampler = CubeSampler(cube, df)
+        print(f"Opened a cube of {cube.shape[0]} time steps ✅")
+    else:
+        store_dir = f"{os.path.splitext(csv_path)[0]}_raster_store"
+        print(f"Opening raster store at {store_dir}...")
+        cache = load_rasters(df, raster_cols, max_workers=8, store_dir=store_dir)
+        print(f"Mapped {len(cache)} rasters ✅")
+        fire_index = load_or_build_fire_index(csv_path, df, cache)
+        sampler = PatchSampler(df, cache, fire_index=fire_index)
 
     # Create Datasets
     # fire_ratio=0.5 means 50% fire events, 50% non-fire events
-    train_dataset = create_dataset(train_df, cache, fire_ratio=0.5)
-    val_dataset = create_dataset(val_df, cache, fire_ratio=0.5)
+    train_dataset = create_dataset(train_df, cache, fire_ratio=0.5, sampler=sampler, fire_index=fire_index)
+    val_dataset = create_dataset(val_df, cache, fire_ratio=0.5, sampler=sampler, fire_index=fire_index)
     
     # --- Model Compilation ---
     model = build_conv_lstm_unet_model()
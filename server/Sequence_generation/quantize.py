@@ -0,0 +1,155 @@
+"""
+Post-training quantization of the ConvLSTM-UNet for CPU serving.
+
+    python quantize.py --model final_model.h5 --csv sequence_index_hourly_binary.csv \
+        --mode dynamic --output final_model_dynamic.tflite
+
+Writes the .tflite model plus a <output>.report.json comparing it with the float32
+model on the held-out split: AUC, binary accuracy, batch latency and model size.
+Serve it from api.py with SERVING_MODE=tflite QUANTIZED_MODEL_PATH=<output>.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+
+from engine import InferenceEngine, TFLiteEngine
+from main import (
+    BATCH_SIZE, CHANNELS, CUSTOM_OBJECTS, PATCH_H, PATCH_W, REQUIRED_COLS, SEQ_LEN,
+    build_conv_lstm_unet_model, create_dataset, load_rasters, split_index,
+)
+
+QUANTIZATION_MODES = ("dynamic", "float16")
+
+
+# --- 1. Export ---
+
+def to_tflite_compatible(model):
+    """Rebuilds the model with TFLite-builtin layers and copies the trained weights across."""
+    export_model = build_conv_lstm_unet_model(tflite_compatible=True)
+    export_model.set_weights(model.get_weights())
+    return export_model
+
+def convert(model, mode="dynamic", batch_size=BATCH_SIZE):
+    """
+    Converts a float32 model to a quantized TFLite flatbuffer.
+
+    'dynamic' stores weights as int8 and quantizes activations on the fly;
+    'float16' stores weights as float16. Neither needs a representative dataset.
+    The ConvLSTM loops need a static batch size, so the export has a fixed one.
+    """
+    if mode not in QUANTIZATION_MODES:
+        raise ValueError(f"Unknown quantization mode '{mode}'. Use one of {QUANTIZATION_MODES}.")
+
+    export_model = to_tflite_compatible(model)
+    with tempfile.TemporaryDirectory() as saved_model_dir:
+        export_model.export(
+            saved_model_dir,
+            input_signature=[tf.TensorSpec((batch_size, SEQ_LEN, PATCH_H, PATCH_W, CHANNELS), tf.float32)],
+            verbose=False,
+        )
+        converter = tf.lite.TFLiteConverter.from_saved_model(saved_model_dir)
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        if mode == "float16":
+            converter.target_spec.supported_types = [tf.float16]
+        return converter.convert()
+
+
+# --- 2. Evaluation ---
+
+def evaluate(predict_fn, batches):
+    """AUC and binary accuracy of predict_fn over a list of (X, y) batches."""
+    auc = tf.keras.metrics.AUC()
+    accuracy = tf.keras.metrics.BinaryAccuracy()
+    for X, y in batches:
+        y_pred = predict_fn(X)
+        auc.update_state(y, y_pred)
+        accuracy.update_state(y, y_pred)
+    return {"auc": float(auc.result()), "binary_accuracy": float(accuracy.result())}
+
+def time_batches(predict_fn, batches, repeats=3):
+    latencies = []
+    for _ in range(repeats):
+        for X, _ in batches:
+            start = time.perf_counter()
+            predict_fn(X)
+            latencies.append((time.perf_counter() - start) * 1000.0)
+    return {
+        "batch_ms_p50": float(np.percentile(latencies, 50)),
+        "batch_ms_p99": float(np.percentile(latencies, 99)),
+    }
+
+def output_drift(float_fn, quant_fn, batches):
+    """Largest and mean absolute difference between float and quantized outputs."""
+    diffs = [np.abs(float_fn(X) - quant_fn(X)) for X, _ in batches]
+    return {
+        "max_abs_diff": float(max(d.max() for d in diffs)),
+        "mean_abs_diff": float(np.mean([d.mean() for d in diffs])),
+    }
+
+def _take(dataset, n):
+    return [(X.numpy(), y.numpy()) for X, y in dataset.take(n)]
+
+
+# --- 3. Main Execution ---
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--model", required=True, help="Trained float32 .h5/.keras model")
+    parser.add_argument("--csv", required=True, help="Sequence index CSV used for training")
+    parser.add_argument("--mode", choices=QUANTIZATION_MODES, default="dynamic")
+    parser.add_argument("--output", help="Output .tflite path (default: <model>_<mode>.tflite)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Fixed batch size of the export")
+    parser.add_argument("--calib-batches", type=int, default=8, help="Training batches used to check output drift")
+    parser.add_argument("--eval-batches", type=int, default=32, help="Held-out batches used for AUC/accuracy")
+    args = parser.parse_args()
+
+    output = args.output or f"{os.path.splitext(args.model)[0]}_{args.mode}.tflite"
+    model = tf.keras.models.load_model(args.model, custom_objects=CUSTOM_OBJECTS, safe_mode=False)
+
+    # Same split as training in main.py, so the evaluation batches are held out
+    df = pd.read_csv(args.csv)
+    train_df, val_df = split_index(df)
+    cache = load_rasters(df, REQUIRED_COLS, max_workers=8)
+
+    calib_batches = _take(create_dataset(train_df, cache, shuffle=False), args.calib_batches)
+    eval_batches = _take(create_dataset(val_df, cache, shuffle=False), args.eval_batches)
+
+    print(f"Converting with '{args.mode}' quantization...")
+    with open(output, "wb") as f:
+        f.write(convert(model, args.mode, batch_size=args.batch_size))
+
+    float_engine = InferenceEngine(model, (SEQ_LEN, PATCH_H, PATCH_W, CHANNELS), buckets=(BATCH_SIZE,))
+    float_engine.warmup()
+    quant_engine = TFLiteEngine(output)
+    quant_engine.warmup()
+
+    float_metrics = evaluate(float_engine.predict, eval_batches)
+    quant_metrics = evaluate(quant_engine.predict, eval_batches)
+    float_latency = time_batches(float_engine.predict, eval_batches)
+    quant_latency = time_batches(quant_engine.predict, eval_batches)
+    float_bytes = sum(int(np.prod(w.shape)) * w.dtype.itemsize for w in model.get_weights())
+    quant_bytes = os.path.getsize(output)
+
+    report = {
+        "mode": args.mode,
+        "output": output,
+        "eval_batches": len(eval_batches),
+        "float32": {**float_metrics, **float_latency, "model_bytes": float_bytes},
+        "quantized": {**quant_metrics, **quant_latency, "model_bytes": quant_bytes},
+        "delta": {
+            "auc": quant_metrics["auc"] - float_metrics["auc"],
+            "binary_accuracy": quant_metrics["binary_accuracy"] - float_metrics["binary_accuracy"],
+            "batch_ms_p50": quant_latency["batch_ms_p50"] - float_latency["batch_ms_p50"],
+            "model_bytes_saved": float_bytes - quant_bytes,
+        },
+        "calibration_drift": output_drift(float_engine.predict, quant_engine.predict, calib_batches),
+    }
+    with open(f"{output}.report.json", "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
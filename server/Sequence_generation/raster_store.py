@@ -0,0 +1,125 @@
+import json
+import os
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+ALIGNMENT = 64  # Byte alignment of every array in the data file
+
+
+class RasterStore(Mapping):
+    """
+    Read-only mapping from raster path to a zero-copy NumPy view, backed by one
+    contiguous memory-mapped data file plus a JSON index of path -> offset,
+    shape and dtype. It is a drop-in replacement for the dict that
+    load_rasters() used to build: views have the same shape as the rasters
+    _load_single_raster returns, but pages are only read when touched, and
+    several training processes mapping the same store share the OS page cache.
+
+    Rasters are converted once and appended to the data file. A source whose
+    mtime or size changed is re-appended, and its old bytes are left unused.
+    Only one process should add rasters to a store at a time.
+    """
+
+    DATA_FILE = "rasters.bin"
+    INDEX_FILE = "index.json"
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        self.data_path = os.path.join(store_dir, self.DATA_FILE)
+        self.index_path = os.path.join(store_dir, self.INDEX_FILE)
+        self._index = {}
+        self._data = None
+        self._open()
+
+    def _open(self):
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                self._index = json.load(f)
+        if os.path.exists(self.data_path) and os.path.getsize(self.data_path) > 0:
+            self._data = np.memmap(self.data_path, dtype=np.uint8, mode="r")
+        else:
+            self._data = None
+
+    @staticmethod
+    def _signature(path):
+        """(mtime_ns, size) of a source raster, used to detect changed files."""
+        try:
+            st = os.stat(path)
+            return [st.st_mtime_ns, st.st_size]
+        except OSError:
+            return None
+
+    # --- Mapping interface ---
+
+    def __getitem__(self, path):
+        entry = self._index[path]
+        return np.ndarray(
+            tuple(entry["shape"]), dtype=np.dtype(entry["dtype"]), buffer=self._data, offset=entry["offset"]
+        )
+
+    def __contains__(self, path):
+        return path in self._index
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._index)
+
+    # --- Conversion ---
+
+    def missing(self, paths):
+        """Paths that are not in the store yet, or whose source changed since conversion."""
+        return [
+            p for p in paths
+            if p not in self._index or self._index[p]["signature"] != self._signature(p)
+        ]
+
+    def add(self, paths, loader, max_workers=8):
+        """
+        Converts the given rasters into the store with `loader(path) -> array`,
+        reading in parallel but holding at most `max_workers` arrays at once.
+        Returns the number of rasters converted.
+        """
+        todo = self.missing(paths)
+        if not todo:
+            return 0
+
+        os.makedirs(self.store_dir, exist_ok=True)
+        with open(self.data_path, "ab") as f, ThreadPoolExecutor(max_workers=max_workers) as ex:
+            offset = f.tell()
+            for start in range(0, len(todo), max_workers):
+                chunk = todo[start:start + max_workers]
+                for path, arr in zip(chunk, ex.map(loader, chunk)):
+                    arr = np.ascontiguousarray(arr)
+                    padding = (-offset) % ALIGNMENT
+                    f.write(b"\0" * padding)
+                    offset += padding
+                    f.write(arr.tobytes())
+                    self._index[path] = {
+                        "offset": offset,
+                        "shape": list(arr.shape),
+                        "dtype": arr.dtype.str,
+                        "signature": self._signature(path),
+                    }
+                    offset += arr.nbytes
+
+        # Write the index atomically so readers never see a partial file
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._index, f)
+        os.replace(tmp_path, self.index_path)
+
+        self._open()
+        return len(todo)
+
+    @classmethod
+    def open_or_build(cls, store_dir, paths, loader, max_workers=8):
+        """Opens the store, converting any of `paths` that are missing or stale first."""
+        store = cls(store_dir)
+        converted = store.add(list(paths), loader, max_workers=max_workers)
+        if converted:
+            print(f"Converted {converted} rasters into the store at {store_dir}")
+        return store
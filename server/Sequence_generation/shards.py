@@ -0,0 +1,229 @@
+"""
+Pre-materialized training samples as sharded, GZIP-compressed TFRecords.
+
+    # Offline: run the sequence/horizon windowing once and write shards
+    python shards.py materialize --csv sequence_index_hourly_binary.csv --out shards/
+
+    # Check how fast the shards can be read back
+    python shards.py read --manifest shards/manifest.json --split train --batches 200
+
+In training, replace create_dataset(train_df, ...) with
+load_shard_dataset("shards/manifest.json", "train").
+
+Fire and non-fire samples are written to separate shard sets. Every epoch the
+reader takes all fire samples plus a fresh uniformly random subset of non-fire
+samples, sized with the same fire_ratio rule as make_generator.
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+
+from main import (
+    BATCH_SIZE, CHANNELS, HORIZONS, PATCH_SIZE, REQUIRED_COLS, SEQ_LEN,
+    PatchSampler, balanced_non_fire_count, load_or_build_fire_index, load_rasters, split_index,
+)
+
+X_SHAPE = (SEQ_LEN, PATCH_SIZE, PATCH_SIZE, CHANNELS)
+Y_SHAPE = (HORIZONS, PATCH_SIZE, PATCH_SIZE)
+COMPRESSION = "GZIP"
+MANIFEST_NAME = "manifest.json"
+
+
+# --- 1. Materialize ---
+
+def _example(X, y, start):
+    feature = {
+        "X": tf.train.Feature(bytes_list=tf.train.BytesList(value=[X.tobytes()])),
+        "y": tf.train.Feature(bytes_list=tf.train.BytesList(value=[y.tobytes()])),
+        "start": tf.train.Feature(int64_list=tf.train.Int64List(value=[int(start)])),
+    }
+    return tf.train.Example(features=tf.train.Features(feature=feature)).SerializeToString()
+
+def write_shards(sampler, starts, out_dir, prefix, shard_size=1024, build_chunk=64):
+    """Writes the samples for `starts` into fixed-size shards; returns their manifest entries."""
+    shards = []
+    for shard_id, offset in enumerate(range(0, len(starts), shard_size)):
+        shard_starts = starts[offset:offset + shard_size]
+        name = f"{prefix}-{shard_id:05d}.tfrecord.gz"
+        path = os.path.join(out_dir, name)
+        with tf.io.TFRecordWriter(path, options=COMPRESSION) as writer:
+            for chunk in range(0, len(shard_starts), build_chunk):
+                chunk_starts = shard_starts[chunk:chunk + build_chunk]
+                X_batch, y_batch = sampler.build_batch(chunk_starts)
+                for X, y, start in zip(X_batch, y_batch, chunk_starts):
+                    writer.write(_example(X, y, start))
+        shards.append({"file": name, "count": len(shard_starts), "bytes": os.path.getsize(path)})
+        print(f"Wrote {path} ({len(shard_starts)} samples)")
+    return shards
+
+def materialize(csv_path, out_dir, shard_size=1024, max_non_fire=None, seed=42):
+    """Windows the sequence index once and writes train/val shards plus a manifest."""
+    os.makedirs(out_dir, exist_ok=True)
+    df = pd.read_csv(csv_path)
+    train_df, val_df = split_index(df)
+
+    store_dir = f"{os.path.splitext(csv_path)[0]}_raster_store"
+    cache = load_rasters(df, REQUIRED_COLS, max_workers=8, store_dir=store_dir)
+    fire_index = load_or_build_fire_index(csv_path, df, cache)
+    sampler = PatchSampler(df, cache, fire_index=fire_index)
+    rng = np.random.default_rng(seed)
+
+    manifest = {
+        "csv": os.path.abspath(csv_path),
+        "x_shape": list(X_SHAPE),
+        "y_shape": list(Y_SHAPE),
+        "compression": COMPRESSION,
+        "shard_size": shard_size,
+        "splits": {},
+    }
+    for split, split_df in (("train", train_df), ("val", val_df)):
+        fire_starts, non_fire_starts = fire_index.split_starts(split_df)
+        # Non-fire windows can vastly outnumber fire ones; optionally keep a random pool
+        if max_non_fire is not None and len(non_fire_starts) > max_non_fire:
+            non_fire_starts = np.sort(rng.choice(non_fire_starts, size=max_non_fire, replace=False))
+        split_sampler = sampler.subset(split_df)
+        manifest["splits"][split] = {
+            "fire": write_shards(split_sampler, fire_starts, out_dir, f"{split}-fire", shard_size),
+            "non_fire": write_shards(split_sampler, non_fire_starts, out_dir, f"{split}-nonfire", shard_size),
+        }
+
+    manifest_path = os.path.join(out_dir, MANIFEST_NAME)
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    print(f"Manifest written to {manifest_path}")
+    return manifest_path
+
+
+# --- 2. Read ---
+
+def _parse(record):
+    features = tf.io.parse_single_example(record, {
+        "X": tf.io.FixedLenFeature([], tf.string),
+        "y": tf.io.FixedLenFeature([], tf.string),
+    })
+    X = tf.reshape(tf.io.decode_raw(features["X"], tf.float32), X_SHAPE)
+    y = tf.reshape(tf.io.decode_raw(features["y"], tf.float32), Y_SHAPE)
+    return X, y
+
+def _interleave(files, shuffle, seed, cycle_length):
+    """Reads shard files in parallel; with shuffle, the file order changes (deterministically) each epoch."""
+    ds = tf.data.Dataset.from_tensor_slices(files)
+    if shuffle:
+        ds = ds.shuffle(len(files), seed=seed, reshuffle_each_iteration=True)
+    return ds.interleave(
+        lambda f: tf.data.TFRecordDataset(f, compression_type=COMPRESSION),
+        cycle_length=cycle_length,
+        num_parallel_calls=tf.data.AUTOTUNE,
+        deterministic=True,
+    )
+
+def _uniform_subset(ds, k, n, seed, rerandomize=True):
+    """
+    Exactly k of the n records of ds, every k-subset equally likely (selection
+    sampling: keep a record with probability still-needed / still-unseen). The
+    subset does not depend on the order ds yields records in, and reading stops
+    once the k-th record is kept.
+    """
+    coins = tf.data.Dataset.random(seed=seed, rerandomize_each_iteration=rerandomize)
+
+    def select(state, element):
+        needed, unseen = state
+        record, coin = element
+        u = tf.cast(coin % (1 << 30), tf.float64) / float(1 << 30)
+        keep = u * tf.cast(unseen, tf.float64) < tf.cast(needed, tf.float64)
+        return (needed - tf.cast(keep, tf.int64), unseen - 1), (record, keep)
+
+    selected = tf.data.Dataset.zip((ds, coins)).scan((tf.constant(k, tf.int64), tf.constant(n, tf.int64)), select)
+    selected = selected.filter(lambda record, keep: keep)
+    return selected.map(lambda record, keep: record).take(k)
+
+def load_shard_dataset(manifest_path, split="train", fire_ratio=0.5, shuffle=True,
+                       shuffle_buf=256, seed=42, cycle_length=4):
+    """
+    Batched (X, y) dataset over materialized shards, equivalent to create_dataset.
+    Every epoch: all fire samples plus balanced_non_fire_count non-fire ones.
+    With a fixed seed the sample order is reproducible across runs.
+    """
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    shard_dir = os.path.dirname(os.path.abspath(manifest_path))
+    entry = manifest["splits"][split]
+
+    fire_files = [os.path.join(shard_dir, s["file"]) for s in entry["fire"]]
+    non_fire_files = [os.path.join(shard_dir, s["file"]) for s in entry["non_fire"]]
+    num_fire = sum(s["count"] for s in entry["fire"])
+    num_non_fire = balanced_non_fire_count(num_fire, sum(s["count"] for s in entry["non_fire"]), fire_ratio)
+
+    parts, weights = [], []
+    if num_fire:
+        parts.append(_interleave(fire_files, shuffle, seed, cycle_length))
+        weights.append(num_fire)
+    if num_non_fire:
+        non_fire = _interleave(non_fire_files, shuffle, seed + 1, cycle_length)
+        total_non_fire = sum(s["count"] for s in entry["non_fire"])
+        parts.append(_uniform_subset(non_fire, num_non_fire, total_non_fire, seed + 2, rerandomize=shuffle))
+        weights.append(num_non_fire)
+    if not parts:
+        raise ValueError(f"Split '{split}' in {manifest_path} has no samples.")
+
+    total = float(sum(weights))
+    ds = tf.data.Dataset.sample_from_datasets(
+        parts, weights=[w / total for w in weights], seed=seed, stop_on_empty_dataset=False
+    ) if len(parts) > 1 else parts[0]
+
+    ds = ds.map(_parse, num_parallel_calls=tf.data.AUTOTUNE, deterministic=True)
+    if shuffle:
+        ds = ds.shuffle(shuffle_buf, seed=seed + 3, reshuffle_each_iteration=True)
+    return ds.batch(BATCH_SIZE).prefetch(tf.data.AUTOTUNE)
+
+def measure_throughput(ds, max_batches=None):
+    """Iterates a batched dataset and reports samples/s (first batch excluded as warmup)."""
+    samples, start = 0, None
+    for i, (X, _) in enumerate(ds):
+        if max_batches is not None and i >= max_batches:
+            break
+        if start is None:
+            start = time.perf_counter()
+            continue
+        samples += int(X.shape[0])
+    elapsed = time.perf_counter() - start if start is not None else 0.0
+    return {
+        "samples": samples,
+        "seconds": elapsed,
+        "samples_per_s": samples / elapsed if elapsed > 0 else 0.0,
+        "mb_per_s": samples * (np.prod(X_SHAPE) + np.prod(Y_SHAPE)) * 4 / 1e6 / elapsed if elapsed > 0 else 0.0,
+    }
+
+
+# --- 3. Main Execution ---
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("materialize", help="Write train/val shards and a manifest")
+    p.add_argument("--csv", required=True, help="Sequence index CSV")
+    p.add_argument("--out", required=True, help="Output directory for shards and manifest.json")
+    p.add_argument("--shard-size", type=int, default=1024, help="Samples per shard")
+    p.add_argument("--max-non-fire", type=int, help="Cap on non-fire samples written per split")
+    p.add_argument("--seed", type=int, default=42)
+
+    p = sub.add_parser("read", help="Report shard-read throughput")
+    p.add_argument("--manifest", required=True)
+    p.add_argument("--split", default="train")
+    p.add_argument("--batches", type=int, help="Stop after this many batches (default: one epoch)")
+    p.add_argument("--fire-ratio", type=float, default=0.5)
+
+    args = parser.parse_args()
+    if args.command == "materialize":
+        materialize(args.csv, args.out, shard_size=args.shard_size, max_non_fire=args.max_non_fire, seed=args.seed)
+    else:
+        ds = load_shard_dataset(args.manifest, args.split, fire_ratio=args.fire_ratio)
+        stats = measure_throughput(ds, args.batches)
+        print(f"Read {stats['samples']} samples in {stats['seconds']:.2f} s: "
+              f"{stats['samples_per_s']:.0f} samples/s ({stats['mb_per_s']:.1f} MB/s decoded)")
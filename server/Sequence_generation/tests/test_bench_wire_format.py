@@ -0,0 +1,19 @@
+import api
+import bench_wire_format
+from wire_format import RAW, available_formats
+
+
+def test_benchmark_serves_every_format(monkeypatch):
+    # A fresh engine and batcher, as the benchmark builds them at startup
+    for name in ("MODEL", "ENGINE", "BATCHER"):
+        monkeypatch.setattr(api, name, None)
+    monkeypatch.setattr(api, "SERVING_MODE", "keras")
+    monkeypatch.setattr(api, "INFERENCE_BUCKETS", [1])
+    bench_wire_format._ensure_model()
+    assert api.ENGINE.ready
+
+    client = api.app.test_client()
+    for media_type in available_formats():
+        result = bench_wire_format.bench_format(client, media_type, "float32", 1)
+        assert result["response_bytes"] > 0
+    assert RAW in available_formats()
@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+import rasterio
+from rasterio.transform import from_origin
+
+from main import INPUT_COLS, FireIndex
+from time_cube import CubeFireIndex, TimeCube, build_cube
+
+
+def _write(path, bands):
+    bands = np.asarray(bands, dtype=np.float32)
+    with rasterio.open(path, "w", driver="GTiff", height=bands.shape[1], width=bands.shape[2], count=len(bands),
+                       dtype="float32", crs="EPSG:4326", transform=from_origin(70, 20, 0.1, 0.1)) as dst:
+        dst.write(bands)
+    return str(path)
+
+
+def test_cube_balances_fire_like_fire_index(tmp_path):
+    inputs = {col: _write(tmp_path / f"{col}.tif", np.ones((1, 16, 16))) for col in INPUT_COLS}
+    # The first stack has fire only in its last band, which no row uses as its target
+    with_fire = np.zeros((12, 16, 16))
+    with_fire[11, 3, 4] = 1
+    stacks = [_write(tmp_path / "viirs_a.tif", with_fire), _write(tmp_path / "viirs_b.tif", np.zeros((12, 16, 16)))]
+    df = pd.DataFrame([
+        {**inputs, "center_time": f"2020-01-01 {i:02d}:00:00", "viirs_file": stacks[i // 10],
+         "seq_band_idxs": "[1]", "target_band_idxs": f"[{i % 10 + 1}]"}
+        for i in range(20)
+    ])
+    csv_path = tmp_path / "index.csv"
+    df.to_csv(csv_path, index=False)
+    build_cube(str(csv_path), str(tmp_path / "index_cube.h5"))
+
+    cube = TimeCube(str(tmp_path / "index_cube.h5"))
+    try:
+        assert len(cube.fire_pixels(0)) == 0  # Target bands really are fire-free
+        cube_fire, cube_none = CubeFireIndex(cube).split_starts(df)
+    finally:
+        cube.close()
+    fire, none = FireIndex.build(stacks).split_starts(df)
+    assert len(fire) > 0
+    np.testing.assert_array_equal(cube_fire, fire)
+    np.testing.assert_array_equal(cube_none, none)
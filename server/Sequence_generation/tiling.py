@@ -0,0 +1,195 @@
+import os
+
+import numpy as np
+
+
+# --- 1. Region Sources ---
+# A region source exposes .shape == (SEQ_LEN, H, W, CHANNELS) and read_rows(r0, r1),
+# which returns the (SEQ_LEN, r1 - r0, W, CHANNELS) float32 slab for those rows.
+# The tiler only ever asks for one patch-high strip at a time.
+
+class ArrayRegion:
+    """Region stack that is already in memory as a (SEQ_LEN, H, W, CHANNELS) array."""
+
+    def __init__(self, array):
+        self.array = np.asarray(array, dtype=np.float32)
+        if self.array.ndim != 4:
+            raise ValueError(f"Region stack must be 4D (Time, H, W, C), got shape {self.array.shape}.")
+        self.shape = self.array.shape
+
+    def read_rows(self, r0, r1):
+        return self.array[:, r0:r1]
+
+    def close(self):
+        pass
+
+
+class RasterRegion:
+    """
+    Region stack backed by raster files on disk. `paths` is a SEQ_LEN x CHANNELS
+    grid whose entries are either a path (band 1) or a [path, band] pair, in the
+    channel order used for training (t2m, d2m, tp, u10, v10, dem, lulc).
+    Rows are read with windowed reads, so the full rasters are never loaded.
+    """
+
+    def __init__(self, paths, root=None):
+        import rasterio  # Only needed when serving from rasters on disk
+
+        self._datasets = {}
+        self._sources = []
+        try:
+            for step in paths:
+                step_sources = []
+                for entry in step:
+                    path, band = (entry, 1) if isinstance(entry, str) else (entry[0], int(entry[1]))
+                    path = _resolve_path(path, root)
+                    if path not in self._datasets:
+                        self._datasets[path] = rasterio.open(path)
+                    step_sources.append((self._datasets[path], band))
+                self._sources.append(step_sources)
+
+            shapes = {(src.height, src.width) for step in self._sources for src, _ in step}
+            if len(shapes) != 1:
+                raise ValueError(f"All region rasters must share one grid, got shapes {sorted(shapes)}.")
+            channel_counts = {len(step) for step in self._sources}
+            if len(channel_counts) != 1:
+                raise ValueError("Every timestep must reference the same number of channels.")
+        except Exception:
+            self.close()
+            raise
+
+        h, w = shapes.pop()
+        self.shape = (len(self._sources), h, w, channel_counts.pop())
+
+    def read_rows(self, r0, r1):
+        from rasterio.windows import Window
+
+        window = Window(0, r0, self.shape[2], r1 - r0)
+        slab = np.empty((self.shape[0], r1 - r0, self.shape[2], self.shape[3]), dtype=np.float32)
+        for t, step in enumerate(self._sources):
+            for ch, (src, band) in enumerate(step):
+                slab[t, :, :, ch] = src.read(band, window=window)
+        return slab
+
+    def close(self):
+        for src in self._datasets.values():
+            src.close()
+        self._datasets = {}
+
+
+class CubeRegion:
+    """
+    Region stack read from a time cube (see time_cube.py): the `seq_len` time
+    steps starting at `start`, which is a cube time index or a center_time.
+    Only the requested rows are decompressed.
+    """
+
+    def __init__(self, path, start, seq_len, root=None):
+        from time_cube import TimeCube  # Only needed when serving from a cube
+
+        self.cube = TimeCube(_resolve_path(path, root))
+        try:
+            t0 = int(start) if isinstance(start, int) else int(self.cube.times_for([start])[0])
+            n, h, w = self.cube.shape
+            if not 0 <= t0 <= n - seq_len:
+                raise ValueError(f"A {seq_len}-step sequence starting at {t0} does not fit the cube's {n} steps.")
+        except Exception:
+            self.cube.close()
+            raise
+        self._times = np.arange(t0, t0 + seq_len)
+        self.shape = (seq_len, h, w, self.cube.dynamic.shape[3] + self.cube.static_layer.shape[1])
+
+    def read_rows(self, r0, r1):
+        return self.cube.read_inputs(self._times, r0, r1, 0, self.shape[2])
+
+    def close(self):
+        self.cube.close()
+
+
+def _resolve_path(path, root):
+    """Keeps raster references inside the configured root directory, if one is set."""
+    if root is None:
+        return path
+    root = os.path.realpath(root)
+    full = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, full]) != root:
+        raise ValueError(f"Raster path '{path}' is outside the allowed raster root.")
+    return full
+
+
+# --- 2. Tiling and Blending ---
+
+def tile_origins(size, patch, stride):
+    """Top/left offsets of the sliding window along one axis, always covering the last pixel."""
+    origins = list(range(0, size - patch + 1, stride))
+    if origins[-1] != size - patch:
+        origins.append(size - patch)
+    return origins
+
+def blend_weights(patch_h, patch_w, blend="tent"):
+    """Per-pixel weights used when averaging overlapping tile outputs."""
+    if blend == "mean":
+        return np.ones((patch_h, patch_w), dtype=np.float32)
+    if blend == "tent":
+        # Linear ramp towards the tile centre, so seams are dominated by the
+        # tile that sees the pixel with the most spatial context
+        ramp_h = np.minimum(np.arange(1, patch_h + 1), np.arange(patch_h, 0, -1))
+        ramp_w = np.minimum(np.arange(1, patch_w + 1), np.arange(patch_w, 0, -1))
+        return np.outer(ramp_h, ramp_w).astype(np.float32)
+    raise ValueError(f"Unknown blend mode '{blend}'. Use 'tent' or 'mean'.")
+
+def _read_strip(region, r0, patch_h, padded_w):
+    """Reads rows [r0, r0 + patch_h) as a zero-padded (SEQ_LEN, patch_h, padded_w, C) strip."""
+    seq_len, h, w, channels = region.shape
+    r1 = min(r0 + patch_h, h)
+    rows = region.read_rows(r0, r1)
+    if rows.shape[1] == patch_h and w == padded_w:
+        return rows
+    strip = np.zeros((seq_len, patch_h, padded_w, channels), dtype=np.float32)
+    strip[:, : r1 - r0, :w] = rows
+    return strip
+
+def predict_region(region, predict_fn, horizons, patch_h, patch_w,
+                   stride=None, batch_size=64, blend="tent"):
+    """
+    Tiles a (SEQ_LEN, H, W, C) region into overlapping patches, runs them through
+    `predict_fn` in batches and blends the outputs into a (horizons, H, W) raster.
+
+    Only one strip of input rows and one batch of tiles is held at a time; the
+    output accumulators are the only allocations that scale with the region.
+    Regions smaller than a patch are zero-padded, matching _extract_patch.
+    """
+    seq_len, h, w, channels = region.shape
+    stride = stride or max(patch_h // 2, 1)
+    if stride < 1:
+        raise ValueError("stride must be a positive integer.")
+
+    padded_h, padded_w = max(h, patch_h), max(w, patch_w)
+    row_origins = tile_origins(padded_h, patch_h, stride)
+    col_origins = tile_origins(padded_w, patch_w, stride)
+    weights = blend_weights(patch_h, patch_w, blend)
+
+    acc = np.zeros((horizons, padded_h, padded_w), dtype=np.float32)
+    norm = np.zeros((padded_h, padded_w), dtype=np.float32)
+    batch_x, batch_pos = [], []
+
+    def flush():
+        preds = np.asarray(predict_fn(np.stack(batch_x, axis=0)), dtype=np.float32)
+        for (r, c), pred in zip(batch_pos, preds):
+            acc[:, r:r + patch_h, c:c + patch_w] += pred * weights
+            norm[r:r + patch_h, c:c + patch_w] += weights
+        batch_x.clear()
+        batch_pos.clear()
+
+    for r in row_origins:
+        strip = _read_strip(region, r, patch_h, padded_w)
+        for c in col_origins:
+            batch_x.append(strip[:, :, c:c + patch_w])
+            batch_pos.append((r, c))
+            if len(batch_x) == batch_size:
+                flush()
+    if batch_x:
+        flush()
+
+    acc /= norm
+    return acc[:, :h, :w]
@@ -0,0 +1,340 @@
+"""
+Chunked HDF5 time cube: the whole sequence index in one file instead of one GeoTIFF per variable per hour.
+
+    # Offline: convert the rasters a sequence index references into one cube
+    python time_cube.py build --csv sequence_index_hourly_binary.csv --out sequence_index_hourly_binary_cube.h5
+
+    # Check a few samples against PatchSampler over the source rasters
+    python time_cube.py verify --csv sequence_index_hourly_binary.csv --cube sequence_index_hourly_binary_cube.h5
+
+Each index row is one time step. Layout:
+    dynamic       (time, y, x, 5)  ERA5 t2m, d2m, tp, u10, v10
+    target        (time, y, x)     the row's VIIRS target band
+    static        (layer, y, x)    each distinct DEM/LULC raster, stored once
+    static_layer  (time, 2)        the DEM and LULC layer of every row
+    fire_offsets / fire_pixels     (row, col) of every target fire pixel, per time step
+    stack_fire    (time,)          whether the row's VIIRS raster has fire in any band,
+                                   the rule FireIndex balances training by
+Values are taken exactly as build_sample takes them, so samples match
+PatchSampler's. Chunks span a few time steps and a small spatial tile, so a
+13x13 patch of a 6-step sequence decompresses only a handful of chunks, and
+nothing is read until a patch is asked for.
+
+In training, pass CubeSampler(TimeCube(path), df) as the sampler and
+CubeFireIndex(cube) as the fire index; for inference, see tiling.CubeRegion.
+"""
+import argparse
+import ast
+import copy
+import json
+import os
+import time
+from collections import OrderedDict
+
+import h5py
+import numpy as np
+import pandas as pd
+import rasterio
+
+from main import (
+    HORIZONS, INPUT_COLS, PATCH_SIZE, SEQ_LEN, FireIndex, PatchSampler, _safe_center, load_rasters,
+    split_starts_by_fire,
+)
+
+DYNAMIC_COLS = INPUT_COLS[:5]
+STATIC_COLS = ["dem_file", "lulc_file"]
+assert DYNAMIC_COLS + STATIC_COLS == INPUT_COLS
+
+# A sample reads SEQ_LEN + HORIZONS consecutive steps, so it spans at most two time chunks
+TIME_CHUNK = SEQ_LEN + HORIZONS
+# Spatial chunk edge; a 13x13 window touches at most four tiles
+TILE = 32
+# HDF5 chunk cache per open cube; training reads keep hitting the same tiles
+CHUNK_CACHE_BYTES = 64 * 1024 * 1024
+
+
+# --- 1. Conversion ---
+
+class _FrameReader:
+    """2D float32 bands of the source rasters, with the last few kept for rows that share a stack."""
+
+    def __init__(self, keep=32):
+        self._datasets = {}
+        self._frames = OrderedDict()
+        self._keep = keep
+        self.shape = None
+
+    def read(self, path, band):
+        # Single-band rasters ignore the band, as PatchSampler._band does
+        src = self._datasets.get(path)
+        if src is None:
+            src = self._datasets[path] = rasterio.open(path)
+        key = (path, 0 if src.count == 1 else band)
+        if key in self._frames:
+            self._frames.move_to_end(key)
+            return self._frames[key]
+        frame = src.read(key[1] + 1).astype(np.float32)
+        if self.shape is None:
+            self.shape = frame.shape
+        elif frame.shape != self.shape:
+            raise ValueError(
+                f"{path} is {frame.shape[0]}x{frame.shape[1]}, other rasters are {self.shape[0]}x{self.shape[1]}; "
+                "align them to one grid first (Data_preprocessing/Alignment/align.py)."
+            )
+        self._frames[key] = frame
+        if len(self._frames) > self._keep:
+            self._frames.popitem(last=False)
+        return frame
+
+    def close(self):
+        for src in self._datasets.values():
+            src.close()
+
+
+def build_cube(csv_path, out_path, time_chunk=TIME_CHUNK, tile=TILE, compression="lzf"):
+    """Converts every raster the index references into one chunked cube at out_path."""
+    df = pd.read_csv(csv_path)
+    if df["center_time"].duplicated().any():
+        raise ValueError(f"{csv_path} has repeated center_time values; cube rows are looked up by center_time.")
+    n = len(df)
+    frames = _FrameReader()
+    start = time.perf_counter()
+    partial = f"{out_path}.partial"
+    try:
+        height, width = frames.read(df[STATIC_COLS[0]].iloc[0], 0).shape
+        layers = {}
+        static_layer = np.array(
+            [[layers.setdefault(path, len(layers)) for path in row] for row in df[STATIC_COLS].itertuples(index=False)],
+            dtype=np.int32,
+        )
+        tc, th, tw = min(time_chunk, n), min(tile, height), min(tile, width)
+
+        with h5py.File(partial, "w") as f:
+            options = {"compression": compression, "shuffle": compression is not None}
+            dynamic = f.create_dataset(
+                "dynamic", (n, height, width, len(DYNAMIC_COLS)), np.float32,
+                chunks=(tc, th, tw, len(DYNAMIC_COLS)), **options,
+            )
+            target = f.create_dataset("target", (n, height, width), np.float32, chunks=(tc, th, tw), **options)
+            static = f.create_dataset("static", (len(layers), height, width), np.float32, chunks=(1, th, tw), **options)
+            for path, layer in layers.items():
+                static[layer] = frames.read(path, 0)
+            f["static_layer"] = static_layer
+            f["center_time"] = df["center_time"].astype(str).to_numpy().astype("S")
+
+            # Whole time chunks are written at once, so every chunk is compressed exactly once
+            fire_pixels, fire_counts = [], []
+            target_bands = [ast.literal_eval(v)[0] - 1 for v in df["target_band_idxs"]]
+            for t0 in range(0, n, tc):
+                rows = df.iloc[t0 : t0 + tc]
+                dyn = np.empty((len(rows), height, width, len(DYNAMIC_COLS)), dtype=np.float32)
+                tgt = np.empty((len(rows), height, width), dtype=np.float32)
+                for i, row in enumerate(rows.itertuples(index=False)):
+                    for ch, col in enumerate(DYNAMIC_COLS):
+                        dyn[i, :, :, ch] = frames.read(getattr(row, col), 0)
+                    tgt[i] = frames.read(row.viirs_file, target_bands[t0 + i])
+                    fire = np.argwhere(tgt[i] > 0)
+                    fire_pixels.append(fire)
+                    fire_counts.append(len(fire))
+                dynamic[t0 : t0 + len(rows)] = dyn
+                target[t0 : t0 + len(rows)] = tgt
+                done = t0 + len(rows)
+                print(f"Wrote {done:,}/{n:,} time steps ({done / (time.perf_counter() - start):,.0f} steps/s)")
+
+            f["fire_offsets"] = np.concatenate([[0], np.cumsum(fire_counts)]).astype(np.int64)
+            f["fire_pixels"] = np.concatenate(fire_pixels).astype(np.int32) if fire_pixels else np.empty((0, 2), np.int32)
+            # Balanced by the same rule as training without a cube, not by the target band alone
+            f["stack_fire"] = FireIndex.build(df["viirs_file"].unique()).row_fire(df["viirs_file"])
+            f.attrs["channels"] = json.dumps(INPUT_COLS)
+            f.attrs["source_csv"] = os.path.abspath(csv_path)
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    finally:
+        frames.close()
+    os.replace(partial, out_path)
+    print(f"Built {out_path}: {n} steps of {height}x{width}, {len(layers)} static layers, "
+          f"{os.path.getsize(out_path) / 1e6:.1f} MB in {time.perf_counter() - start:.1f} s")
+
+
+# --- 2. Reading ---
+
+def _runs(sorted_times):
+    """Splits sorted unique time indices into (position, start, stop) runs of consecutive steps."""
+    if len(sorted_times) == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(sorted_times) != 1) + 1
+    bounds = np.concatenate([[0], breaks, [len(sorted_times)]])
+    return [(int(a), int(sorted_times[a]), int(sorted_times[b - 1]) + 1) for a, b in zip(bounds[:-1], bounds[1:])]
+
+
+class TimeCube:
+    """A cube opened for lazy, windowed reads; every read returns float32 arrays."""
+
+    def __init__(self, path, cache_bytes=CHUNK_CACHE_BYTES):
+        self.path = path
+        self._file = h5py.File(path, "r", rdcc_nbytes=cache_bytes, rdcc_nslots=10007)
+        self.dynamic = self._file["dynamic"]
+        self.target = self._file["target"]
+        self.static = self._file["static"]
+        self.static_layer = self._file["static_layer"][:]
+        self.center_time = self._file["center_time"][:].astype(str)
+        self.fire_offsets = self._file["fire_offsets"][:]
+        self.stack_fire = self._file["stack_fire"][:] if "stack_fire" in self._file else None
+        self._fire_pixels = self._file["fire_pixels"][:]
+        self.shape = self.dynamic.shape[:3]  # (time, y, x)
+        self._times = {t: i for i, t in enumerate(self.center_time)}
+
+    def times_for(self, center_times):
+        """Cube time indices of index rows, matched by center_time."""
+        try:
+            return np.array([self._times[str(t)] for t in center_times], dtype=np.int64)
+        except KeyError as e:
+            raise KeyError(f"center_time {e} is not in the cube {self.path}; rebuild it from this index.") from None
+
+    @property
+    def has_fire(self):
+        """Per time step: whether the row's VIIRS raster has fire in any band (see FireIndex)."""
+        if self.stack_fire is None:
+            raise ValueError(f"{self.path} predates per-stack fire flags; rebuild it with time_cube.py build.")
+        return self.stack_fire
+
+    def fire_pixels(self, t):
+        return self._fire_pixels[self.fire_offsets[t] : self.fire_offsets[t + 1]]
+
+    def read_inputs(self, times, r0, r1, c0, c1):
+        """(len(times), r1 - r0, c1 - c0, CHANNELS) inputs inside the grid window, in INPUT_COLS order."""
+        times = np.asarray(times, dtype=np.int64)
+        unique, inverse = np.unique(times, return_inverse=True)
+        out = np.empty((len(unique), r1 - r0, c1 - c0, len(INPUT_COLS)), dtype=np.float32)
+        for pos, t0, t1 in _runs(unique):
+            out[pos : pos + t1 - t0, :, :, : len(DYNAMIC_COLS)] = self.dynamic[t0:t1, r0:r1, c0:c1, :]
+        layers = self.static_layer[unique]
+        for layer in np.unique(layers):
+            window = self.static[int(layer), r0:r1, c0:c1]
+            for k in range(len(STATIC_COLS)):
+                out[layers[:, k] == layer, :, :, len(DYNAMIC_COLS) + k] = window
+        return out[inverse.ravel()]
+
+    def read_target(self, times, r0, r1, c0, c1):
+        """(len(times), r1 - r0, c1 - c0) targets inside the grid window."""
+        times = np.asarray(times, dtype=np.int64)
+        unique, inverse = np.unique(times, return_inverse=True)
+        out = np.empty((len(unique), r1 - r0, c1 - c0), dtype=np.float32)
+        for pos, t0, t1 in _runs(unique):
+            out[pos : pos + t1 - t0] = self.target[t0:t1, r0:r1, c0:c1]
+        return out[inverse.ravel()]
+
+    def target_patch(self, t, row, col, patch_size=PATCH_SIZE):
+        """One target patch centred on (row, col), zero-padded at the edges like _extract_patch."""
+        half = patch_size // 2
+        _, h, w = self.shape
+        r0, c0 = row - half, col - half
+        patch = np.zeros((patch_size, patch_size), dtype=np.float32)
+        rs, re = max(r0, 0), min(r0 + patch_size, h)
+        cs, ce = max(c0, 0), min(c0 + patch_size, w)
+        patch[rs - r0 : re - r0, cs - c0 : ce - c0] = self.target[t, rs:re, cs:ce]
+        return patch
+
+    def close(self):
+        self._file.close()
+
+
+class CubeSampler:
+    """
+    PatchSampler over a TimeCube: same build_batch/build/subset interface and
+    the same samples, but patches are read from the cube when a batch is built
+    instead of being cropped from every source raster up front.
+    """
+
+    def __init__(self, cube, df, patch_size=PATCH_SIZE):
+        self.cube = cube
+        self.patch_size = patch_size
+        self.row_times = cube.times_for(df["center_time"])
+        _, h, w = cube.shape
+        if h < patch_size or w < patch_size:
+            raise ValueError(f"The cube grid ({h}x{w}) is smaller than a {patch_size}x{patch_size} patch.")
+        r, c = _safe_center(h, w, patch_size)
+        half = patch_size // 2
+        self._window = (int(r) - half, int(r) + half + 1, int(c) - half, int(c) + half + 1)
+
+    def subset(self, df):
+        sub = copy.copy(self)
+        sub.row_times = self.cube.times_for(df["center_time"])
+        return sub
+
+    def build_batch(self, start_indices, force_fire=False):
+        """Builds X (B, SEQ_LEN, P, P, CHANNELS) and y (B, HORIZONS, P, P) for many start rows."""
+        starts = np.asarray(start_indices, dtype=np.int64)
+        seq_times = self.row_times[starts[:, None] + np.arange(SEQ_LEN)]
+        horizon_times = self.row_times[starts[:, None] + SEQ_LEN + np.arange(HORIZONS)]
+        p = self.patch_size
+
+        X = self.cube.read_inputs(seq_times.ravel(), *self._window).reshape(len(starts), SEQ_LEN, p, p, len(INPUT_COLS))
+        y = self.cube.read_target(horizon_times.ravel(), *self._window).reshape(len(starts), HORIZONS, p, p)
+
+        if force_fire:
+            for b, h in np.ndindex(horizon_times.shape):
+                fire_pos = self.cube.fire_pixels(horizon_times[b, h])
+                if len(fire_pos):
+                    r, c = fire_pos[np.random.randint(len(fire_pos))]
+                    y[b, h] = self.cube.target_patch(horizon_times[b, h], int(r), int(c), p)
+        return X, y
+
+    def build(self, start, force_fire=False):
+        X, y = self.build_batch([start], force_fire=force_fire)
+        return X[0], y[0]
+
+
+class CubeFireIndex:
+    """The part of FireIndex create_dataset needs, answered from the cube's per-row stack fire flags."""
+
+    def __init__(self, cube):
+        self.cube = cube
+        self._has_fire = cube.has_fire
+
+    def split_starts(self, df):
+        return split_starts_by_fire(self._has_fire[self.cube.times_for(df["center_time"])])
+
+
+def verify(csv_path, cube_path, samples=50, seed=0):
+    """Asserts that CubeSampler and PatchSampler build identical samples."""
+    df = pd.read_csv(csv_path)
+    cache = load_rasters(df, INPUT_COLS + ["viirs_file"], max_workers=8)
+    reference = PatchSampler(df, cache)
+    cube = TimeCube(cube_path)
+    try:
+        sampler = CubeSampler(cube, df)
+        starts = np.random.default_rng(seed).integers(0, len(df) - SEQ_LEN - HORIZONS + 1, size=samples)
+        X_ref, y_ref = reference.build_batch(starts)
+        X_cube, y_cube = sampler.build_batch(starts)
+        np.testing.assert_array_equal(X_ref, X_cube)
+        np.testing.assert_array_equal(y_ref, y_cube)
+    finally:
+        cube.close()
+    print(f"{samples} samples match PatchSampler ✅")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("build", help="Convert an index's rasters into a cube")
+    p.add_argument("--csv", required=True, help="Sequence index CSV")
+    p.add_argument("--out", required=True, help="Cube file (.h5)")
+    p.add_argument("--time-chunk", type=int, default=TIME_CHUNK)
+    p.add_argument("--tile", type=int, default=TILE)
+    p.add_argument("--compression", default="lzf", help="lzf, gzip or none")
+
+    p = sub.add_parser("verify", help="Compare cube samples with PatchSampler")
+    p.add_argument("--csv", required=True)
+    p.add_argument("--cube", required=True)
+    p.add_argument("--samples", type=int, default=50)
+
+    args = parser.parse_args()
+    if args.command == "build":
+        compression = None if args.compression == "none" else args.compression
+        build_cube(args.csv, args.out, time_chunk=args.time_chunk, tile=args.tile, compression=compression)
+    else:
+        verify(args.csv, args.cube, samples=args.samples)
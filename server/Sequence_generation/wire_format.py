@@ -0,0 +1,138 @@
+import io
+import struct
+
+import numpy as np
+
+try:
+    import msgpack
+except ImportError:  # msgpack is optional; the other formats work without it
+    msgpack = None
+
+
+# --- 1. Formats ---
+# Every format carries the tensor shape, so no extra fields are needed to rebuild it.
+#
+#   application/json          nested lists (fallback, what the frontend sends today)
+#   application/x-npy         a standard NumPy .npy file
+#   application/octet-stream  raw tensor: 4-byte magic b"FFT1", uint8 dtype code,
+#                             uint8 ndim, ndim x uint32 dims, then the little-endian data
+#   application/msgpack       {"shape": [...], "dtype": "<f4", "data": <bytes>}
+
+JSON = "application/json"
+NPY = "application/x-npy"
+RAW = "application/octet-stream"
+MSGPACK = "application/msgpack"
+
+BINARY_FORMATS = (NPY, RAW, MSGPACK)
+RAW_MAGIC = b"FFT1"
+RAW_DTYPES = {1: np.dtype("<f4"), 2: np.dtype("<f2")}
+RAW_CODES = {dtype: code for code, dtype in RAW_DTYPES.items()}
+OUTPUT_DTYPES = {"float32": np.dtype("<f4"), "float16": np.dtype("<f2")}
+
+
+class WireFormatError(ValueError):
+    """Raised when a request body cannot be decoded into a tensor."""
+
+
+def available_formats():
+    """Content types this server can decode and encode."""
+    formats = [JSON, NPY, RAW]
+    if msgpack is not None:
+        formats.append(MSGPACK)
+    return formats
+
+def _media_type(header):
+    return (header or "").split(";")[0].strip().lower()
+
+
+# --- 2. Decoding ---
+
+def decode_tensor(body, content_type):
+    """Decodes a binary request body into a float32 array, based on its Content-Type."""
+    media_type = _media_type(content_type)
+
+    if media_type == NPY:
+        try:
+            array = np.load(io.BytesIO(body), allow_pickle=False)
+        except Exception as e:
+            raise WireFormatError(f"Invalid .npy payload: {e}")
+
+    elif media_type == RAW:
+        if len(body) < 6 or body[:4] != RAW_MAGIC:
+            raise WireFormatError("Raw tensor payload is missing the b'FFT1' header.")
+        code, ndim = struct.unpack_from("<BB", body, 4)
+        if code not in RAW_DTYPES:
+            raise WireFormatError(f"Unknown raw dtype code {code}.")
+        header_size = 6 + 4 * ndim
+        if len(body) < header_size:
+            raise WireFormatError(f"Raw tensor header declares {ndim} dims but the payload ends after {len(body)} bytes.")
+        shape = struct.unpack_from(f"<{ndim}I", body, 6)
+        expected = int(np.prod(shape)) * RAW_DTYPES[code].itemsize
+        if len(body) - header_size != expected:
+            raise WireFormatError(
+                f"Raw tensor payload has {len(body) - header_size} data bytes, expected {expected}."
+            )
+        array = np.frombuffer(body, dtype=RAW_DTYPES[code], offset=header_size).reshape(shape)
+
+    elif media_type == MSGPACK:
+        if msgpack is None:
+            raise WireFormatError("msgpack is not installed on this server.")
+        try:
+            obj = msgpack.unpackb(body, raw=False)
+            array = np.frombuffer(obj["data"], dtype=np.dtype(obj["dtype"])).reshape(obj["shape"])
+        except Exception as e:
+            raise WireFormatError(f"Invalid msgpack tensor payload: {e}")
+
+    else:
+        raise WireFormatError(f"Unsupported tensor Content-Type '{media_type}'.")
+
+    return array.astype(np.float32, copy=False)
+
+
+# --- 3. Encoding ---
+
+def negotiate(accept_header):
+    """Picks the response format from an Accept header, falling back to JSON."""
+    offered = available_formats()
+    candidates = []
+    for position, part in enumerate((accept_header or "").split(",")):
+        pieces = part.split(";")
+        media_type = pieces[0].strip().lower()
+        quality = 1.0
+        for param in pieces[1:]:
+            key, _, value = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if media_type in offered and quality > 0:
+            candidates.append((-quality, position, media_type))
+    return min(candidates)[2] if candidates else JSON
+
+def encode_tensor(array, media_type, dtype="float32"):
+    """Encodes an array as a binary body in one of BINARY_FORMATS."""
+    if dtype not in OUTPUT_DTYPES:
+        raise WireFormatError(f"Unsupported output dtype '{dtype}'. Use one of {sorted(OUTPUT_DTYPES)}.")
+    array = np.ascontiguousarray(array, dtype=OUTPUT_DTYPES[dtype])
+
+    if media_type == NPY:
+        buffer = io.BytesIO()
+        np.save(buffer, array, allow_pickle=False)
+        return buffer.getvalue()
+
+    if media_type == RAW:
+        header = RAW_MAGIC + struct.pack(
+            f"<BB{array.ndim}I", RAW_CODES[array.dtype], array.ndim, *array.shape
+        )
+        return header + array.tobytes()
+
+    if media_type == MSGPACK:
+        if msgpack is None:
+            raise WireFormatError("msgpack is not installed on this server.")
+        return msgpack.packb(
+            {"shape": list(array.shape), "dtype": array.dtype.str, "data": array.tobytes()},
+            use_bin_type=True,
+        )
+
+    raise WireFormatError(f"'{media_type}' is not a binary tensor format.")
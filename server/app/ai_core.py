@@ -1,41 +1,212 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+
 import faiss
+import httpx
 import numpy as np
-import requests
 import json
 
+from app.intent import IntentClassifier
 
-# --- Helper functions (Unchanged) ---
-def get_ollama_embedding(text: str) -> np.ndarray:
-    try:
-        response = requests.post(
-            "http://localhost:11434/api/embeddings",
-            json={"model": "nomic-embed-text", "prompt": text},
-            timeout=30,
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
+GENERATE_MODEL = "phi3:3.8b"
+EMBEDDING_MODEL = "nomic-embed-text"
+EMBEDDING_DIM = 768
+# Concurrent requests (and pooled keep-alive connections) to Ollama
+OLLAMA_MAX_CONCURRENCY = int(os.getenv("OLLAMA_MAX_CONCURRENCY", "4"))
+OLLAMA_MAX_RETRIES = int(os.getenv("OLLAMA_MAX_RETRIES", "2"))
+OLLAMA_TIMEOUT_S = float(os.getenv("OLLAMA_TIMEOUT_S", "300"))
+
+
+# --- Ollama client ---
+class OllamaError(Exception):
+    """Raised when an Ollama call still fails after its retries."""
+
+
+class OllamaClient:
+    """
+    Async client for the Ollama HTTP API. One pooled keep-alive connection set
+    is shared by all calls, at most `max_concurrency` requests are in flight,
+    and connection errors, 429s and 5xx responses are retried up to
+    `max_retries` times with jittered exponential backoff. Timeouts are not
+    retried, since a generation that timed out once will usually time out again.
+
+    Point OLLAMA_URL at a stub server (see ollama_stub.py) to run without a model.
+    """
+
+    def __init__(self, base_url=OLLAMA_URL, max_concurrency=OLLAMA_MAX_CONCURRENCY,
+                 max_retries=OLLAMA_MAX_RETRIES, backoff_s=0.5, timeout_s=OLLAMA_TIMEOUT_S, history=512):
+        self.base_url = base_url
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_s = backoff_s
+        self.timeout_s = timeout_s
+        self._client = None
+        self._loop = None
+        self._semaphore = None
+        self._metrics = {}
+        self._history = history
+
+    @staticmethod
+    def _close_stale(client, loop):
+        """Closes a client opened on another event loop, on that loop while it can still run."""
+        if loop.is_running():
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+        elif not loop.is_closed():
+            loop.run_until_complete(client.aclose())
+        else:
+            # Its sockets can no longer be closed cleanly; callers of asyncio.run() should aclose() first
+            print("Warning: an Ollama client outlived its event loop; its connections are released on garbage collection.")
+
+    def _ensure_client(self):
+        # Connections belong to the event loop that opened them
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._loop is not loop:
+            if self._client is not None and not self._client.is_closed:
+                self._close_stale(self._client, self._loop)
+            self._loop = loop
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(self.timeout_s, connect=5.0),
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency
+                ),
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._client
+
+    def _record(self, path, latency_ms, attempts, ok, first_chunk_ms=None):
+        m = self._metrics.setdefault(
+            path,
+            {
+                "calls": 0,
+                "errors": 0,
+                "retries": 0,
+                "latency_ms": deque(maxlen=self._history),
+                "first_chunk_ms": deque(maxlen=self._history),
+            },
         )
-        response.raise_for_status()
-        embedding = response.json().get("embedding")
-        return np.array([embedding], dtype="float32")
-    except requests.RequestException as e:
+        m["calls"] += 1
+        m["retries"] += attempts - 1
+        m["latency_ms"].append(latency_ms)
+        if first_chunk_ms is not None:
+            m["first_chunk_ms"].append(first_chunk_ms)
+        if not ok:
+            m["errors"] += 1
+
+    @staticmethod
+    def _retryable(exc):
+        if isinstance(exc, httpx.HTTPStatusError):
+            return exc.response.status_code == 429 or exc.response.status_code >= 500
+        return isinstance(exc, httpx.TransportError) and not isinstance(exc, httpx.TimeoutException)
+
+    async def post(self, path: str, payload: dict) -> dict:
+        client = self._ensure_client()
+        start, attempts = time.perf_counter(), 0
+        async with self._semaphore:
+            while True:
+                attempts += 1
+                try:
+                    response = await client.post(path, json=payload)
+                    response.raise_for_status()
+                    result = response.json()
+                    self._record(path, (time.perf_counter() - start) * 1000.0, attempts, True)
+                    return result
+                except ValueError as e:  # Not JSON; retrying would get the same body
+                    self._record(path, (time.perf_counter() - start) * 1000.0, attempts, False)
+                    raise OllamaError(f"{path} returned invalid JSON: {e}") from e
+                except httpx.HTTPError as e:
+                    if attempts > self.max_retries or not self._retryable(e):
+                        self._record(path, (time.perf_counter() - start) * 1000.0, attempts, False)
+                        raise OllamaError(f"{path} failed after {attempts} attempt(s): {e!r}") from e
+                    await asyncio.sleep(self.backoff_s * 2 ** (attempts - 1) * (0.5 + random.random()))
+
+    async def stream(self, path: str, payload: dict):
+        """
+        Yields the JSON objects of a streaming (NDJSON) response as they
+        arrive. Failures are retried only until the first object was yielded.
+        """
+        client = self._ensure_client()
+        metric = f"{path} (stream)"
+        start, attempts, first_chunk_ms = time.perf_counter(), 0, None
+        async with self._semaphore:
+            while True:
+                attempts += 1
+                try:
+                    async with client.stream("POST", path, json=payload) as response:
+                        response.raise_for_status()
+                        async for line in response.aiter_lines():
+                            if not line:
+                                continue
+                            if first_chunk_ms is None:
+                                first_chunk_ms = (time.perf_counter() - start) * 1000.0
+                            try:
+                                chunk = json.loads(line)
+                            except ValueError as e:
+                                self._record(metric, (time.perf_counter() - start) * 1000.0, attempts, False, first_chunk_ms)
+                                raise OllamaError(f"{path} streamed invalid JSON: {e}") from e
+                            yield chunk
+                    self._record(metric, (time.perf_counter() - start) * 1000.0, attempts, True, first_chunk_ms)
+                    return
+                except httpx.HTTPError as e:
+                    if first_chunk_ms is not None or attempts > self.max_retries or not self._retryable(e):
+                        self._record(metric, (time.perf_counter() - start) * 1000.0, attempts, False, first_chunk_ms)
+                        raise OllamaError(f"{path} failed after {attempts} attempt(s): {e!r}") from e
+                    await asyncio.sleep(self.backoff_s * 2 ** (attempts - 1) * (0.5 + random.random()))
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = self._loop = None
+
+    def stats(self) -> dict:
+        out = {}
+        for path, m in self._metrics.items():
+            latencies = np.array(m["latency_ms"]) if m["latency_ms"] else np.zeros(1)
+            out[path] = {
+                "calls": m["calls"],
+                "errors": m["errors"],
+                "retries": m["retries"],
+                "latency_p50_ms": round(float(np.percentile(latencies, 50)), 2),
+                "latency_p95_ms": round(float(np.percentile(latencies, 95)), 2),
+            }
+            if m["first_chunk_ms"]:
+                out[path]["first_chunk_p50_ms"] = round(float(np.percentile(m["first_chunk_ms"], 50)), 2)
+        return out
+
+
+ollama = OllamaClient()
+fast_intent = IntentClassifier()
+
+
+# --- Helper functions ---
+async def get_ollama_embedding(text: str) -> np.ndarray:
+    try:
+        result = await ollama.post("/api/embeddings", {"model": EMBEDDING_MODEL, "prompt": text})
+        return np.array([result.get("embedding")], dtype="float32")
+    except OllamaError as e:
         print(f"Error getting Ollama embedding: {e}")
-        return np.zeros((1, 768), dtype="float32")
+        return np.zeros((1, EMBEDDING_DIM), dtype="float32")
 
 
-def _call_ollama_generate(prompt, system_message, format=""):
+async def _call_ollama_generate(prompt, system_message, format=""):
     try:
-        response = requests.post(
-            "http://localhost:11434/api/generate",
-            json={
-                "model": "phi3:3.8b",
+        result = await ollama.post(
+            "/api/generate",
+            {
+                "model": GENERATE_MODEL,
                 "system": system_message,
                 "prompt": prompt,
                 "format": format,
                 "stream": False,
             },
-            timeout=300,
         )
-        response.raise_for_status()
-        return response.json().get("response", "").strip()
-    except requests.RequestException as e:
+        return result.get("response", "").strip()
+    except OllamaError as e:
         print(f"Error calling Ollama generate: {e}")
         error_message = (
             "Error: Could not connect to the AI model. Ensure Ollama is running."
@@ -43,30 +214,394 @@ def _call_ollama_generate(prompt, system_message, format=""):
         return f'{{"error": "{error_message}"}}' if format == "json" else error_message
 
 
-# --- VectorDB (Unchanged) ---
+async def _stream_ollama_generate(prompt, system_message):
+    """Yields response tokens as the model produces them."""
+    try:
+        async for chunk in ollama.stream(
+            "/api/generate",
+            {
+                "model": GENERATE_MODEL,
+                "system": system_message,
+                "prompt": prompt,
+                "stream": True,
+            },
+        ):
+            if chunk.get("response"):
+                yield chunk["response"]
+    except OllamaError as e:
+        print(f"Error streaming from Ollama generate: {e}")
+        yield "Error: Could not connect to the AI model. Ensure Ollama is running."
+
+
+_batch_embed_supported = True
+
+
+def _endpoint_missing(exc):
+    """Whether an OllamaError means the server has no such endpoint, rather than a passing failure."""
+    cause = exc.__cause__
+    if isinstance(cause, httpx.HTTPStatusError):
+        # Ollama also answers 404 for a model it does not have, on every endpoint
+        return cause.response.status_code == 404 and "model" not in cause.response.text.lower()
+    return "not found" in str(exc).lower() or "unknown endpoint" in str(exc).lower()
+
+
+async def get_ollama_embeddings(texts, batch_size: int = 32) -> np.ndarray:
+    """
+    Embeds many texts, `batch_size` per request to Ollama's batch /api/embed
+    endpoint. Older Ollama versions without it (a 404) get one /api/embeddings
+    call per text instead, run concurrently; other batch failures fall back
+    for that batch only. Texts that could not be embedded come back as zero rows.
+    """
+    global _batch_embed_supported
+    batches = []
+    for start in range(0, len(texts), batch_size):
+        batch = list(texts[start:start + batch_size])
+        if _batch_embed_supported:
+            try:
+                result = await ollama.post("/api/embed", {"model": EMBEDDING_MODEL, "input": batch})
+                batches.append(np.array(result["embeddings"], dtype="float32"))
+                continue
+            except KeyError as e:
+                print(f"Batch embedding reply without embeddings, embedding one by one: {e}")
+            except OllamaError as e:
+                if _endpoint_missing(e):
+                    print(f"Batch embedding unavailable, embedding one by one from now on: {e}")
+                    _batch_embed_supported = False
+                else:
+                    print(f"Batch embedding failed, embedding this batch one by one: {e}")
+        batches.append(np.concatenate(await asyncio.gather(*(get_ollama_embedding(t) for t in batch))))
+    return np.concatenate(batches) if batches else np.zeros((0, EMBEDDING_DIM), dtype="float32")
+
+
+# --- VectorDB ---
+VECTOR_INDEX_HNSW_THRESHOLD = int(os.getenv("VECTOR_INDEX_HNSW_THRESHOLD", "4096"))
+VECTOR_PENDING_RETRY_S = float(os.getenv("VECTOR_PENDING_RETRY_S", "60"))
+
+
 class VectorDB:
-    def __init__(self, embedding_dim=768):
+    """
+    Document store for dataset and column descriptions across all uploaded
+    datasets. Embeddings are unit vectors searched by inner product (cosine):
+    an exact flat index while small, an HNSW graph once there are more than
+    `hnsw_threshold` documents. Searches can be limited to one dataset.
+
+    With a `path`, documents and vectors are saved after every change and
+    loaded again at startup without re-embedding anything.
+
+    Documents whose embedding failed are never indexed or saved as vectors:
+    they wait in `pending` (saved alongside) and are embedded again by
+    `embed_pending`, at most every `retry_s` seconds.
+    """
+
+    def __init__(self, embedding_dim=EMBEDDING_DIM, path=None, hnsw_threshold=VECTOR_INDEX_HNSW_THRESHOLD,
+                 retry_s=VECTOR_PENDING_RETRY_S):
         self.embedding_dim = embedding_dim
-        self.index = faiss.IndexFlatL2(self.embedding_dim)
-        self.metadata = []
+        self.path = path
+        self.hnsw_threshold = hnsw_threshold
+        self.retry_s = retry_s
+        self.documents = []  # {"text", "source", "dataset", ...}; position == vector id
+        self.vectors = np.zeros((0, embedding_dim), dtype="float32")
+        self.pending = []  # Documents still waiting for an embedding
+        self._last_retry = 0.0
+        self.index = None
+        self._lock = threading.Lock()
+        self._rebuild()
+
+    # --- Index ---
+
+    def _rebuild(self):
+        if len(self.documents) > self.hnsw_threshold:
+            index = faiss.IndexHNSWFlat(self.embedding_dim, 32, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efSearch = 64
+        else:
+            index = faiss.IndexFlatIP(self.embedding_dim)
+        if len(self.vectors):
+            index.add(self.vectors)
+        self.index = index
+
+    @staticmethod
+    def _unit(vectors):
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return (vectors / np.where(norms == 0, 1, norms)).astype("float32")
+
+    # --- Documents ---
+
+    async def add_documents(self, docs, dataset=None):
+        """Embeds `docs` (dicts with at least "text") in batches and adds them, tagged with `dataset`."""
+        if not docs:
+            return
+        await self._embed([{**d, "dataset": dataset} for d in docs])
+
+    async def _embed(self, docs):
+        """Embeds tagged documents and indexes those that got an embedding; the rest become pending."""
+        vectors = await get_ollama_embeddings([d["text"] for d in docs])
+        # A failed embedding comes back as a zero row; a real one never is
+        ok = np.linalg.norm(vectors, axis=1) > 0
+        vectors = self._unit(vectors[ok])
+        with self._lock:
+            self.documents.extend(d for d, good in zip(docs, ok) if good)
+            self.pending.extend(d for d, good in zip(docs, ok) if not good)
+            self.vectors = np.concatenate([self.vectors, vectors])
+            if isinstance(self.index, faiss.IndexFlatIP) and len(self.documents) > self.hnsw_threshold:
+                self._rebuild()
+            elif len(vectors):
+                self.index.add(vectors)
+            self._save()
+        if not ok.all():
+            print(f"{int((~ok).sum())} document(s) could not be embedded; they will be retried.")
+
+    async def embed_pending(self, force=False):
+        """Retries the pending documents, unless the last attempt was under `retry_s` seconds ago."""
+        with self._lock:
+            if not self.pending or (not force and time.monotonic() - self._last_retry < self.retry_s):
+                return
+            docs, self.pending = self.pending, []
+            self._last_retry = time.monotonic()
+        await self._embed(docs)
+
+    def remove_dataset(self, dataset):
+        """Drops a dataset's documents, e.g. before re-describing a re-uploaded file."""
+        with self._lock:
+            keep = [i for i, d in enumerate(self.documents) if d.get("dataset") != dataset]
+            pending = [d for d in self.pending if d.get("dataset") != dataset]
+            if len(keep) == len(self.documents) and len(pending) == len(self.pending):
+                return
+            self.documents = [self.documents[i] for i in keep]
+            self.vectors = self.vectors[keep]
+            self.pending = pending
+            self._rebuild()
+            self._save()
 
-    def add_metadata(self, text, source):
-        self.index.reset()
-        self.metadata.clear()
-        embedding = get_ollama_embedding(text)
-        self.index.add(embedding)
-        self.metadata.append({"text": text, "source": source})
+    async def add_metadata(self, text, source, dataset=None):
+        await self.add_documents([{"text": text, "source": source}], dataset=dataset)
 
-    def retrieve_context(self, query, k=1):
+    # --- Search ---
+
+    def search_vector(self, embedding, k=5, dataset=None):
+        """The `k` most similar documents (with a "score"), optionally only from `dataset`."""
+        with self._lock:
+            if self.index.ntotal == 0:
+                return []
+            query = self._unit(np.asarray(embedding, dtype="float32").reshape(1, -1))
+            params = None
+            if dataset is not None:
+                ids = np.array([i for i, d in enumerate(self.documents) if d.get("dataset") == dataset], dtype="int64")
+                if not len(ids):
+                    return []
+                selector = faiss.IDSelectorBatch(ids)
+                params = (faiss.SearchParametersHNSW(sel=selector, efSearch=64)
+                          if isinstance(self.index, faiss.IndexHNSWFlat) else faiss.SearchParameters(sel=selector))
+            scores, idx = self.index.search(query, min(k, self.index.ntotal), params=params)
+            return [{**self.documents[i], "score": float(s)} for s, i in zip(scores[0], idx[0]) if i != -1]
+
+    async def search(self, query, k=5, dataset=None):
+        await self.embed_pending()
+        return self.search_vector(await get_ollama_embedding(query), k=k, dataset=dataset)
+
+    async def retrieve_context(self, query, k=1, dataset=None):
         if self.index.ntotal == 0:
             return "No metadata available."
-        query_embedding = get_ollama_embedding(query)
-        _, I = self.index.search(query_embedding, k)
-        return "\n---\n".join([self.metadata[idx]["text"] for idx in I[0] if idx != -1])
+        return "\n---\n".join(d["text"] for d in await self.search(query, k=k, dataset=dataset))
+
+    # --- Persistence ---
+
+    def _save(self):
+        if self.path is None:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        # load() rejects a pair left mismatched by a crash between the two renames
+        np.save(os.path.join(self.path, "vectors.tmp.npy"), self.vectors)
+        with open(os.path.join(self.path, "documents.tmp.json"), "w") as f:
+            json.dump(self.documents, f)
+        with open(os.path.join(self.path, "pending.tmp.json"), "w") as f:
+            json.dump(self.pending, f)
+        os.replace(os.path.join(self.path, "vectors.tmp.npy"), os.path.join(self.path, "vectors.npy"))
+        os.replace(os.path.join(self.path, "documents.tmp.json"), os.path.join(self.path, "documents.json"))
+        os.replace(os.path.join(self.path, "pending.tmp.json"), os.path.join(self.path, "pending.json"))
+
+    def load(self):
+        """
+        Reloads a saved store; returns the number of documents. Zero vectors
+        saved by earlier versions for failed embeddings are moved to `pending`.
+        """
+        vectors_path = os.path.join(self.path, "vectors.npy")
+        documents_path = os.path.join(self.path, "documents.json")
+        pending_path = os.path.join(self.path, "pending.json")
+        if not (os.path.exists(vectors_path) and os.path.exists(documents_path)):
+            return 0
+        vectors = np.load(vectors_path)
+        with open(documents_path) as f:
+            documents = json.load(f)
+        if len(documents) != len(vectors) or vectors.shape[1] != self.embedding_dim:
+            print(f"Ignoring inconsistent vector store at {self.path}.")
+            return 0
+        pending = []
+        if os.path.exists(pending_path):
+            with open(pending_path) as f:
+                pending = json.load(f)
+        ok = np.linalg.norm(vectors, axis=1) > 0
+        pending += [d for d, good in zip(documents, ok) if not good]
+        with self._lock:
+            self.documents = [d for d, good in zip(documents, ok) if good]
+            self.vectors, self.pending = vectors[ok], pending
+            self._rebuild()
+        return len(self.documents) + len(self.pending)
+
+
+# --- Semantic cache ---
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "1024"))
+SEMANTIC_CACHE_TTL_S = float(os.getenv("SEMANTIC_CACHE_TTL_S", "3600"))
+
+
+class SemanticCache:
+    """
+    Remembers the intent (and, for data queries, the SQL) produced for past
+    questions about a dataset. A question is a hit when its normalized text
+    was seen before, or when a cached question's embedding has a cosine
+    similarity of at least `threshold` with it (FAISS inner-product search over
+    unit vectors). Entries are scoped to a schema fingerprint, expire after
+    `ttl_s` seconds and are evicted least-recently-used beyond `max_entries`.
+    """
+
+    def __init__(self, embedding_dim=EMBEDDING_DIM, threshold=SEMANTIC_CACHE_THRESHOLD,
+                 max_entries=SEMANTIC_CACHE_MAX_ENTRIES, ttl_s=SEMANTIC_CACHE_TTL_S):
+        self.embedding_dim = embedding_dim
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.index = faiss.IndexIDMap(faiss.IndexFlatIP(embedding_dim))
+        self.entries = OrderedDict()  # id -> entry, least recently used first
+        self.by_text = {}  # (fingerprint, normalized text) -> id
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._counts = {"lookups": 0, "exact_hits": 0, "semantic_hits": 0, "misses": 0, "evictions": 0, "expired": 0}
+
+    @staticmethod
+    def _normalize(query):
+        return " ".join(query.lower().split())
+
+    @staticmethod
+    def _unit(embedding):
+        norm = np.linalg.norm(embedding)
+        return (embedding / norm).astype("float32") if norm > 0 else None
+
+    def _remove(self, entry_id):
+        entry = self.entries.pop(entry_id)
+        self.by_text.pop((entry["fingerprint"], entry["text"]), None)
+        if entry["indexed"]:
+            self.index.remove_ids(np.array([entry_id], dtype="int64"))
+
+    def _live(self, entry_id):
+        """The entry if it exists and has not expired, marked as recently used."""
+        entry = self.entries.get(entry_id)
+        if entry is None:
+            return None
+        if time.time() - entry["created"] > self.ttl_s:
+            self._remove(entry_id)
+            self._counts["expired"] += 1
+            return None
+        self.entries.move_to_end(entry_id)
+        return entry
+
+    async def lookup(self, fingerprint, query):
+        """
+        Returns (entry, embedding). The query is only embedded when its exact
+        text is not cached; embedding is None when it was not needed.
+        """
+        key = (fingerprint, self._normalize(query))
+        with self._lock:
+            self._counts["lookups"] += 1
+            entry = self._live(self.by_text[key]) if key in self.by_text else None
+            if entry is not None:
+                self._counts["exact_hits"] += 1
+                return dict(entry), None
+
+        embedding = await get_ollama_embedding(query)
+        unit = self._unit(embedding)
+        with self._lock:
+            if unit is not None and self.index.ntotal:
+                scores, ids = self.index.search(unit, min(8, self.index.ntotal))
+                for score, entry_id in zip(scores[0], ids[0]):
+                    if entry_id == -1 or score < self.threshold:
+                        break
+                    entry = self._live(int(entry_id))
+                    if entry is not None and entry["fingerprint"] == fingerprint:
+                        self._counts["semantic_hits"] += 1
+                        return dict(entry), embedding
+            self._counts["misses"] += 1
+        return None, embedding
+
+    def put(self, fingerprint, query, embedding, intent, sql=None):
+        """Caches a classified question; returns its entry id for update()."""
+        text = self._normalize(query)
+        unit = self._unit(embedding) if embedding is not None else None
+        with self._lock:
+            old = self.by_text.get((fingerprint, text))
+            if old is not None:
+                self._remove(old)
+            entry_id, self._next_id = self._next_id, self._next_id + 1
+            self.entries[entry_id] = {
+                "id": entry_id,
+                "fingerprint": fingerprint,
+                "text": text,
+                "intent": intent,
+                "sql": sql,
+                "created": time.time(),
+                # Failed embeddings come back as zeros; such entries only match exactly
+                "indexed": unit is not None,
+            }
+            self.by_text[(fingerprint, text)] = entry_id
+            if unit is not None:
+                self.index.add_with_ids(unit, np.array([entry_id], dtype="int64"))
+            while len(self.entries) > self.max_entries:
+                self._remove(next(iter(self.entries)))
+                self._counts["evictions"] += 1
+        return entry_id
+
+    def update(self, entry_id, **fields):
+        with self._lock:
+            if entry_id in self.entries:
+                self.entries[entry_id].update(fields)
+
+    def invalidate(self):
+        """Drops every entry, e.g. when a new dataset replaces the table."""
+        with self._lock:
+            self.index.reset()
+            self.entries.clear()
+            self.by_text.clear()
+
+    def stats(self):
+        with self._lock:
+            hits = self._counts["exact_hits"] + self._counts["semantic_hits"]
+            return {
+                **self._counts,
+                "entries": len(self.entries),
+                "hit_rate": round(hits / self._counts["lookups"], 4) if self._counts["lookups"] else 0.0,
+            }
 
 
 # --- AI Functions for Conversation (classify_intent and generate_chitchat_response are unchanged) ---
-def classify_intent(user_query: str) -> dict:
+async def classify_intent(user_query: str, embedding=None, columns=()) -> dict:
+    """
+    Rules, then the nearest-centroid model (see app/intent.py), then phi3.
+    The result's "source" says which stage decided. `embedding` saves the
+    centroid stage an embedding call when the caller already has one;
+    `columns` are the loaded table's column names, which the rules count
+    as evidence of a data question.
+    """
+    intent = fast_intent.match_rules(user_query, columns)
+    if intent is not None:
+        fast_intent.record("rules")
+        return {"intent": intent, "source": "rules"}
+    if fast_intent.ready:
+        if embedding is None:
+            embedding = await get_ollama_embedding(user_query)
+        intent = fast_intent.match_centroid(embedding)
+        if intent is not None:
+            fast_intent.record("centroid")
+            return {"intent": intent, "source": "centroid"}
+
     system_message = """Your job is to classify the user's intent into one of three categories and respond with a JSON object.
 1. 'chitchat': For greetings, pleasantries, or questions not related to the data.
 2. 'metadata_query': If the user is asking about the dataset's structure, like column names, variables, or what kind of data is available.
@@ -75,20 +610,28 @@ def classify_intent(user_query: str) -> dict:
 Example 1: User says "hi how are you" -> {"intent": "chitchat"}
 Example 2: User says "what are the columns in this file?" -> {"intent": "metadata_query"}
 Example 3: User says "show me the highest temperature" -> {"intent": "data_query"}"""
-    response_str = _call_ollama_generate(user_query, system_message, format="json")
+    fast_intent.record("llm")
+    response_str = await _call_ollama_generate(user_query, system_message, format="json")
     try:
-        return json.loads(response_str)
+        return {**json.loads(response_str), "source": "llm"}
     except json.JSONDecodeError:
         return {"intent": "chitchat"}
 
 
-def generate_chitchat_response(user_query: str) -> str:
-    system_message = "You are a friendly, helpful AI assistant. Respond casually to the user's greeting or question."
-    return _call_ollama_generate(user_query, system_message)
+CHITCHAT_SYSTEM_MESSAGE = "You are a friendly, helpful AI assistant. Respond casually to the user's greeting or question."
+
+
+async def generate_chitchat_response(user_query: str) -> str:
+    return await _call_ollama_generate(user_query, CHITCHAT_SYSTEM_MESSAGE)
+
+
+def stream_chitchat_response(user_query: str):
+    """Async iterator over the chitchat reply's tokens."""
+    return _stream_ollama_generate(user_query, CHITCHAT_SYSTEM_MESSAGE)
 
 
 # --- MODIFIED: llm_nlp_to_sql now has a much more advanced prompt ---
-def llm_nlp_to_sql(user_query: str, db_schema_and_sample: str) -> str:
+async def llm_nlp_to_sql(user_query: str, db_schema_and_sample: str) -> str:
     """Uses the AI to convert a data query into SQL, now with advanced capabilities."""
     system_message = f"""You are a world-class SQLite expert. Your job is to convert a user's question into a single, precise SQLite query.
 - Use aggregate functions like MIN(), MAX(), AVG(), SUM(), and COUNT() when asked for ranges, averages, totals, or counts.
@@ -112,7 +655,7 @@ User Question: "count how many entries there are for each 'number' and show the
 SQL Query: SELECT number, COUNT(*) FROM data GROUP BY number ORDER BY COUNT(*) DESC LIMIT 5;
 --- END EXAMPLES ---
 """
-    sql_query = _call_ollama_generate(user_query, system_message)
+    sql_query = await _call_ollama_generate(user_query, system_message)
     if not sql_query.lower().startswith("select") or not sql_query.endswith(";"):
         return "SELECT 'Error: AI failed to generate a valid SQL query. Please rephrase your question.';"
     return sql_query
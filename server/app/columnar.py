@@ -0,0 +1,186 @@
+import os
+import threading
+import time
+
+import pandas as pd
+
+try:
+    import duckdb
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Optional: without them every query runs on SQLite
+    duckdb = pa = pq = None
+
+PARQUET_DIR = "argo_data_parquet"
+
+
+class QueryInterrupted(Exception):
+    """Raised when a DuckDB query is stopped by its timeout."""
+
+
+class QueryRejected(ValueError):
+    """Raised for generated SQL that is anything but a single SELECT statement."""
+
+
+def available() -> bool:
+    return duckdb is not None
+
+
+def parquet_path(table_name: str) -> str:
+    return os.path.join(PARQUET_DIR, f"{table_name}.parquet")
+
+
+def timestamps_to_text(df: pd.DataFrame) -> pd.DataFrame:
+    """Matches the SQLite backend, which returns timestamps as text."""
+    for col in df.columns:
+        if pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = df[col].map(lambda t: None if pd.isna(t) else t.isoformat(" "))
+    return df
+
+
+def normalize_chunk(df: pd.DataFrame) -> pd.DataFrame:
+    """Decodes the bytes that NetCDF character variables come through as."""
+    df = df.copy()
+    for col in df.columns:
+        if df[col].dtype == object:
+            df[col] = df[col].map(lambda v: v.decode("utf-8", "replace") if isinstance(v, bytes) else v)
+    return df
+
+
+class ParquetSink:
+    """
+    Writes ingestion chunks to a Parquet file next to the SQLite table, one row
+    group per chunk. The file is written under a staging name and moved over
+    the table's file by commit(), mirroring the SQLite staging-table swap.
+    """
+
+    def __init__(self, table_name: str, staging_name: str):
+        os.makedirs(PARQUET_DIR, exist_ok=True)
+        self.path = parquet_path(table_name)
+        self.staging_path = parquet_path(staging_name)
+        self._writer = None
+        self._schema = None
+
+    def write(self, df: pd.DataFrame):
+        if self._writer is None:
+            schema = pa.Schema.from_pandas(df, preserve_index=False)
+            # Text columns may be all-null in the first chunk; pin them to string
+            for i, field in enumerate(schema):
+                if pa.types.is_null(field.type):
+                    schema = schema.set(i, field.with_type(pa.string()))
+            self._schema = schema.remove_metadata()
+            self._writer = pq.ParquetWriter(self.staging_path, self._schema)
+        self._writer.write_table(pa.Table.from_pandas(df, schema=self._schema, preserve_index=False))
+
+    def commit(self):
+        self._writer.close()
+        self._writer = None
+        os.replace(self.staging_path, self.path)
+
+    def abort(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if os.path.exists(self.staging_path):
+            os.remove(self.staging_path)
+
+
+def check_select(sql_query: str):
+    """
+    Parses the query with DuckDB's parser and raises QueryRejected unless it is
+    exactly one SELECT statement (COPY, ATTACH, SET, INSTALL and any second
+    statement are refused). SQL DuckDB cannot parse raises duckdb.Error.
+    """
+    statements = duckdb.extract_statements(sql_query)
+    if len(statements) != 1 or statements[0].type != duckdb.StatementType.SELECT:
+        kinds = ", ".join(s.type.name for s in statements) or "nothing"
+        raise QueryRejected(f"Only a single SELECT statement can be run, got: {kinds}.")
+
+
+class DuckDBBackend:
+    """
+    Runs the same SQL the LLM writes for SQLite on DuckDB, a vectorized
+    columnar engine, over the Parquet files written at ingest. Each Parquet
+    file is exposed as a view named after its table.
+
+    Generated SQL must be a single SELECT (see check_select), and the
+    connection cannot touch files outside PARQUET_DIR: external access is
+    disabled and the configuration locked before any query runs.
+    """
+
+    name = "duckdb"
+
+    def __init__(self):
+        os.makedirs(PARQUET_DIR, exist_ok=True)
+        self._conn = duckdb.connect(database=":memory:")
+        allowed = os.path.join(os.path.abspath(PARQUET_DIR), "").replace("'", "''")
+        self._conn.execute(f"SET allowed_directories = ['{allowed}']")
+        self._conn.execute("SET enable_external_access = false")
+        self._conn.execute("SET lock_configuration = true")
+        self._views = set()
+        self._lock = threading.Lock()
+
+    def has_table(self, table_name: str) -> bool:
+        return os.path.exists(parquet_path(table_name))
+
+    def _register_views(self):
+        if not os.path.isdir(PARQUET_DIR):
+            return
+        for name in os.listdir(PARQUET_DIR):
+            table, ext = os.path.splitext(name)
+            if ext != ".parquet" or "__staging" in table or table in self._views:
+                continue
+            path = os.path.abspath(parquet_path(table)).replace("'", "''")
+            self._conn.execute(f"CREATE OR REPLACE VIEW \"{table}\" AS SELECT * FROM read_parquet('{path}')")
+            self._views.add(table)
+
+    def execute(self, sql_query: str, timeout: float = None, row_limit: int = None) -> pd.DataFrame:
+        check_select(sql_query)
+        with self._lock:
+            self._register_views()
+        # A cursor is a separate connection to the same database, safe to use per thread
+        cursor = self._conn.cursor()
+        timer = threading.Timer(timeout, cursor.interrupt) if timeout is not None else None
+        try:
+            if timer is not None:
+                timer.start()
+            relation = cursor.sql(sql_query)
+            if row_limit is not None:
+                relation = relation.limit(row_limit)
+            df = relation.df()
+        except duckdb.InterruptException as e:
+            raise QueryInterrupted(str(e)) from e
+        finally:
+            if timer is not None:
+                timer.cancel()
+            cursor.close()
+        return timestamps_to_text(df)
+
+    def iter_batches(self, sql_query: str, batch_rows: int, deadline: float = None):
+        """
+        Yields the result as DataFrames of up to batch_rows rows, streamed from
+        a DuckDB cursor. At the time.perf_counter() `deadline` the query is
+        interrupted and QueryInterrupted raised.
+        """
+        check_select(sql_query)
+        with self._lock:
+            self._register_views()
+        cursor = self._conn.cursor()
+        timer = None
+        if deadline is not None:
+            timer = threading.Timer(max(deadline - time.perf_counter(), 0), cursor.interrupt)
+            timer.start()
+        try:
+            reader = cursor.sql(sql_query).fetch_record_batch(batch_rows)
+            empty = True
+            for batch in reader:
+                empty = False
+                yield timestamps_to_text(batch.to_pandas())
+            if empty:  # Still tell the caller the columns
+                yield timestamps_to_text(reader.schema.empty_table().to_pandas())
+        except duckdb.InterruptException as e:
+            raise QueryInterrupted(str(e)) from e
+        finally:
+            if timer is not None:
+                timer.cancel()
+            cursor.close()
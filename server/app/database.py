@@ -1,7 +1,37 @@
+import asyncio
+import os
+import queue
+import re
 import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
 import pandas as pd
 
+from app import columnar, stats
+from app.processing import find_lat_lon
+
 DB_PATH = "argo_data.db"
+# "duckdb" answers queries from the columnar copy written at ingest; "sqlite" uses the row store only
+QUERY_BACKEND = os.getenv("QUERY_BACKEND", "duckdb")
+# Read-only connections (and query threads) shared by all requests
+READ_POOL_SIZE = int(os.getenv("READ_POOL_SIZE", "4"))
+# Guards against runaway generated SQL
+QUERY_TIMEOUT_S = float(os.getenv("QUERY_TIMEOUT_S", "30"))
+QUERY_ROW_LIMIT = int(os.getenv("QUERY_ROW_LIMIT", "100000"))
+# Rows per batch when a whole result is streamed out, and the limits on such exports: a
+# deadline for the whole download, a row cap and how many may run at once
+EXPORT_BATCH_ROWS = int(os.getenv("EXPORT_BATCH_ROWS", "50000"))
+EXPORT_TIMEOUT_S = float(os.getenv("EXPORT_TIMEOUT_S", "300"))
+EXPORT_ROW_LIMIT = int(os.getenv("EXPORT_ROW_LIMIT", "5000000"))
+EXPORT_CONCURRENCY = int(os.getenv("EXPORT_CONCURRENCY", "2"))
+
+# SQLite takes one writer at a time: concurrent ingestions parse their chunks in
+# parallel but take turns writing them, instead of failing with "database is locked"
+_write_lock = threading.Lock()
 
 
 def store_to_sqlite(df: pd.DataFrame, table_name: str = "data"):
@@ -13,14 +43,537 @@ def store_to_sqlite(df: pd.DataFrame, table_name: str = "data"):
     print(f"Data stored in SQLite table '{table_name}'.")
 
 
-def execute_sql_query(sql_query: str):
-    """Executes a SQL query against the SQLite database."""
-    conn = sqlite3.connect(DB_PATH)
+def _sqlite_type(dtype) -> str:
+    if pd.api.types.is_bool_dtype(dtype) or pd.api.types.is_integer_dtype(dtype):
+        return "INTEGER"
+    if pd.api.types.is_float_dtype(dtype):
+        return "REAL"
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return "TIMESTAMP"
+    return "TEXT"
+
+
+def _sqlite_rows(df: pd.DataFrame):
+    """Converts a chunk into plain Python rows, matching how to_sql stores values."""
+    df = df.copy()
+    for col in df.columns:
+        if pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = df[col].map(lambda t: None if pd.isna(t) else t.isoformat(" "))
+    df = df.astype(object).where(pd.notna(df), None)
+    return df.itertuples(index=False, name=None)
+
+
+def _columnar_enabled() -> bool:
+    return QUERY_BACKEND == "duckdb" and columnar.available()
+
+
+def _rtree_name(table_name: str) -> str:
+    return f"{table_name}_rtree"
+
+
+def _create_indexes(conn, table_name: str, columns, index_columns):
+    """
+    Creates a B-tree index per coordinate/time column and, when the table has
+    latitude and longitude, an R*Tree over them keyed by the table's rowid.
+    Runs inside the swap transaction, so the table goes live indexed.
+    """
+    lat_lon = find_lat_lon(columns)
+    wanted = [c for c in dict.fromkeys(list(index_columns or []) + list(lat_lon or [])) if c in columns]
+    for col in wanted:
+        conn.execute(f'CREATE INDEX "idx_{table_name}_{col}" ON "{table_name}" ("{col}")')
+
+    rtree = _rtree_name(table_name)
+    conn.execute(f'DROP TABLE IF EXISTS "{rtree}"')
+    if lat_lon is not None:
+        lat, lon = lat_lon
+        conn.execute(f'CREATE VIRTUAL TABLE "{rtree}" USING rtree(id, min_lat, max_lat, min_lon, max_lon)')
+        conn.execute(
+            f'INSERT INTO "{rtree}" SELECT rowid, "{lat}", "{lat}", "{lon}", "{lon}" FROM "{table_name}" '
+            f'WHERE "{lat}" IS NOT NULL AND "{lon}" IS NOT NULL'
+        )
+    print(f"Indexed '{table_name}' on {', '.join(wanted) or 'no columns'}"
+          + (f" with an R*Tree on ({lat_lon[0]}, {lat_lon[1]})." if lat_lon else "."))
+
+
+def spatial_index_hint(table_name: str = "data") -> str:
+    """
+    Prompt text telling the SQL generator how to use the R*Tree for bounding
+    boxes. Empty when there is no R*Tree or queries run on the columnar
+    backend, which cannot see it.
+    """
+    if _columnar_enabled():
+        return ""
+    rtree = _rtree_name(table_name)
+    with _get_read_pool().connection() as conn:
+        exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (rtree,)).fetchone()
+        columns = [d[0] for d in conn.execute(f'SELECT * FROM "{table_name}" LIMIT 0').description] if exists else []
+    lat_lon = find_lat_lon(columns)
+    if not exists or lat_lon is None:
+        return ""
+    lat, lon = lat_lon
+    # The R*Tree keeps float32 bounds rounded outwards, so a point on the box edge can
+    # sit just outside it: prefilter on overlap (which never misses) and re-check exactly
+    return (
+        f"For latitude/longitude box filters, use the spatial index and keep the exact condition: "
+        f"rowid IN (SELECT id FROM {rtree} WHERE max_lat >= <south> AND min_lat <= <north> "
+        f'AND max_lon >= <west> AND min_lon <= <east>) AND "{lat}" BETWEEN <south> AND <north> '
+        f'AND "{lon}" BETWEEN <west> AND <east>'
+    )
+
+
+def store_chunks_to_sqlite(chunks, table_name: str = "data", progress=None, index_columns=None, on_swap=None):
+    """
+    Replaces `table_name` with the rows of an iterable of DataFrame chunks, as
+    yielded by processing.iter_nc_chunks. Each chunk is inserted with
+    executemany in its own transaction into a staging table, so memory stays
+    bounded by the chunk size. The staging table replaces the live one in a
+    single transaction at the end, so readers never see a partial table.
+    Concurrent ingestions convert their chunks in parallel but take turns
+    writing them (and swapping) under one lock.
+
+    With the DuckDB backend available, the chunks are also written to a Parquet
+    file (see columnar.ParquetSink) that is swapped in right after the table.
+    A statistics catalog (see stats.StatsBuilder) is built from the same
+    chunks and swapped in with it.
+
+    `index_columns` (see processing.find_index_columns) are indexed when the
+    table is swapped in, together with an R*Tree on latitude/longitude.
+
+    `progress(rows, done, total)` is called after every chunk; an exception it
+    raises aborts the ingestion and leaves the live table untouched.
+    `on_swap()` is called under the write lock right after the swap, so
+    callers can tell which of several concurrent ingestions swapped last.
+
+    Returns (columns, first_chunk, total_rows).
+    """
+    staging = f"{table_name}__staging_{uuid.uuid4().hex[:8]}"
+    conn = sqlite3.connect(DB_PATH, isolation_level=None)
+    # WAL lets the pooled readers keep querying the live table while this writes
+    conn.execute("PRAGMA journal_mode=WAL")
+    sink = columnar.ParquetSink(table_name, staging) if _columnar_enabled() else None
+    catalog = stats.StatsBuilder(table_name, staging)
+    columns, first_chunk, total_rows = [], None, 0
+    start = time.perf_counter()
+    try:
+        for df, done, total in chunks:
+            df = columnar.normalize_chunk(df)
+            if first_chunk is None:
+                first_chunk, columns = df, df.columns.tolist()
+                column_defs = ", ".join(f'"{c}" {_sqlite_type(df[c].dtype)}' for c in columns)
+                placeholders = ", ".join("?" for _ in columns)
+                insert_sql = f'INSERT INTO "{staging}" VALUES ({placeholders})'
+                with _write_lock:
+                    conn.execute(f'CREATE TABLE "{staging}" ({column_defs})')
+
+            rows = list(_sqlite_rows(df[columns]))
+            with _write_lock:
+                conn.execute("BEGIN")
+                conn.executemany(insert_sql, rows)
+                conn.execute("COMMIT")
+            if sink is not None:
+                sink.write(df[columns])
+            catalog.add(df[columns])
+            total_rows += len(df)
+
+            elapsed = time.perf_counter() - start
+            print(
+                f"Ingested {total_rows:,} rows into '{table_name}' "
+                f"({done}/{total}, {done / total:.0%}; {total_rows / elapsed:,.0f} rows/s)"
+            )
+            if progress is not None:
+                progress(total_rows, done, total)
+
+        if not total_rows:
+            raise ValueError("Processed DataFrame is empty or contains only NaN values.")
+
+        # Swap the finished table in atomically, together with its catalog and columnar copy
+        with _write_lock:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(f'DROP TABLE IF EXISTS "{table_name}"')
+            conn.execute(f'ALTER TABLE "{staging}" RENAME TO "{table_name}"')
+            _create_indexes(conn, table_name, columns, index_columns)
+            conn.execute("COMMIT")
+            catalog.commit()
+            if sink is not None:
+                sink.commit()
+            elif os.path.exists(columnar.parquet_path(table_name)):
+                # A columnar copy from an earlier ingest would now be stale
+                os.remove(columnar.parquet_path(table_name))
+            if on_swap is not None:
+                on_swap()
+    finally:
+        catalog.abort()
+        if sink is not None:
+            sink.abort()
+        with _write_lock:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            conn.execute(f'DROP TABLE IF EXISTS "{staging}"')
+        conn.close()
+    return columns, first_chunk, total_rows
+
+
+_columnar_backend = None
+
+
+def _get_columnar_backend():
+    global _columnar_backend
+    if _columnar_backend is None and _columnar_enabled():
+        _columnar_backend = columnar.DuckDBBackend()
+    return _columnar_backend
+
+
+def explain_query_plan(conn, sql_query: str) -> list:
+    """SQLite's EXPLAIN QUERY PLAN details, e.g. 'SEARCH data USING INDEX idx_data_time (time>?)'."""
+    return [row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql_query}").fetchall()]
+
+
+def _log_query_plan(conn, sql_query: str):
     try:
-        df = pd.read_sql_query(sql_query, conn)
+        plan = explain_query_plan(conn, sql_query)
+    except sqlite3.Error:
+        return  # The query itself will report the error
+    if not plan:
+        return
+    uses_index = any("USING" in step and "INDEX" in step or "VIRTUAL TABLE" in step for step in plan)
+    print(f"Query plan ({'indexed' if uses_index else 'full scan'}): {' | '.join(plan)}")
+
+
+class QueryTimeout(Exception):
+    """Raised when a query runs longer than QUERY_TIMEOUT_S (or an export longer than EXPORT_TIMEOUT_S)."""
+
+
+class ExportsBusy(Exception):
+    """Raised when EXPORT_CONCURRENCY exports are already running."""
+
+
+# Authorizer actions refused on pooled connections. Writes already fail there (read-only,
+# query_only), but the R*Tree module prepares them internally, so they are not denied here
+_DENIED_ACTIONS = {
+    getattr(sqlite3, name)
+    for name in dir(sqlite3)
+    if name.startswith(("SQLITE_CREATE_", "SQLITE_DROP_"))
+} | {
+    sqlite3.SQLITE_ATTACH, sqlite3.SQLITE_DETACH, sqlite3.SQLITE_PRAGMA, sqlite3.SQLITE_ALTER_TABLE,
+    sqlite3.SQLITE_TRANSACTION, sqlite3.SQLITE_SAVEPOINT, sqlite3.SQLITE_ANALYZE, sqlite3.SQLITE_REINDEX,
+}
+
+
+def _authorize_read(action, *_):
+    return sqlite3.SQLITE_DENY if action in _DENIED_ACTIONS else sqlite3.SQLITE_OK
+
+
+def _read_connection(db_path: str):
+    """A read-only connection that can only run queries."""
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, check_same_thread=False)
+    conn.execute("PRAGMA query_only = ON")
+    conn.set_authorizer(_authorize_read)
+    return conn
+
+
+class ReadPool:
+    """
+    Up to `size` read-only SQLite connections, opened on first use and reused
+    across requests. In WAL mode they read concurrently with each other and
+    with a running ingestion.
+    """
+
+    def __init__(self, db_path: str, size: int):
+        self.db_path = db_path
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def _connect(self):
+        return _read_connection(self.db_path)
+
+    @contextmanager
+    def connection(self):
+        self._slots.acquire()
+        try:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self._connect()
+            try:
+                yield conn
+            finally:
+                self._idle.put(conn)
+        finally:
+            self._slots.release()
+
+
+_read_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_read_pool() -> ReadPool:
+    global _read_pool
+    with _pool_lock:
+        if _read_pool is None or _read_pool.db_path != DB_PATH:
+            _read_pool = ReadPool(DB_PATH, READ_POOL_SIZE)
+        return _read_pool
+
+
+def _sqlite_query(sql_query: str, log_plan: bool = False, timeout: float = None, row_limit: int = None) -> pd.DataFrame:
+    with _get_read_pool().connection() as conn:
+        if log_plan:
+            _log_query_plan(conn, sql_query)
+        if timeout is not None:
+            deadline = time.perf_counter() + timeout
+            conn.set_progress_handler(lambda: time.perf_counter() > deadline, 10_000)
+        try:
+            cursor = conn.execute(sql_query)
+            rows = cursor.fetchall() if row_limit is None else cursor.fetchmany(row_limit + 1)
+            columns = [d[0] for d in cursor.description or []]
+            cursor.close()
+        except sqlite3.DatabaseError as e:
+            if timeout is not None and "interrupted" in str(e):
+                raise QueryTimeout(f"Query exceeded {timeout:g} s and was stopped.") from e
+            if "not authorized" in str(e) or "one statement at a time" in str(e):
+                raise columnar.QueryRejected("Only a single SELECT statement can be run.") from e
+            raise
+        finally:
+            conn.set_progress_handler(None, 0)
+    return _limit_rows(pd.DataFrame.from_records(rows, columns=columns, coerce_float=True), row_limit)
+
+
+def _limit_rows(df: pd.DataFrame, row_limit: int = None) -> pd.DataFrame:
+    """Cuts a result fetched with row_limit + 1 rows down to row_limit, marking it truncated."""
+    truncated = row_limit is not None and len(df) > row_limit
+    if truncated:
+        df = df.iloc[:row_limit]
+    df.attrs["truncated"] = truncated
+    return df
+
+
+def _catalog_answer(sql_query: str, table_name: str):
+    catalog = stats.load_catalog(table_name)
+    df = catalog.answer(sql_query) if catalog is not None else None
+    stats.record(df is not None)
+    if df is not None:
+        print(f"Answered from the statistics catalog without scanning '{table_name}'.")
+        df.attrs["truncated"] = False
+    return df
+
+
+def execute_sql_query(sql_query: str, table_name: str = "data", row_limit: int = QUERY_ROW_LIMIT, use_catalog: bool = True):
+    """
+    Executes a SQL query, on the columnar backend when one is configured and
+    has the table, otherwise (or if it rejects the query) on SQLite. Queries
+    are stopped after QUERY_TIMEOUT_S. Only the first row_limit rows are
+    fetched (df.attrs["truncated"] says whether there were more).
+
+    Whole-column MIN/MAX/COUNT/AVG queries are answered from the table's
+    statistics catalog instead, unless use_catalog is False.
+
+    Only a single read-only SELECT runs; anything else is refused by both
+    backends (columnar.QueryRejected) and gives an empty result, as do other
+    SQL errors. A query stopped by the timeout raises QueryTimeout.
+    """
+    backend = _get_columnar_backend()
+    try:
+        if use_catalog:
+            df = _catalog_answer(sql_query, table_name)
+            if df is not None:
+                return df
+        df = None
+        if backend is not None and backend.has_table(table_name):
+            try:
+                df = _limit_rows(backend.execute(sql_query, timeout=QUERY_TIMEOUT_S, row_limit=row_limit + 1), row_limit)
+            except columnar.QueryInterrupted as e:
+                raise QueryTimeout(f"Query exceeded {QUERY_TIMEOUT_S:g} s and was stopped.") from e
+            except columnar.QueryRejected:
+                raise
+            except Exception as e:
+                print(f"{backend.name} could not run the query, falling back to SQLite: {e}")
+        if df is None:
+            df = _sqlite_query(sql_query, log_plan=True, timeout=QUERY_TIMEOUT_S, row_limit=row_limit)
+        if df.attrs["truncated"] and row_limit == QUERY_ROW_LIMIT:
+            print(f"Query result truncated to {row_limit:,} rows.")
         return df
+    except QueryTimeout as e:
+        print(f"SQL Execution Error: {e}")
+        raise
     except Exception as e:
         print(f"SQL Execution Error: {e}")
         return pd.DataFrame()
+
+
+def _subquery(sql_query: str) -> str:
+    return sql_query.strip().rstrip(";").strip()
+
+
+def count_query_rows(sql_query: str, table_name: str = "data"):
+    """Number of rows the query returns, counted by the database rather than fetched; None on error or timeout."""
+    try:
+        df = execute_sql_query(
+            f"SELECT COUNT(*) AS row_count FROM ({_subquery(sql_query)}) AS q", table_name, row_limit=1, use_catalog=False
+        )
+    except QueryTimeout:
+        return None
+    return None if df.empty else int(df.iloc[0, 0])
+
+
+# Quoted text, comments, parentheses and the clauses looked for at the top level of a statement
+_CLAUSE_TOKEN_RE = re.compile(
+    r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|`[^`]*`|--[^\n]*|/\*.*?\*/|[()]|\bORDER\s+BY\b|\bLIMIT\b",
+    re.I | re.S,
+)
+_LIMIT_RE = re.compile(r"LIMIT\s+(\d+)(?:\s+OFFSET\s+(\d+)|\s*,\s*(\d+))?\s*$", re.I)
+
+
+def _top_level_clauses(sql_query: str):
+    """Offsets of the statement's own ORDER BY and LIMIT (None when absent), ignoring subqueries."""
+    depth, found = 0, {"ORDER": None, "LIMIT": None}
+    for match in _CLAUSE_TOKEN_RE.finditer(sql_query):
+        token = match.group(0)
+        if token == "(":
+            depth += 1
+        elif token == ")":
+            depth -= 1
+        elif depth == 0 and token[0].isalpha():
+            found[token.split()[0].upper()] = match.start()
+    return found["ORDER"], found["LIMIT"]
+
+
+def ordered_sql(sql_query: str, n_columns: int = None) -> str:
+    """
+    The query with a repeatable row order, for paging and exports: its own
+    top-level ORDER BY if it has one, otherwise a sort by all n_columns
+    result columns (none without n_columns).
+    """
+    sql_query = _subquery(sql_query)
+    if not n_columns or _top_level_clauses(sql_query)[0] is not None:
+        return sql_query
+    return f"SELECT * FROM ({sql_query}) AS q ORDER BY {', '.join(str(i) for i in range(1, n_columns + 1))}"
+
+
+def page_sql_query(sql_query: str, offset: int, limit: int, table_name: str = "data", n_columns: int = None):
+    """
+    Rows offset to offset + limit of the query's result, in the order of
+    ordered_sql(): the same as exports, and as the preview for queries with
+    their own ORDER BY. Ordered queries are paged by their own LIMIT/OFFSET
+    (merged with one they already have); without any order the page order is
+    whatever the database produces, which may differ between calls.
+    """
+    sql_query = ordered_sql(sql_query, n_columns)
+    order_at, limit_at = _top_level_clauses(sql_query)
+    own_limit = _LIMIT_RE.match(sql_query[limit_at:]) if limit_at is not None else None
+    if order_at is not None and limit_at is None:
+        paged = f"{sql_query} LIMIT {int(limit)} OFFSET {int(offset)}"
+    elif order_at is not None and own_limit is not None:
+        # SQLite's "LIMIT a, b" is offset a, limit b
+        if own_limit.group(3) is not None:
+            own_offset, own_count = int(own_limit.group(1)), int(own_limit.group(3))
+        else:
+            own_offset, own_count = int(own_limit.group(2) or 0), int(own_limit.group(1))
+        count = max(0, min(int(limit), own_count - int(offset)))
+        paged = f"{sql_query[:limit_at]}LIMIT {count} OFFSET {own_offset + int(offset)}"
+    else:
+        paged = f"SELECT * FROM ({sql_query}) AS q LIMIT {int(limit)} OFFSET {int(offset)}"
+    return execute_sql_query(paged, table_name, row_limit=limit, use_catalog=False)
+
+
+def _sqlite_batches(sql_query: str, batch_rows: int, deadline: float):
+    # A connection of its own: a slow download must not hold one of the pool's
+    conn = _read_connection(DB_PATH)
+    conn.set_progress_handler(lambda: time.perf_counter() > deadline, 10_000)
+    try:
+        cursor = conn.execute(sql_query)
+        columns = [d[0] for d in cursor.description or []]
+        empty = True
+        while True:
+            rows = cursor.fetchmany(batch_rows)
+            if not rows:
+                break
+            empty = False
+            yield pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+        if empty:
+            yield pd.DataFrame(columns=columns)
+    except sqlite3.DatabaseError as e:
+        if "interrupted" in str(e):
+            raise QueryTimeout("Export stopped at its deadline.") from e
+        if "not authorized" in str(e) or "one statement at a time" in str(e):
+            raise columnar.QueryRejected("Only a single SELECT statement can be run.") from e
+        raise
     finally:
         conn.close()
+
+
+def _export_batches(sql_query: str, table_name: str, batch_rows: int, deadline: float):
+    backend = _get_columnar_backend()
+    if backend is not None and backend.has_table(table_name):
+        batches = backend.iter_batches(sql_query, batch_rows, deadline=deadline)
+        try:
+            first = next(batches)
+        except columnar.QueryRejected:
+            raise
+        except columnar.QueryInterrupted as e:
+            raise QueryTimeout("Export stopped at its deadline.") from e
+        except Exception as e:
+            print(f"{backend.name} could not run the query, falling back to SQLite: {e}")
+        else:
+            yield first
+            try:
+                yield from batches
+            except columnar.QueryInterrupted as e:
+                raise QueryTimeout("Export stopped at its deadline.") from e
+            return
+    yield from _sqlite_batches(sql_query, batch_rows, deadline)
+
+
+_export_slots = threading.BoundedSemaphore(EXPORT_CONCURRENCY)
+
+
+def iter_query_batches(sql_query: str, table_name: str = "data", batch_rows: int = EXPORT_BATCH_ROWS,
+                       timeout: float = EXPORT_TIMEOUT_S, row_limit: int = EXPORT_ROW_LIMIT):
+    """
+    Yields the result of a query as DataFrames of up to batch_rows rows, read
+    from a cursor as they are consumed; an empty result still yields one
+    empty frame carrying the columns. At most EXPORT_CONCURRENCY of these run
+    at once (ExportsBusy otherwise). Each stops with QueryTimeout once
+    `timeout` seconds have passed since it started, including time spent
+    waiting for the consumer, and yields no more than row_limit rows.
+    Errors are raised.
+    """
+    if not _export_slots.acquire(blocking=False):
+        raise ExportsBusy(f"{EXPORT_CONCURRENCY} exports are already running; try again shortly.")
+    deadline = time.perf_counter() + timeout
+    batches = _export_batches(sql_query, table_name, batch_rows, deadline)
+    try:
+        yielded = 0
+        for batch in batches:
+            if time.perf_counter() > deadline:
+                raise QueryTimeout("Export stopped at its deadline.")
+            if yielded + len(batch) > row_limit:
+                yield batch.iloc[:row_limit - yielded]
+                print(f"Export stopped at the {row_limit} row limit.")
+                return
+            yielded += len(batch)
+            yield batch
+    except QueryTimeout as e:
+        raise QueryTimeout(f"Export exceeded {timeout:g} s and was stopped.") from e
+    finally:
+        batches.close()
+        _export_slots.release()
+
+
+_query_executor = ThreadPoolExecutor(max_workers=READ_POOL_SIZE, thread_name_prefix="sql")
+
+
+async def execute_sql_query_async(sql_query: str, table_name: str = "data", row_limit: int = QUERY_ROW_LIMIT):
+    """execute_sql_query on the query thread pool, so the event loop keeps serving requests."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_query_executor, execute_sql_query, sql_query, table_name, row_limit)
+
+
+async def count_query_rows_async(sql_query: str, table_name: str = "data"):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_query_executor, count_query_rows, sql_query, table_name)
+
+
+async def page_sql_query_async(sql_query: str, offset: int, limit: int, table_name: str = "data", n_columns: int = None):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _query_executor, page_sql_query, sql_query, offset, limit, table_name, n_columns
+    )
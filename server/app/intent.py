@@ -0,0 +1,163 @@
+import re
+import threading
+
+import numpy as np
+
+INTENTS = ("chitchat", "metadata_query", "data_query")
+
+# A query matching exactly one of the data/metadata rules gets that intent; matching both is
+# ambiguous and left to the later stages. The chitchat rule only applies when neither matched.
+METADATA_RULE = re.compile(
+    r"\b(columns?|variables?|fields?|features?|schema|attributes|dimensions|units?)\b"
+    r"|\bwhat (kind of )?data\b|\bdescribe (the |this )?(data|dataset|file)\b"
+    r"|\bwhat('s| is) in (the |this )?(data|dataset|file)\b|\bwhat does \w+ (mean|stand for)\b",
+    re.I,
+)
+CHITCHAT_RULE = re.compile(
+    r"^\s*(hi|hello|hey|hiya|yo|thanks|thank you|thx|good (morning|afternoon|evening)|"
+    r"how are you|who are you|what can you do|bye|goodbye|ok(ay)?|cool|great)\b[\s!.?,]*"
+    r"(\w+[\s!.?,]*){0,4}$",
+    re.I,
+)
+
+# Words that suggest a computation over the data. Most are also everyday words ("where
+# are you from", "the sum of all fears"), so one alone decides nothing: the data rule needs
+# two different ones, or one next to a value noun or a column of the loaded table.
+DATA_SIGNALS = re.compile(
+    r"\b(max(imum)?|min(imum)?|average|avg|median|mean (of|value)|sum of|count|how many|highest|lowest|"
+    r"hottest|coldest|largest|smallest|deepest|top \d+|greater than|less than|above|below|between|"
+    r"where|filter|map|plot|trend|per|group(ed)? by|distribution|total)\b",
+    re.I,
+)
+DATA_NOUNS = re.compile(
+    r"\b(records?|rows?|values?|readings?|measurements?|observations?|profiles?|floats?|points?|"
+    r"locations?|temperatures?|salinity|pressure|latitude|longitude|depth|precipitation)\b",
+    re.I,
+)
+
+
+def _is_data_query(query, columns=()):
+    signals = {m.group(0).lower() for m in DATA_SIGNALS.finditer(query)}
+    if len(signals) >= 2:
+        return True
+    if not signals:
+        return False
+    words = set(re.findall(r"\w+", query.lower()))
+    return DATA_NOUNS.search(query) is not None or any(str(c).lower() in words for c in columns)
+
+# Seed examples for the nearest-centroid stage: the system prompt's examples plus paraphrases
+INTENT_EXAMPLES = {
+    "chitchat": [
+        "hi how are you",
+        "hello there",
+        "good morning",
+        "thanks, that was helpful",
+        "what is your name",
+        "tell me a joke",
+        "who built you",
+        "nice to meet you",
+    ],
+    "metadata_query": [
+        "what are the columns in this file?",
+        "which variables are available",
+        "list the fields in the dataset",
+        "what kind of data did I upload",
+        "describe the dataset structure",
+        "what does this file contain",
+        "what are the units of the variables",
+        "show me the schema",
+    ],
+    "data_query": [
+        "show me the highest temperature",
+        "what is the average latitude",
+        "find the minimum t2m value",
+        "how many records are there",
+        "count entries for each number",
+        "show readings where temperature is above 300",
+        "plot the locations on a map",
+        "what was the mean value in january",
+    ],
+}
+
+
+class IntentClassifier:
+    """
+    Local first stage in front of the LLM intent classifier. Keyword rules
+    answer in microseconds. Otherwise, when the query embedding lies close
+    enough to one intent's centroid (built from INTENT_EXAMPLES) and clearly
+    closer than to the others, that intent is used. Anything else is left to
+    the LLM; record() counts which stage decided so the fallback rate shows up
+    in /metrics.
+    """
+
+    def __init__(self, examples=INTENT_EXAMPLES, min_similarity=0.6, min_margin=0.05):
+        self.examples = examples
+        self.min_similarity = min_similarity
+        self.min_margin = min_margin
+        self.labels = []
+        self.centroids = None
+        self._counts = {"rules": 0, "centroid": 0, "llm": 0}
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self):
+        return self.centroids is not None
+
+    async def build(self, embed):
+        """Embeds the examples with `embed(text) -> (1, dim) array` and computes unit centroids."""
+        labels, centroids = [], []
+        for intent, texts in self.examples.items():
+            vectors = []
+            for text in texts:
+                vector = np.ravel(await embed(text))
+                norm = np.linalg.norm(vector)
+                if norm == 0:  # Embedding failed; stay rules-only rather than retrying every example
+                    print("Intent centroids not built: embeddings unavailable.")
+                    return False
+                vectors.append(vector / norm)
+            centroid = np.mean(vectors, axis=0)
+            labels.append(intent)
+            centroids.append(centroid / np.linalg.norm(centroid))
+        self.labels, self.centroids = labels, np.stack(centroids).astype("float32")
+        print(f"Intent centroids built from {sum(len(t) for t in self.examples.values())} examples.")
+        return True
+
+    @staticmethod
+    def match_rules(query, columns=()):
+        """The intent the rules settle on, or None. `columns` are the loaded table's column names."""
+        metadata = METADATA_RULE.search(query) is not None
+        data = _is_data_query(query, columns)
+        if metadata and data:
+            return None
+        if metadata:
+            return "metadata_query"
+        if data:
+            return "data_query"
+        return "chitchat" if CHITCHAT_RULE.search(query) else None
+
+    def match_centroid(self, embedding):
+        """The nearest intent when it is a confident match, else None."""
+        if not self.ready or embedding is None:
+            return None
+        norm = np.linalg.norm(embedding)
+        if norm == 0:
+            return None
+        similarities = self.centroids @ (np.ravel(embedding) / norm)
+        order = np.argsort(similarities)[::-1]
+        best, second = similarities[order[0]], similarities[order[1]]
+        if best >= self.min_similarity and best - second >= self.min_margin:
+            return self.labels[order[0]]
+        return None
+
+    def record(self, source):
+        with self._lock:
+            self._counts[source] += 1
+
+    def stats(self):
+        with self._lock:
+            total = sum(self._counts.values())
+            return {
+                **self._counts,
+                "centroids_ready": self.ready,
+                "llm_fallback_rate": round(self._counts["llm"] / total, 4) if total else 0.0,
+            }
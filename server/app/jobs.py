@@ -0,0 +1,167 @@
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import xarray as xr
+
+from app.database import store_chunks_to_sqlite
+from app.processing import describe_columns, find_index_columns, iter_nc_chunks
+
+# Finished jobs stay visible on /jobs/{id} for this long, and at most this many of them
+INGEST_JOB_TTL_S = float(os.getenv("INGEST_JOB_TTL_S", "3600"))
+INGEST_JOB_HISTORY = int(os.getenv("INGEST_JOB_HISTORY", "100"))
+FINISHED_STAGES = ("done", "superseded", "failed", "cancelled")
+
+
+class IngestCancelled(Exception):
+    """Raised inside a running ingestion when its job was cancelled."""
+
+
+class IngestJob:
+    """State of one background NetCDF-to-SQLite conversion, as reported by /jobs/{id}."""
+
+    def __init__(self, filename: str, path: str):
+        self.id = uuid.uuid4().hex
+        self.filename = filename
+        self.path = path
+        self.stage = "queued"  # queued -> converting -> done | superseded | failed | cancelled
+        self.rows = 0
+        self.progress = 0.0
+        self.error = None
+        self.result = None
+        self.column_docs = []
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.future = None
+        self.swap_seq = None  # Order of this job's table swap among all swaps
+        self._cancel = threading.Event()
+
+    def cancel(self) -> bool:
+        """Requests cancellation. Returns False if the job already finished."""
+        if self.stage in FINISHED_STAGES:
+            return False
+        self._cancel.set()
+        if self.future is not None and self.future.cancel():
+            # Never started: no worker will pick it up to record the cancellation
+            self.stage = "cancelled"
+            self.finished = time.time()
+        return True
+
+    def on_progress(self, rows: int, done: int, total: int):
+        if self._cancel.is_set():
+            raise IngestCancelled()
+        self.rows, self.progress = rows, done / total if total else 1.0
+
+    def to_dict(self) -> dict:
+        elapsed = ((self.finished or time.time()) - self.started) if self.started else 0.0
+        return {
+            "job_id": self.id,
+            "filename": self.filename,
+            "stage": self.stage,
+            "progress": round(self.progress, 4),
+            "rows": self.rows,
+            "elapsed_s": round(elapsed, 3),
+            "rows_per_s": round(self.rows / elapsed, 1) if elapsed > 0 else 0.0,
+            "error": self.error,
+        }
+
+
+class IngestJobManager:
+    """
+    Runs uploads through chunked ingestion on a small worker pool so request
+    handlers return immediately. Each job writes a staging table that replaces
+    the live one in a single transaction, so queries keep seeing the previous
+    data until the new table is complete. Workers read and convert in
+    parallel; their SQLite writes are serialized by store_chunks_to_sqlite. `on_complete(job, columns,
+    first_chunk, total_rows)` runs on the worker after the swap. Completions
+    run one at a time, and one whose table was already replaced by a later
+    swap is skipped (the job ends "superseded"), so the app never describes a
+    table other than the live one. Finished jobs are forgotten after
+    `job_ttl_s` seconds, or beyond the newest `job_history` of them.
+    """
+
+    def __init__(self, on_complete, max_workers: int = 2, table_name: str = "data",
+                 job_ttl_s: float = INGEST_JOB_TTL_S, job_history: int = INGEST_JOB_HISTORY):
+        self.on_complete = on_complete
+        self.table_name = table_name
+        self.job_ttl_s = job_ttl_s
+        self.job_history = job_history
+        self.jobs = {}
+        self._lock = threading.Lock()
+        self._swaps = 0
+        self._activated = 0
+        self._activation_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+
+    def submit(self, filename: str, path: str) -> IngestJob:
+        job = IngestJob(filename, path)
+        with self._lock:
+            self._prune()
+            self.jobs[job.id] = job
+        job.future = self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id: str):
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def _prune(self):
+        finished = sorted(
+            (job for job in self.jobs.values() if job.stage in FINISHED_STAGES and job.finished is not None),
+            key=lambda job: job.finished,
+        )
+        cutoff = time.time() - self.job_ttl_s
+        recent = [job for job in finished if job.finished >= cutoff]
+        keep = {job.id for job in recent[len(recent) - self.job_history:]} if self.job_history > 0 else set()
+        for job in finished:
+            if job.id not in keep:
+                del self.jobs[job.id]
+
+    def _record_swap(self, job: IngestJob):
+        # Runs under the database write lock, so the numbers follow the order of the swaps
+        with self._lock:
+            self._swaps += 1
+            job.swap_seq = self._swaps
+
+    def _complete(self, job: IngestJob, columns, first_chunk, total_rows):
+        with self._activation_lock:
+            if job.swap_seq < self._activated:
+                return None
+            self._activated = job.swap_seq
+            return self.on_complete(job, columns, first_chunk, total_rows)
+
+    def _run(self, job: IngestJob):
+        job.started = time.time()
+        job.stage = "converting"
+        try:
+            with xr.open_dataset(job.path) as ds:
+                job.column_docs = describe_columns(ds)
+                columns, first_chunk, total_rows = store_chunks_to_sqlite(
+                    iter_nc_chunks(ds),
+                    table_name=self.table_name,
+                    progress=job.on_progress,
+                    index_columns=find_index_columns(ds),
+                    on_swap=lambda: self._record_swap(job),
+                )
+            job.result = self._complete(job, columns, first_chunk, total_rows)
+            if job.result is None:
+                job.stage = "superseded"
+                print(f"Ingestion job {job.id} finished, but a later upload already replaced its table.")
+            else:
+                job.stage = "done"
+                print(f"Ingestion job {job.id} finished: {total_rows:,} rows from '{job.filename}'.")
+        except IngestCancelled:
+            job.stage = "cancelled"
+            print(f"Ingestion job {job.id} cancelled.")
+        except Exception as e:
+            job.stage, job.error = "failed", str(e)
+            print(f"Ingestion job {job.id} failed: {e}")
+        finally:
+            job.finished = time.time()
+            try:
+                os.remove(job.path)
+            except OSError:
+                pass
@@ -1,6 +1,15 @@
+import math
+
+import numpy as np
 import pandas as pd
 import xarray as xr
 
+# Target number of flattened rows per ingestion chunk
+INGEST_CHUNK_ROWS = 200_000
+
+LATITUDE_NAMES = ("latitude", "lat", "nav_lat")
+LONGITUDE_NAMES = ("longitude", "lon", "long", "nav_lon")
+
 
 def get_schema_from_dataframe(df: pd.DataFrame) -> str:
     """Extracts a readable schema from a Pandas DataFrame for the LLM."""
@@ -20,3 +29,82 @@ def nc_to_dataframe(ds: xr.Dataset) -> pd.DataFrame:
     df = ds.to_dataframe().reset_index()
     # MODIFIED: Removed .dropna() to allow rows with missing values.
     return df
+
+
+def iter_nc_chunks(ds: xr.Dataset, chunk_rows: int = INGEST_CHUNK_ROWS):
+    """
+    Flattens a dataset chunk by chunk along its leading dimension, yielding
+    (df, done, total) where done/total count leading-dimension steps. The
+    concatenated chunks equal nc_to_dataframe(ds), but only one chunk is ever
+    read from disk and held in memory.
+    """
+    dims = list(ds.sizes)
+    if not dims:
+        yield nc_to_dataframe(ds), 1, 1
+        return
+
+    leading, total = dims[0], ds.sizes[dims[0]]
+    rows_per_step = math.prod(ds.sizes[d] for d in dims[1:])
+    step = max(1, chunk_rows // max(1, rows_per_step))
+
+    for start in range(0, total, step):
+        stop = min(start + step, total)
+        chunk = ds.isel({leading: slice(start, stop)})
+        yield nc_to_dataframe(chunk.load()), stop, total
+
+
+def find_index_columns(ds: xr.Dataset) -> list:
+    """
+    Columns worth indexing after ingest: the dataset's dimensions and
+    coordinates (latitude, longitude, time, ensemble `number`, ...), which
+    become columns when flattened, plus any datetime variables.
+    """
+    names = list(ds.sizes) + [c for c in ds.coords if c not in ds.sizes]
+    names += [v for v in ds.data_vars if np.issubdtype(ds[v].dtype, np.datetime64)]
+    return list(dict.fromkeys(str(n) for n in names))
+
+
+def find_lat_lon(columns):
+    """(latitude, longitude) column names, matched case-insensitively, or None."""
+    by_name = {str(c).lower(): c for c in columns}
+    lat = next((by_name[n] for n in LATITUDE_NAMES if n in by_name), None)
+    lon = next((by_name[n] for n in LONGITUDE_NAMES if n in by_name), None)
+    return (lat, lon) if lat is not None and lon is not None else None
+
+
+def _attr_text(attrs):
+    keys = ("long_name", "standard_name", "units", "description", "comment")
+    parts = [f"{k}={attrs[k]}" for k in keys if k in attrs]
+    parts += [f"{k}={v}" for k, v in attrs.items() if k not in keys and not str(k).startswith("_") and len(str(v)) <= 80]
+    return "; ".join(parts)
+
+
+def describe_columns(ds: xr.Dataset) -> list:
+    """
+    One description per table column, from the dataset's dimensions,
+    coordinates and variables: dtype, NetCDF attributes (units, long_name, ...)
+    and, for 1-D coordinates, their value range. Used as VectorDB documents so
+    the SQL prompt only needs the columns relevant to a question.
+    """
+    docs = []
+    names = list(ds.sizes) + [c for c in ds.coords if c not in ds.sizes] + list(ds.data_vars)
+    for name in dict.fromkeys(names):
+        if name in ds.variables:
+            var = ds[name]
+            kind = "coordinate" if name in ds.coords or name in ds.sizes else "variable"
+            text = f"Column `{name}` ({kind}, {var.dtype})"
+            if var.dims and var.dims != (name,):
+                text += f" over dimensions {', '.join(map(str, var.dims))}"
+            attrs = _attr_text(var.attrs)
+            if attrs:
+                text += f": {attrs}"
+            if kind == "coordinate" and var.ndim == 1 and var.size and var.dtype.kind in "iufM":
+                lo, hi = var.values.min(), var.values.max()
+                if var.dtype.kind == "M":
+                    lo, hi = np.datetime_as_string(lo, unit="s"), np.datetime_as_string(hi, unit="s")
+                text += f". Values range from {lo:.6g} to {hi:.6g}" if var.dtype.kind == "f" else f". Values range from {lo} to {hi}"
+        else:  # Dimension without a coordinate variable: an integer position
+            kind = "coordinate"
+            text = f"Column `{name}` (dimension index, int64): position along dimension {name} of size {ds.sizes[name]}"
+        docs.append({"column": str(name), "kind": kind, "text": text + "."})
+    return docs
@@ -0,0 +1,141 @@
+import itertools
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Optional: without it results export as CSV only
+    pa = pq = None
+
+# Query results that can still be paged through or exported
+RESULT_HANDLES = int(os.getenv("RESULT_HANDLES", "256"))
+
+EXPORT_MEDIA_TYPES = {
+    "csv": "text/csv",
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+class ResultHandles:
+    """
+    Remembers the SQL behind each answered data query, so its full result can
+    be fetched later without being kept in memory. A handle only stays valid
+    for the dataset version it was created against; the oldest handles are
+    dropped beyond max_entries.
+    """
+
+    def __init__(self, max_entries: int = RESULT_HANDLES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, sql_query: str, dataset_version, total_rows=None, n_columns=None) -> str:
+        result_id = uuid.uuid4().hex
+        with self._lock:
+            self._entries[result_id] = {
+                "sql": sql_query,
+                "dataset_version": dataset_version,
+                "total_rows": total_rows,
+                "n_columns": n_columns,
+                "created": time.time(),
+            }
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return result_id
+
+    def get(self, result_id: str):
+        with self._lock:
+            return self._entries.get(result_id)
+
+
+class _Drain:
+    """Write-only file object whose contents are taken out with drain() as they are produced."""
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self._parts.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data, self._parts = b"".join(self._parts), []
+        return data
+
+
+def export_formats():
+    return [f for f in EXPORT_MEDIA_TYPES if f == "csv" or pa is not None]
+
+
+def export_stream(batches, fmt: str):
+    """
+    Encodes DataFrame batches as one CSV, Arrow IPC stream or Parquet file,
+    yielding the bytes batch by batch. The first batch fixes the columns and
+    their types; later batches are cast to them.
+    """
+    if fmt not in export_formats():
+        raise ValueError(f"Unsupported export format '{fmt}'.")
+    batches = iter(batches)
+    first = next(batches)
+
+    if fmt == "csv":
+        yield first.to_csv(index=False).encode()
+        for df in batches:
+            yield df.to_csv(index=False, header=False).encode()
+        return
+
+    schema = pa.Schema.from_pandas(first, preserve_index=False)
+    for i, field in enumerate(schema):
+        if pa.types.is_null(field.type):  # All-null in the first batch; SQLite would have returned text
+            schema = schema.set(i, field.with_type(pa.string()))
+    schema = schema.remove_metadata()
+    sink = _Drain()
+    writer = pa.ipc.new_stream(sink, schema) if fmt == "arrow" else pq.ParquetWriter(sink, schema)
+    try:
+        for df in itertools.chain([first], batches):
+            writer.write_table(_conform(df, schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def _conform(df: pd.DataFrame, schema):
+    """
+    A batch as a table of `schema`. SQLite types values rather than columns, so
+    a later batch can infer another type than the first (floats after an
+    all-NULL batch, floats with NaN after integers); those are cast.
+    """
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    arrays = []
+    for column, field in zip(table.columns, schema):
+        try:
+            arrays.append(column if column.type == field.type else column.cast(field.type))
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError) as e:
+            raise ValueError(f"Column '{field.name}' changed from {field.type} to {column.type} mid-export: {e}") from e
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+def records(df: pd.DataFrame):
+    """JSON-safe rows: NaN and NaT become None."""
+    return df.astype(object).where(pd.notna(df), None).to_dict(orient="records")
@@ -0,0 +1,225 @@
+import json
+import os
+import re
+import threading
+
+import numpy as np
+import pandas as pd
+
+STATS_DIR = "argo_data_stats"
+# Bins of the value histograms kept per numeric column
+HISTOGRAM_BINS = int(os.getenv("HISTOGRAM_BINS", "16"))
+# Resolution of the per-chunk histograms the final ones are merged from
+_CHUNK_BINS = 256
+
+# SELECT of nothing but MIN/MAX/COUNT/AVG over whole columns of one table
+_AGGREGATE = r"(MIN|MAX|COUNT|AVG)\s*\(\s*(\*|\"[^\"]+\"|`[^`]+`|\[[^\]]+\]|\w+)\s*\)(?:\s+AS\s+(\"[^\"]+\"|\w+))?"
+_AGGREGATE_RE = re.compile(_AGGREGATE, re.I)
+_UNANSWERED = object()
+_CATALOG_QUERY_RE = re.compile(
+    rf"^\s*SELECT\s+({_AGGREGATE}(?:\s*,\s*{_AGGREGATE})*)\s+FROM\s+(\"[^\"]+\"|\w+)\s*;?\s*$",
+    re.I,
+)
+
+
+def stats_path(table_name: str) -> str:
+    return os.path.join(STATS_DIR, f"{table_name}.json")
+
+
+def _unquote(name: str) -> str:
+    return name[1:-1] if name[:1] in "\"`[" else name
+
+
+def _text(value):
+    return value.isoformat(" ") if isinstance(value, pd.Timestamp) else value
+
+
+class StatsBuilder:
+    """
+    Accumulates a column statistics catalog over ingestion chunks: per column
+    the non-null count, nulls, min, max and (for numbers) sum and a value
+    histogram, plus a zone map with every chunk's row range and per-column
+    min/max/nulls. NaN counts as null, as it is stored as NULL in SQLite.
+    Written under a staging name and moved into place by commit(), alongside
+    the table swap.
+    """
+
+    def __init__(self, table_name: str, staging_name: str):
+        os.makedirs(STATS_DIR, exist_ok=True)
+        self.table_name = table_name
+        self.path = stats_path(table_name)
+        self.staging_path = stats_path(staging_name)
+        self.rows = 0
+        self.columns = {}
+        self.zone_maps = []
+        self._histograms = {}
+
+    def add(self, df: pd.DataFrame):
+        zone = {"start_row": self.rows, "end_row": self.rows + len(df), "columns": {}}
+        for col in df.columns:
+            series = df[col]
+            numeric = pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series)
+            temporal = pd.api.types.is_datetime64_any_dtype(series)
+            values = series.dropna()
+            stats = self.columns.setdefault(
+                col, {"type": "number" if numeric else "time" if temporal else "text", "count": 0, "nulls": 0}
+            )
+            stats["count"] += len(values)
+            stats["nulls"] += len(series) - len(values)
+            zone["columns"][col] = {"nulls": len(series) - len(values)}
+            if values.empty or not (numeric or temporal):
+                continue
+            low, high = values.min(), values.max()
+            zone["columns"][col].update(min=_text(low.item() if numeric else low), max=_text(high.item() if numeric else high))
+            stats["min"] = low if "min" not in stats else min(stats["min"], low)
+            stats["max"] = high if "max" not in stats else max(stats["max"], high)
+            if numeric:
+                array = values.to_numpy(dtype="float64")
+                stats["sum"] = stats.get("sum", 0.0) + float(array.sum())
+                if low == high:  # Zero-width bin: the chunk holds a single distinct value
+                    histogram = (np.array([len(array)]), np.array([float(low), float(low)]))
+                else:
+                    histogram = np.histogram(array, bins=_CHUNK_BINS, range=(float(low), float(high)))
+                self._histograms.setdefault(col, []).append(histogram)
+        self.rows += len(df)
+        self.zone_maps.append(zone)
+
+    def _merged_histogram(self, col, low, high):
+        """Re-bins the chunk histograms onto HISTOGRAM_BINS bins over the column's range."""
+        if low == high:
+            return {"edges": [low, high], "counts": [self.columns[col]["count"]]}
+        edges = np.linspace(low, high, HISTOGRAM_BINS + 1)
+        counts = np.zeros(HISTOGRAM_BINS)
+        for chunk_counts, chunk_edges in self._histograms[col]:
+            # Spread each fine bin over the bins it overlaps, in proportion to the overlap
+            left, right = chunk_edges[:-1], chunk_edges[1:]
+            width = np.maximum(right - left, 1e-300)
+            overlap = np.clip(
+                np.minimum(right[:, None], edges[None, 1:]) - np.maximum(left[:, None], edges[None, :-1]), 0, None
+            )
+            single = right == left
+            overlap[single] = (left[single, None] >= edges[None, :-1]) & (
+                (left[single, None] < edges[None, 1:]) | (edges[None, 1:] == high)
+            )
+            overlap[~single] /= width[~single, None]
+            counts += overlap.T @ chunk_counts
+        return {"edges": edges.tolist(), "counts": np.round(counts).astype(int).tolist()}
+
+    def catalog(self) -> dict:
+        columns = {}
+        for col, stats in self.columns.items():
+            entry = {"type": stats["type"], "count": stats["count"], "nulls": stats["nulls"]}
+            if "min" in stats:
+                if stats["type"] == "number":
+                    low, high = stats["min"].item(), stats["max"].item()
+                    entry.update(min=low, max=high, mean=stats["sum"] / stats["count"])
+                    entry["histogram"] = self._merged_histogram(col, low, high)
+                else:
+                    entry.update(min=_text(stats["min"]), max=_text(stats["max"]))
+            columns[str(col)] = entry
+        return {"table": self.table_name, "rows": self.rows, "columns": columns, "zone_maps": self.zone_maps}
+
+    def commit(self):
+        with open(self.staging_path, "w") as f:
+            json.dump(self.catalog(), f, default=str)
+        os.replace(self.staging_path, self.path)
+
+    def abort(self):
+        if os.path.exists(self.staging_path):
+            os.remove(self.staging_path)
+
+
+class StatsCatalog:
+    """
+    The persisted statistics of one table. answer() serves whole-column
+    MIN/MAX/COUNT/AVG queries without touching the table.
+    """
+
+    def __init__(self, catalog: dict):
+        self.table_name = catalog["table"]
+        self.rows = catalog["rows"]
+        self.columns = catalog["columns"]
+        self.zone_maps = catalog["zone_maps"]
+        self._by_name = {c.lower(): c for c in self.columns}
+
+    def _aggregate(self, func: str, column: str):
+        """The aggregate's value (None for SQL NULL), or _UNANSWERED."""
+        if column == "*":
+            return self.rows if func == "COUNT" else _UNANSWERED
+        name = self._by_name.get(column.lower())
+        if name is None:
+            return _UNANSWERED
+        stats = self.columns[name]
+        if func == "COUNT":
+            return stats["count"]
+        if stats["type"] == "text" or (func == "AVG" and stats["type"] != "number"):
+            return _UNANSWERED
+        return stats.get("mean" if func == "AVG" else func.lower())
+
+    def answer(self, sql_query: str):
+        """A one-row DataFrame answering the query from the catalog, or None if it needs the table."""
+        match = _CATALOG_QUERY_RE.match(sql_query)
+        if match is None or _unquote(match.group(len(match.groups()))).lower() != self.table_name.lower():
+            return None
+        row = {}
+        for aggregate in _AGGREGATE_RE.finditer(match.group(1)):
+            func, column, alias = aggregate.group(1).upper(), _unquote(aggregate.group(2)), aggregate.group(3)
+            value = self._aggregate(func, column)
+            if value is _UNANSWERED:
+                return None
+            # Named the way SQLite names result columns: the alias, else the expression as written
+            row[_unquote(alias) if alias else aggregate.group(0)] = value
+        return pd.DataFrame([row])
+
+    def describe(self, columns=None) -> str:
+        """One line per column with its count, nulls and range, for the SQL prompt."""
+        lines = []
+        for col in columns if columns is not None else self.columns:
+            stats = self.columns.get(col)
+            if stats is None:
+                continue
+            line = f"{col} ({stats['type']}): {stats['count']:,} values, {stats['nulls']:,} nulls"
+            if "min" in stats:
+                line += f", min {stats['min']}, max {stats['max']}"
+            if "mean" in stats:
+                line += f", mean {stats['mean']:.6g}"
+            lines.append(line)
+        return "\n".join(lines)
+
+
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+_bypass = {"answered": 0, "table": 0}
+
+
+def load_catalog(table_name: str):
+    """The table's catalog, reloaded whenever a new ingest replaced the file; None if there is none."""
+    path = stats_path(table_name)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    with _catalogs_lock:
+        cached = _catalogs.get(table_name)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+    with open(path) as f:
+        catalog = StatsCatalog(json.load(f))
+    with _catalogs_lock:
+        _catalogs[table_name] = (mtime, catalog)
+    return catalog
+
+
+def record(answered: bool):
+    with _catalogs_lock:
+        _bypass["answered" if answered else "table"] += 1
+
+
+def bypass_stats():
+    with _catalogs_lock:
+        total = _bypass["answered"] + _bypass["table"]
+        return {
+            "answered_from_catalog": _bypass["answered"],
+            "ran_on_table": _bypass["table"],
+            "bypass_rate": round(_bypass["answered"] / total, 4) if total else 0.0,
+        }
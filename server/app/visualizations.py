@@ -1,29 +1,155 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
 import pandas as pd
 import folium
 
+from app.processing import find_lat_lon
+
+# Above this many distinct locations, points are aggregated into grid cells
+MAP_POINT_BUDGET = int(os.getenv("MAP_POINT_BUDGET", "5000"))
+# Rendered maps kept per (SQL, dataset version)
+MAP_CACHE_ENTRIES = int(os.getenv("MAP_CACHE_ENTRIES", "32"))
+
+_map_cache = OrderedDict()
+_map_cache_lock = threading.Lock()
+
+# Popups (and, for grid cells, a radius growing with the point count) are set in the
+# browser, so the GeoJSON carries nothing per feature beyond coordinates and counts
+_ON_EACH_FEATURE = folium.JsCode(
+    """
+    function(feature, layer) {
+        var c = feature.geometry.coordinates;
+        var text = "Lat: " + c[1].toFixed(2) + ", Lon: " + c[0].toFixed(2);
+        var count = feature.properties.count;
+        if (count !== undefined) {
+            layer.setRadius(Math.min(4 + 2 * Math.log(count), 20));
+            text = count + " points around " + text;
+        }
+        layer.bindPopup(text);
+    }
+    """
+)
+
+
+def cached_map(sql_query: str, dataset_version):
+    """The map already rendered for this query against this dataset version, or None."""
+    with _map_cache_lock:
+        html = _map_cache.get((sql_query, dataset_version))
+        if html is not None:
+            _map_cache.move_to_end((sql_query, dataset_version))
+        return html
+
+
+def _cache_map(key, html: str):
+    with _map_cache_lock:
+        _map_cache[key] = html
+        _map_cache.move_to_end(key)
+        while len(_map_cache) > MAP_CACHE_ENTRIES:
+            _map_cache.popitem(last=False)
+
 
-def map_html(df: pd.DataFrame):
-    """Generates an HTML map of filtered float locations using Folium."""
+def grid_bins(lat: np.ndarray, lon: np.ndarray, budget: int, step: float = 1.1):
+    """
+    Aggregates points into square cells, using as many of `budget` cells as
+    the data allows. The first grid covers the points' bounding box with
+    about `budget` cells (so long, thin extents get many cells along their
+    length); it is then refined while the occupied cells still fit the
+    budget, or coarsened until they do, by a factor `step` at a time.
+    Returns the mean latitude, mean longitude and point count of every
+    occupied cell.
+    """
+    lat_span, lon_span = max(np.ptp(lat), 1e-6), max(np.ptp(lon), 1e-6)
+    # At least one cell across the short side, at most `budget` along the long one
+    cell = max(np.sqrt(lat_span * lon_span / budget), max(lat_span, lon_span) / budget)
+
+    def occupied(cell):
+        rows = np.floor((lat - lat.min()) / cell).astype(np.int64)
+        cols = np.floor((lon - lon.min()) / cell).astype(np.int64)
+        _, inverse, counts = np.unique(rows * (cols.max() + 1) + cols, return_inverse=True, return_counts=True)
+        return inverse.ravel(), counts
+
+    inverse, counts = occupied(cell)
+    if len(counts) <= budget:
+        # Sparse or clustered points leave most of the bounding box empty
+        for _ in range(64):
+            finer = occupied(cell / step)
+            if len(finer[1]) > budget:
+                break
+            cell /= step
+            inverse, counts = finer
+    else:
+        while len(counts) > budget:
+            cell *= step
+            inverse, counts = occupied(cell)
+    return (
+        np.bincount(inverse, weights=lat) / counts,
+        np.bincount(inverse, weights=lon) / counts,
+        counts,
+    )
+
+
+def _feature_collection(lat, lon, counts=None):
+    lat, lon = np.round(lat, 5).tolist(), np.round(lon, 5).tolist()
+    if counts is None:
+        features = [
+            {"type": "Feature", "properties": {}, "geometry": {"type": "Point", "coordinates": [x, y]}}
+            for y, x in zip(lat, lon)
+        ]
+    else:
+        features = [
+            {"type": "Feature", "properties": {"count": n}, "geometry": {"type": "Point", "coordinates": [x, y]}}
+            for y, x, n in zip(lat, lon, counts.tolist())
+        ]
+    return {"type": "FeatureCollection", "features": features}
+
+
+def map_html(df: pd.DataFrame, cache_key=None):
+    """
+    Generates an HTML map of filtered float locations using Folium. All
+    locations go into a single GeoJSON layer; beyond MAP_POINT_BUDGET distinct
+    locations they are aggregated into grid cells first. With a cache_key, the
+    HTML is kept for cached_map().
+    """
     if df.empty:
         return "<h3>No data available to display on map.</h3>"
 
-    unique_locations = df.drop_duplicates(subset=["latitude", "longitude"])
-    if unique_locations.empty:
+    start = time.perf_counter()
+    names = find_lat_lon(df.columns)
+    if names is None:
+        raise ValueError("The result has no latitude/longitude columns.")
+    points = df[list(names)].apply(pd.to_numeric, errors="coerce").to_numpy(dtype="float64")
+    points = points[np.isfinite(points).all(axis=1)]
+    if len(points) == 0:
         return "<h3>No unique locations to display on map.</h3>"
+    points = np.unique(points, axis=0)
+    lat, lon = points[:, 0], points[:, 1]
+
+    if len(points) > MAP_POINT_BUDGET:
+        mode = "grid cells"
+        bin_lat, bin_lon, counts = grid_bins(lat, lon, MAP_POINT_BUDGET)
+        data = _feature_collection(bin_lat, bin_lon, counts)
+    else:
+        mode = "points"
+        data = _feature_collection(lat, lon)
+
+    m = folium.Map(location=[float(lat.mean()), float(lon.mean())], zoom_start=3)
+    folium.GeoJson(
+        data,
+        marker=folium.CircleMarker(radius=5, color="blue", fill=True, fill_color="blue"),
+        on_each_feature=_ON_EACH_FEATURE,
+    ).add_to(m)
+    if len(points) > 1:
+        m.fit_bounds([[float(lat.min()), float(lon.min())], [float(lat.max()), float(lon.max())]])
 
-    center_lat = unique_locations["latitude"].mean()
-    center_lon = unique_locations["longitude"].mean()
-    m = folium.Map(location=[center_lat, center_lon], zoom_start=3)
-
-    for _, row in unique_locations.iterrows():
-        popup_text = f"Lat: {row['latitude']:.2f}, Lon: {row['longitude']:.2f}"
-        folium.CircleMarker(
-            [row["latitude"], row["longitude"]],
-            radius=5,
-            color="blue",
-            fill=True,
-            fill_color="blue",
-            popup=popup_text,
-        ).add_to(m)
-
-    return m._repr_html_()
+    html = m._repr_html_()
+    print(
+        f"Map of {len(points):,} locations rendered as {len(data['features']):,} {mode} "
+        f"in {(time.perf_counter() - start) * 1000.0:.0f} ms ({len(html) / 1e6:.2f} MB)."
+    )
+    if cache_key is not None:
+        _cache_map(cache_key, html)
+    return html
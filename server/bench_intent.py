@@ -0,0 +1,85 @@
+"""
+Accuracy and fallback rate of the intent classifier stages on a labeled question set.
+
+    python bench_intent.py                      # rules only, no Ollama needed
+    python bench_intent.py --centroids          # + nearest-centroid stage (needs embeddings)
+    python bench_intent.py --centroids --llm    # full pipeline, phi3 on the remaining questions
+
+Set OLLAMA_URL to point at a different server (or ollama_stub.py). Items marked
+"split": "holdout" were written without looking at the rules and are reported
+separately; keep them out of any rule tuning.
+"""
+import argparse
+import asyncio
+import json
+import time
+from collections import Counter
+
+from app.ai_core import classify_intent, fast_intent, get_ollama_embedding, ollama
+from app.intent import IntentClassifier
+
+
+def load(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+async def run(args):
+    items = load(args.data)
+    columns = args.columns.split(",")
+    decided, correct, undecided = Counter(), Counter(), []
+    holdout = Counter()
+
+    start = time.perf_counter()
+    rules = [IntentClassifier.match_rules(item["query"], columns) for item in items]
+    rules_us = (time.perf_counter() - start) / len(items) * 1e6
+
+    if args.centroids:
+        await fast_intent.build(get_ollama_embedding)
+
+    for item, rule in zip(items, rules):
+        if rule is not None:
+            stage, intent = "rules", rule
+        elif args.centroids and fast_intent.ready:
+            intent = fast_intent.match_centroid(await get_ollama_embedding(item["query"]))
+            stage = "centroid"
+        else:
+            intent = None
+        if intent is None and args.llm:
+            stage, intent = "llm", (await classify_intent(item["query"], columns=columns)).get("intent")
+        if item.get("split") == "holdout":
+            holdout["items"] += 1
+            holdout["decided"] += intent is not None
+            holdout["correct"] += intent == item["intent"]
+        if intent is None:
+            undecided.append(item)
+            continue
+        decided[stage] += 1
+        correct[stage] += intent == item["intent"]
+        if intent != item["intent"]:
+            print(f"  [{stage}] {item['query']!r}: predicted {intent}, labeled {item['intent']}")
+
+    print(f"\n{len(items)} labeled questions; rules take {rules_us:.1f} us per question")
+    print(f"{'stage':<10}{'decided':>9}{'accuracy':>10}")
+    for stage in ("rules", "centroid", "llm"):
+        if decided[stage]:
+            print(f"{stage:<10}{decided[stage]:>9}{correct[stage] / decided[stage]:>10.1%}")
+    local = decided["rules"] + decided["centroid"]
+    print(f"\nLLM fallback rate: {1 - local / len(items):.1%}"
+          + (f" (undecided without --llm: {len(undecided)})" if not args.llm else ""))
+    if sum(decided.values()):
+        print(f"Overall accuracy on decided questions: {sum(correct.values()) / sum(decided.values()):.1%}")
+    if holdout["decided"]:
+        print(f"Holdout: {holdout['decided']} of {holdout['items']} decided, "
+              f"{holdout['correct'] / holdout['decided']:.1%} of those correct")
+    await ollama.aclose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--data", default="intent_benchmark.jsonl", help="JSONL with query and intent fields")
+    parser.add_argument("--centroids", action="store_true", help="Evaluate the nearest-centroid stage")
+    parser.add_argument("--llm", action="store_true", help="Send undecided questions to the LLM")
+    parser.add_argument("--columns", default="time,latitude,longitude,t2m,d2m,tp,u10,v10,temperature,pressure,salinity",
+                        help="Comma-separated column names of the table the questions are asked against")
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,102 @@
+"""
+Query benchmark: the SQLite row store versus the DuckDB/Parquet columnar backend.
+
+    python bench_query.py --nc era5.nc --iters 5
+    python bench_query.py --grid 200x180x360      # synthetic (time, latitude, longitude) grid
+
+Both backends are loaded through the normal chunked ingestion into a scratch
+directory, checked to return the same results, then timed on queries of the
+kind llm_nlp_to_sql generates.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from app import columnar, database
+from app.processing import iter_nc_chunks
+
+# Representative generated SQL; {value} is the first data variable
+QUERIES = {
+    "count": "SELECT COUNT(*) AS n FROM data",
+    "min_max": "SELECT MIN({value}) AS lo, MAX({value}) AS hi FROM data",
+    "avg_by_time": "SELECT time, AVG({value}) AS mean FROM data GROUP BY time ORDER BY time",
+    "avg_by_lat": "SELECT latitude, AVG({value}) AS mean FROM data GROUP BY latitude ORDER BY latitude",
+    "bbox_filter": "SELECT latitude, longitude, {value} FROM data WHERE latitude BETWEEN 10 AND 20 "
+                   "AND longitude BETWEEN 70 AND 80",
+    "threshold": "SELECT COUNT(*) AS n FROM data WHERE {value} > (SELECT AVG({value}) FROM data)",
+    "top_10": "SELECT latitude, longitude, {value} FROM data ORDER BY {value} DESC LIMIT 10",
+}
+
+
+def synthetic_grid(spec):
+    n_time, n_lat, n_lon = (int(v) for v in spec.split("x"))
+    rng = np.random.default_rng(0)
+    return xr.Dataset(
+        {"t2m": (("time", "latitude", "longitude"), rng.normal(290, 10, (n_time, n_lat, n_lon)).astype("float32"))},
+        coords={
+            "time": pd.date_range("2020-01-01", periods=n_time, freq="h"),
+            "latitude": np.linspace(-90, 90, n_lat),
+            "longitude": np.linspace(0, 360, n_lon, endpoint=False),
+        },
+    )
+
+
+def _time(fn, iters):
+    timings = []
+    for _ in range(iters):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000.0)
+    return float(np.median(timings))
+
+
+def _same(a, b):
+    if a.shape != b.shape:
+        return False
+    for col in a.columns:
+        x, y = a[col], b[col]
+        if pd.api.types.is_numeric_dtype(x) and pd.api.types.is_numeric_dtype(y):
+            if not np.allclose(x.to_numpy(float), y.to_numpy(float), rtol=1e-5, equal_nan=True):
+                return False
+        elif not (x.astype(str).str.rstrip("0").to_numpy() == y.astype(str).str.rstrip("0").to_numpy()).all():
+            return False
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--nc", help="NetCDF file to ingest")
+    parser.add_argument("--grid", default="100x90x180", help="Synthetic TIMExLATxLON grid when --nc is not given")
+    parser.add_argument("--iters", type=int, default=5)
+    args = parser.parse_args()
+
+    if not columnar.available():
+        raise SystemExit("duckdb and pyarrow are required to compare backends.")
+
+    scratch = tempfile.mkdtemp(prefix="bench_query_")
+    database.DB_PATH = os.path.join(scratch, "bench.db")
+    columnar.PARQUET_DIR = os.path.join(scratch, "parquet")
+    database.QUERY_BACKEND = "duckdb"
+
+    ds = xr.open_dataset(args.nc) if args.nc else synthetic_grid(args.grid)
+    start = time.perf_counter()
+    columns, _, total_rows = database.store_chunks_to_sqlite(iter_nc_chunks(ds), table_name="data")
+    print(f"Ingested {total_rows:,} rows in {time.perf_counter() - start:.1f} s "
+          f"(SQLite {os.path.getsize(database.DB_PATH) / 1e6:.0f} MB, "
+          f"Parquet {os.path.getsize(columnar.parquet_path('data')) / 1e6:.0f} MB)")
+
+    value = next(c for c in columns if c not in ("time", "latitude", "longitude"))
+    duck = columnar.DuckDBBackend()
+
+    print(f"\n{'query':<14}{'sqlite ms':>12}{'duckdb ms':>12}{'speedup':>10}  match")
+    for name, template in QUERIES.items():
+        sql = template.format(value=value)
+        match = _same(database._sqlite_query(sql), duck.execute(sql))
+        sqlite_ms = _time(lambda: database._sqlite_query(sql), args.iters)
+        duck_ms = _time(lambda: duck.execute(sql), args.iters)
+        print(f"{name:<14}{sqlite_ms:>12.1f}{duck_ms:>12.1f}{sqlite_ms / duck_ms:>9.1f}x  {'yes' if match else 'NO'}")
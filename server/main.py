@@ -1,22 +1,71 @@
+import asyncio
+import hashlib
+import itertools
+import json
+import os
+import re
+import time
+import uuid
+from collections import deque
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException
-from fastapi.responses import JSONResponse, HTMLResponse
+from fastapi.responses import JSONResponse, HTMLResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-import xarray as xr
+import numpy as np
 import pandas as pd
 
 # Import the new and updated functions
-from app.processing import get_schema_from_dataframe, nc_to_dataframe
-from app.database import store_to_sqlite, execute_sql_query
-from app.visualizations import map_html
+from app.processing import get_schema_from_dataframe
+from app.database import (
+    EXPORT_ROW_LIMIT,
+    QUERY_TIMEOUT_S,
+    ExportsBusy,
+    QueryTimeout,
+    count_query_rows_async,
+    execute_sql_query_async,
+    iter_query_batches,
+    ordered_sql,
+    page_sql_query_async,
+    spatial_index_hint,
+)
+from app.jobs import IngestJobManager
+from app.stats import bypass_stats, load_catalog
+from app.results import EXPORT_MEDIA_TYPES, ResultHandles, export_formats, export_stream, records
+from app.visualizations import cached_map, map_html
 from app.ai_core import (
+    SemanticCache,
     VectorDB,
+    fast_intent,
+    get_ollama_embedding,
+    ollama,
     classify_intent,
     generate_chitchat_response,
+    stream_chitchat_response,
     llm_nlp_to_sql,
 )
 
-# --- Application Setup (Unchanged) ---
-app = FastAPI(title="FloatChat Conversational AI API")
+# --- Application Setup ---
+app_loop = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global app_loop
+    # Ingestion workers hand their Ollama calls back to this loop
+    app_loop = asyncio.get_running_loop()
+    print(f"Loaded {vector_store.load()} documents from the vector store.")
+    # Documents whose embedding failed before the restart are embedded now, not served as zeros
+    pending = asyncio.create_task(vector_store.embed_pending(force=True))
+    # Until the centroids are ready, intents come from the rules and the LLM
+    centroids = asyncio.create_task(fast_intent.build(get_ollama_embedding))
+    yield
+    centroids.cancel()
+    pending.cancel()
+    await ollama.aclose()
+
+
+app = FastAPI(title="FloatChat Conversational AI API", lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -26,11 +75,41 @@ app.add_middleware(
 )
 
 # --- Global State ---
-vector_store = VectorDB()
+# Column and dataset descriptions of every upload, persisted across restarts
+VECTOR_STORE_DIR = "vector_store"
+vector_store = VectorDB(path=VECTOR_STORE_DIR)
+semantic_cache = SemanticCache()
+# Data query answers carry a handle for paging through or exporting the full result
+result_handles = ResultHandles()
+# Rows shown with an answer, and the most one /results page may return
+PREVIEW_ROWS = 5
+MAX_PAGE_ROWS = 1000
+# Identifies the loaded table's schema; semantic cache entries are scoped to it
+schema_fingerprint = None
 data_loaded = False
 current_data_context = "No data loaded. Please upload a NetCDF file."
 # --- NEW: A clean list to store column names ---
 current_column_names = []
+# The loaded upload (its VectorDB dataset key), row count and first rows, for SQL prompts
+current_dataset = None
+current_total_rows = 0
+current_sample = pd.DataFrame()
+# Changes with every activated upload; rendered maps are cached per SQL and version
+dataset_version = None
+# Schemas with more columns than this only get the relevant ones in the SQL prompt
+SQL_CONTEXT_COLUMNS = 12
+
+# Uploads are copied to disk in pieces of this size rather than read whole
+UPLOAD_CHUNK_BYTES = 8 * 1024 * 1024
+# Background NetCDF-to-SQLite conversions that may run at once; they parse in
+# parallel but write to SQLite one at a time (see database.store_chunks_to_sqlite)
+INGEST_WORKERS = 2
+
+# Recent chat latencies: full responses versus first byte/token of streamed ones
+response_timings = {
+    name: deque(maxlen=512)
+    for name in ("response_ms", "stream_first_byte_ms", "stream_first_token_ms", "stream_total_ms")
+}
 
 
 @app.get("/")
@@ -38,43 +117,248 @@ def root():
     return {"message": "FloatChat API is running and ready to connect to Ollama."}
 
 
-@app.post("/upload-data")
+@app.get("/metrics")
+def metrics():
+    chat = {
+        name: {
+            "count": len(values),
+            "p50": round(float(np.percentile(values, 50)), 2),
+            "p95": round(float(np.percentile(values, 95)), 2),
+        }
+        for name, values in response_timings.items()
+        if values
+    }
+    return {"ollama": ollama.stats(), "chat": chat, "semantic_cache": semantic_cache.stats(),
+            "intent": fast_intent.stats(), "stats_catalog": bypass_stats()}
+
+
+def _activate_dataset(job, columns, df, total_rows):
+    """Publishes a freshly swapped-in table to the chat endpoints."""
+    global data_loaded, current_data_context, current_column_names, schema_fingerprint
+    global current_dataset, current_total_rows, current_sample, dataset_version
+
+    # --- MODIFIED: Store the clean column list ---
+    current_column_names = columns
+
+    # Exact counts and ranges over the whole table when the ingest built a catalog
+    catalog = load_catalog("data")
+    if catalog is not None:
+        schema = f"Columns (type: non-null values, nulls, min, max, mean over all rows):\n{catalog.describe()}"
+    else:
+        schema = f"Schema:\n{get_schema_from_dataframe(df)}"
+    sample_data = df.head(3).to_string()
+    current_data_context = f"Table Name: data ({total_rows} rows)\n\n{schema}\n\nData Sample (first 3 rows):\n{sample_data}"
+    hint = spatial_index_hint("data")
+    if hint:
+        current_data_context += f"\n\n{hint}"
+    schema_fingerprint = hashlib.sha256(current_data_context.encode()).hexdigest()[:16]
+    # Cached intents and SQL were written for the previous table
+    semantic_cache.invalidate()
+    current_dataset, current_total_rows, current_sample = job.filename, total_rows, df.head(3)
+    dataset_version = job.id
+    # A re-uploaded file replaces its earlier descriptions
+    vector_store.remove_dataset(job.filename)
+    describe = vector_store.add_documents(
+        job.column_docs
+        + [
+            {
+                "text": f"The user has uploaded a file. The data table contains the columns: {', '.join(current_column_names)}",
+                "source": "DATASET_SUMMARY",
+            }
+        ],
+        dataset=job.filename,
+    )
+    # This runs on an ingestion worker thread; the Ollama client lives on the app's loop
+    if app_loop is not None:
+        asyncio.run_coroutine_threadsafe(describe, app_loop).result()
+    else:
+        async def describe_and_close():
+            try:
+                await describe
+            finally:
+                # The client must not outlive the temporary loop that opened it
+                await ollama.aclose()
+
+        asyncio.run(describe_and_close())
+
+    data_loaded = True
+    return {
+        "message": f"Success! Data from '{job.filename}' processed. The columns are: {', '.join(current_column_names)}.",
+        "rows": total_rows,
+    }
+
+
+ingest_jobs = IngestJobManager(on_complete=_activate_dataset, max_workers=INGEST_WORKERS)
+
+
+@app.post("/upload-data", status_code=202)
 async def upload_data(file: UploadFile = File(...)):
-    global data_loaded, current_data_context, current_column_names
+    # Each upload gets its own file so concurrent jobs never share one
+    temp_file_path = f"temp_{uuid.uuid4().hex[:8]}_{os.path.basename(file.filename)}"
     try:
-        temp_file_path = f"temp_{file.filename}"
+        # Disk writes run off the event loop so other requests are not stalled
         with open(temp_file_path, "wb") as f:
-            f.write(await file.read())
-        ds = xr.open_dataset(temp_file_path)
-        df = nc_to_dataframe(ds)
-        if df.empty:
-            raise ValueError(
-                "Processed DataFrame is empty or contains only NaN values."
-            )
-        store_to_sqlite(df, table_name="data")
-
-        # --- MODIFIED: Store the clean column list ---
-        current_column_names = df.columns.tolist()
-
-        schema = get_schema_from_dataframe(df)
-        sample_data = df.head(3).to_string()
-        current_data_context = f"Table Name: data\n\nSchema:\n{schema}\n\nData Sample (first 3 rows):\n{sample_data}"
-        vector_store.add_metadata(
-            f"The user has uploaded a file. The data table contains the columns: {', '.join(current_column_names)}",
-            "DATASET_SUMMARY",
-        )
-
-        data_loaded = True
-        return {
-            "message": f"Success! Data from '{file.filename}' processed. The columns are: {', '.join(current_column_names)}."
-        }
+            while chunk := await file.read(UPLOAD_CHUNK_BYTES):
+                await asyncio.to_thread(f.write, chunk)
     except Exception as e:
-        data_loaded = False
-        raise HTTPException(status_code=500, detail=f"Error processing file: {str(e)}")
+        if os.path.exists(temp_file_path):
+            os.remove(temp_file_path)
+        raise HTTPException(status_code=500, detail=f"Error receiving file: {str(e)}")
+
+    # Conversion runs in the background; chat keeps using the current table until it finishes
+    job = ingest_jobs.submit(file.filename, temp_file_path)
+    return {
+        "message": f"Upload of '{file.filename}' received. Processing has started.",
+        "job_id": job.id,
+        "status_url": f"/jobs/{job.id}",
+    }
+
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    job = ingest_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job '{job_id}'.")
+    status = job.to_dict()
+    if job.result is not None:
+        status.update(job.result)
+    return status
+
+
+@app.post("/jobs/{job_id}/cancel")
+def cancel_job(job_id: str):
+    job = ingest_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job '{job_id}'.")
+    if not job.cancel():
+        raise HTTPException(status_code=409, detail=f"Job '{job_id}' already {job.stage}.")
+    return job.to_dict()
+
+
+def _metadata_message() -> str:
+    if current_column_names:
+        return f"The dataset contains the following variables: {', '.join(current_column_names)}."
+    return "I can see the data is loaded, but I'm having trouble reading the specific variable names."
+
+
+async def _classify(query: str):
+    """(intent, cached SQL or None, cache entry id, query embedding or None) for a question, via the semantic cache."""
+    # Greetings and schema questions are settled by the rules without touching Ollama
+    rule_intent = fast_intent.match_rules(query, current_column_names)
+    if rule_intent in ("chitchat", "metadata_query"):
+        fast_intent.record("rules")
+        return rule_intent, None, None, None
+
+    entry, embedding = await semantic_cache.lookup(schema_fingerprint, query)
+    if entry is not None:
+        return entry["intent"], entry["sql"], entry["id"], embedding
+    intent_result = await classify_intent(query, embedding, current_column_names)
+    intent = intent_result.get("intent", "chitchat")
+    # An LLM error also lands on chitchat; only cache real classifications
+    entry_id = semantic_cache.put(schema_fingerprint, query, embedding, intent) if "intent" in intent_result else None
+    return intent, None, entry_id, embedding
+
+
+async def _sql_context(query: str, embedding=None) -> str:
+    """
+    The database context for the SQL prompt. Wide tables only get their
+    coordinate columns plus the columns whose descriptions best match the
+    question, instead of the full schema.
+    """
+    if len(current_column_names) <= SQL_CONTEXT_COLUMNS:
+        return current_data_context
+    if embedding is None:
+        embedding = await get_ollama_embedding(query)
+    await vector_store.embed_pending()
+    relevant = [
+        d for d in vector_store.search_vector(embedding, k=SQL_CONTEXT_COLUMNS, dataset=current_dataset)
+        if "column" in d
+    ]
+    if not relevant:
+        return current_data_context
+    dataset_docs = [d for d in vector_store.documents + vector_store.pending if d.get("dataset") == current_dataset and "column" in d]
+    # Coordinates and any column the question names are always included
+    words = set(re.findall(r"\w+", query.lower()))
+    docs = {d["column"]: d for d in dataset_docs if d.get("kind") == "coordinate" or d["column"].lower() in words}
+    docs.update((d["column"], d) for d in relevant)
+    columns = [c for c in current_column_names if c in docs]
+    context = (
+        f"Table Name: data ({current_total_rows} rows, {len(current_column_names)} columns; "
+        f"only the columns relevant to this question are listed)\n\nColumns:\n"
+        + "\n".join(docs[c]["text"] for c in columns)
+    )
+    catalog = load_catalog("data")
+    if catalog is not None:
+        context += f"\n\nColumn statistics over all rows:\n{catalog.describe(columns)}"
+    context += f"\n\nData Sample (first 3 rows):\n{current_sample[columns].to_string()}"
+    hint = spatial_index_hint("data")
+    return f"{context}\n\n{hint}" if hint else context
+
+
+async def _generate_sql(query: str, cached_sql, entry_id, embedding=None) -> str:
+    if cached_sql:
+        return cached_sql
+    sql_query = await llm_nlp_to_sql(query, await _sql_context(query, embedding))
+    if entry_id is not None and not sql_query.startswith("SELECT 'Error"):
+        semantic_cache.update(entry_id, sql=sql_query)
+    return sql_query
+
+
+def _wants_map(query: str) -> bool:
+    return "map" in query.lower()
+
+
+async def _data_query_result(query: str, sql_query: str):
+    """
+    Runs a data query and answers with ("html", map) or ("json", payload),
+    plus the result's row count. Only maps fetch the rows; other answers fetch
+    a preview, count the rows with COUNT(*) and hand out a result_id for the
+    /results endpoints. A query stopped by the timeout is answered with a
+    message saying so.
+    """
+    try:
+        return await _run_data_query(query, sql_query)
+    except QueryTimeout:
+        return "json", {
+            "message": f"That query took longer than {QUERY_TIMEOUT_S:g} seconds and was stopped. "
+            "Try narrowing it down, e.g. to a smaller region or time range.",
+            "sql_used": sql_query,
+            "timed_out": True,
+        }, 0
+
+
+async def _run_data_query(query: str, sql_query: str):
+    if _wants_map(query):
+        df_results = await execute_sql_query_async(sql_query)
+        if df_results.empty:
+            return "json", {"message": "I found no data for that query."}, 0
+        try:
+            return "html", map_html(df_results, cache_key=(sql_query, dataset_version)), len(df_results)
+        except Exception as e:
+            return "json", {
+                "message": f"Could not generate a map. The data might be missing latitude/longitude columns. Error: {e}"
+            }, len(df_results)
+
+    preview = await execute_sql_query_async(sql_query, row_limit=PREVIEW_ROWS)
+    if preview.empty:
+        return "json", {"message": "I found no data for that query."}, 0
+    total_rows = await count_query_rows_async(sql_query) if preview.attrs["truncated"] else len(preview)
+    result_id = result_handles.create(sql_query, dataset_version, total_rows, n_columns=len(preview.columns))
+    return "json", {
+        "message": "Query processed successfully. "
+        + (f"Found {total_rows} records." if total_rows is not None else f"Found more than {PREVIEW_ROWS} records."),
+        "sql_used": sql_query,
+        "preview": records(preview),
+        "total_rows": total_rows,
+        "result_id": result_id,
+        "page_url": f"/results/{result_id}",
+        "export_urls": {fmt: f"/results/{result_id}/export?format={fmt}" for fmt in export_formats()},
+    }, total_rows
 
 
 @app.post("/chatbot-response")
 async def chatbot_response(query: str = Form(...)):
+    start = time.perf_counter()
     if not data_loaded:
         return JSONResponse(
             content={
@@ -82,45 +366,176 @@ async def chatbot_response(query: str = Form(...)):
             }
         )
 
-    intent_result = classify_intent(query)
-    intent = intent_result.get("intent", "chitchat")
+    intent, cached_sql, entry_id, embedding = await _classify(query)
 
     # --- MODIFIED: Simplified and corrected metadata logic ---
     if intent == "metadata_query":
         print(f"🔍 Intent: Metadata Query")
-        if current_column_names:
-            response_message = f"The dataset contains the following variables: {', '.join(current_column_names)}."
-        else:
-            response_message = "I can see the data is loaded, but I'm having trouble reading the specific variable names."
-        return JSONResponse(content={"message": response_message})
+        response = JSONResponse(content={"message": _metadata_message()})
 
     elif intent == "data_query":
         print(f"🔍 Intent: Data Query")
-        sql_query = llm_nlp_to_sql(query, current_data_context)
-        df_results = execute_sql_query(sql_query)
-
-        if df_results.empty:
-            return JSONResponse(content={"message": "I found no data for that query."})
-
-        if "map" in query.lower():
-            try:
-                map_content = map_html(df_results)
-                return HTMLResponse(content=map_content, media_type="text/html")
-            except Exception as e:
-                return JSONResponse(
-                    content={
-                        "message": f"Could not generate a map. The data might be missing latitude/longitude columns. Error: {e}"
-                    }
-                )
+        sql_query = await _generate_sql(query, cached_sql, entry_id, embedding)
+        html = cached_map(sql_query, dataset_version) if _wants_map(query) else None
+        if html is not None:
+            kind, content = "html", html
+        else:
+            kind, content, _ = await _data_query_result(query, sql_query)
+        if kind == "html":
+            response = HTMLResponse(content=content, media_type="text/html")
         else:
-            return JSONResponse(
-                content={
-                    "message": f"Query processed successfully. Found {len(df_results)} records.",
-                    "sql_used": sql_query,
-                    "preview": df_results.head(5).to_dict(orient="records"),
-                }
-            )
+            response = JSONResponse(content=content)
+
     else:  # Handles 'chitchat'
         print(f"Intent: Chitchat")
-        chitchat_response = generate_chitchat_response(query)
-        return JSONResponse(content={"message": chitchat_response})
+        chitchat_response = await generate_chitchat_response(query)
+        response = JSONResponse(content={"message": chitchat_response})
+
+    response_timings["response_ms"].append((time.perf_counter() - start) * 1000.0)
+    return response
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+@app.post("/chatbot-response/stream")
+async def chatbot_response_stream(query: str = Form(...)):
+    """
+    Server-sent events version of /chatbot-response. Emits `accepted` at
+    once, `intent` when the question is classified, then
+    `token` events for chitchat or `progress` events (sql_generated,
+    query_executing, rows_found, or map_cached) for data queries, then a `result` event with
+    the same payload the non-streaming endpoint returns (maps as
+    {"html": ...}), and finally `done` with the measured timings.
+    """
+    start = time.perf_counter()
+
+    async def events():
+        first_byte_ms = None
+
+        def emit(event, data):
+            nonlocal first_byte_ms
+            if first_byte_ms is None:
+                first_byte_ms = (time.perf_counter() - start) * 1000.0
+            return _sse(event, data)
+
+        if not data_loaded:
+            yield emit("result", {"message": "Please upload a file before asking questions about the data."})
+            yield emit("done", {})
+            return
+
+        # Classification may call the LLM; the client hears back before that
+        yield emit("accepted", {})
+        intent, cached_sql, entry_id, embedding = await _classify(query)
+        yield emit("intent", {"intent": intent})
+
+        done = {}
+        if intent == "metadata_query":
+            yield emit("result", {"message": _metadata_message()})
+
+        elif intent == "data_query":
+            sql_query = await _generate_sql(query, cached_sql, entry_id, embedding)
+            yield emit("progress", {"stage": "sql_generated", "sql": sql_query, "cached": bool(cached_sql)})
+            html = cached_map(sql_query, dataset_version) if _wants_map(query) else None
+            if html is not None:
+                yield emit("progress", {"stage": "map_cached"})
+                yield emit("result", {"html": html})
+            else:
+                yield emit("progress", {"stage": "query_executing"})
+                kind, content, rows = await _data_query_result(query, sql_query)
+                yield emit("progress", {"stage": "rows_found", "rows": rows})
+                yield emit("result", {"html": content} if kind == "html" else content)
+
+        else:
+            tokens = []
+            async for token in stream_chitchat_response(query):
+                if not tokens:
+                    done["first_token_ms"] = round((time.perf_counter() - start) * 1000.0, 2)
+                    response_timings["stream_first_token_ms"].append(done["first_token_ms"])
+                tokens.append(token)
+                yield emit("token", {"token": token})
+            yield emit("result", {"message": "".join(tokens).strip()})
+
+        response_timings["stream_first_byte_ms"].append(first_byte_ms)
+        response_timings["stream_total_ms"].append((time.perf_counter() - start) * 1000.0)
+        done.update(
+            first_byte_ms=round(first_byte_ms, 2),
+            total_ms=round((time.perf_counter() - start) * 1000.0, 2),
+        )
+        yield emit("done", done)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _result_entry(result_id: str) -> dict:
+    entry = result_handles.get(result_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired result '{result_id}'.")
+    if entry["dataset_version"] != dataset_version:
+        raise HTTPException(status_code=410, detail="The dataset this result came from has been replaced.")
+    return entry
+
+
+@app.get("/results/{result_id}")
+async def result_page(result_id: str, offset: int = 0, limit: int = 100):
+    """One page of a data query's full result, in the query's own order (or sorted by all columns without one)."""
+    entry = _result_entry(result_id)
+    offset, limit = max(offset, 0), min(max(limit, 1), MAX_PAGE_ROWS)
+    try:
+        page = await page_sql_query_async(entry["sql"], offset, limit, n_columns=entry["n_columns"])
+    except QueryTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    return {
+        "result_id": result_id,
+        "offset": offset,
+        "rows": records(page),
+        "next_offset": offset + limit if len(page) == limit else None,
+        "total_rows": entry["total_rows"],
+    }
+
+
+@app.get("/results/{result_id}/export")
+def export_result(result_id: str, format: str = "csv"):
+    """
+    Streams a data query's full result as CSV, Arrow IPC or Parquet, batch by
+    batch and in the same row order as /results pages, up to EXPORT_ROW_LIMIT rows (X-Export-Truncated says whether the
+    known row count exceeds it). A download still running after
+    EXPORT_TIMEOUT_S is cut off.
+    """
+    entry = _result_entry(result_id)
+    if format not in export_formats():
+        raise HTTPException(status_code=400, detail=f"Format must be one of {', '.join(export_formats())}.")
+    extension = {"csv": "csv", "arrow": "arrows", "parquet": "parquet"}[format]
+    # Run the query before the response starts, so a failure is still an HTTP error
+    batches = iter_query_batches(ordered_sql(entry["sql"], entry["n_columns"]))
+    try:
+        first = next(batches)
+    except ExportsBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "10"})
+    except QueryTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Could not run the query: {e}")
+    total_rows = entry["total_rows"]
+    return StreamingResponse(
+        export_stream(itertools.chain([first], batches), format),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={
+            "Content-Disposition": f'attachment; filename="result_{result_id[:8]}.{extension}"',
+            "X-Export-Truncated": "true" if total_rows is not None and total_rows > EXPORT_ROW_LIMIT else "false",
+        },
+    )
+
+
+@app.get("/stats")
+def column_stats():
+    """The loaded table's statistics catalog: per-column counts, ranges and histograms, and chunk zone maps."""
+    catalog = load_catalog("data")
+    if catalog is None:
+        raise HTTPException(status_code=404, detail="No statistics catalog; upload a file first.")
+    return {"table": catalog.table_name, "rows": catalog.rows, "columns": catalog.columns, "zone_maps": catalog.zone_maps}
@@ -0,0 +1,95 @@
+"""
+Stand-in for the Ollama HTTP API, for running and load-testing the chat server without a model.
+
+    python ollama_stub.py --port 11435 --latency-ms 200 --fail-rate 0.1
+    OLLAMA_URL=http://localhost:11435 uvicorn main:app
+
+/api/generate answers intent prompts with {"intent": ...} JSON, SQL prompts with
+a fixed query and anything else with a canned sentence, streamed word by word
+when the request asks for a stream (Ollama's default). /api/embeddings
+and the batch /api/embed return deterministic vectors derived from the text.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
+
+EMBEDDING_DIM = 768
+
+app = FastAPI(title="Ollama stub")
+settings = {"latency_ms": 0.0, "fail_rate": 0.0, "token_ms": 0.0}
+
+
+async def _simulate():
+    if settings["latency_ms"]:
+        await asyncio.sleep(settings["latency_ms"] / 1000.0)
+    if random.random() < settings["fail_rate"]:
+        raise HTTPException(status_code=503, detail="stub: simulated failure")
+
+
+def _answer(body):
+    system = body.get("system", "")
+    if body.get("format") == "json":
+        prompt = body.get("prompt", "").lower()
+        intent = "data_query" if any(w in prompt for w in ("max", "min", "average", "show", "count")) else "chitchat"
+        return json.dumps({"intent": intent})
+    if "SQLite" in system:
+        return "SELECT COUNT(*) FROM data;"
+    return "Hello! This is the stub model answering."
+
+
+@app.post("/api/generate")
+async def generate(request: Request):
+    body = await request.json()
+    await _simulate()
+    answer = _answer(body)
+    if not body.get("stream", True):
+        return {"model": body.get("model"), "response": answer, "done": True}
+
+    async def tokens():
+        for word in answer.split(" "):
+            await asyncio.sleep(settings["token_ms"] / 1000.0)
+            yield json.dumps({"model": body.get("model"), "response": word + " ", "done": False}) + "\n"
+        yield json.dumps({"model": body.get("model"), "response": "", "done": True}) + "\n"
+
+    return StreamingResponse(tokens(), media_type="application/x-ndjson")
+
+
+def _embed(text):
+    seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:4], "little")
+    vector = np.random.default_rng(seed).normal(size=EMBEDDING_DIM)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+@app.post("/api/embeddings")
+async def embeddings(request: Request):
+    body = await request.json()
+    await _simulate()
+    return {"embedding": _embed(body.get("prompt", ""))}
+
+
+@app.post("/api/embed")
+async def embed(request: Request):
+    body = await request.json()
+    await _simulate()
+    texts = body.get("input", "")
+    return {"embeddings": [_embed(t) for t in ([texts] if isinstance(texts, str) else texts)]}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Delay added to every response")
+    parser.add_argument("--token-ms", type=float, default=0.0, help="Delay between streamed tokens")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Fraction of requests answered with a 503")
+    args = parser.parse_args()
+
+    settings.update(latency_ms=args.latency_ms, fail_rate=args.fail_rate, token_ms=args.token_ms)
+    uvicorn.run(app, host=args.host, port=args.port)
@@ -0,0 +1,34 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app import database, stats  # noqa: E402
+
+
+@pytest.fixture
+def data_table(tmp_path, monkeypatch):
+    """A small 'data' table ingested into a fresh working directory; returns its DataFrame."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(database, "_columnar_backend", None)
+    monkeypatch.setattr(database, "_read_pool", None)
+    monkeypatch.setattr(stats, "_catalogs", {})
+
+    rng = np.random.default_rng(0)
+    n = 500
+    df = pd.DataFrame({
+        "cycle": rng.integers(-50, 50, n),
+        "temp": np.where(rng.random(n) < 0.2, np.nan, rng.normal(10, 5, n)),
+        "time": pd.Timestamp("2021-01-01") + pd.to_timedelta(rng.integers(0, 10_000, n), unit="min"),
+        "latitude": rng.uniform(-30, 30, n),
+        "longitude": rng.uniform(60, 100, n),
+        "platform": rng.choice(["a", "b", None], n),
+    })
+    # Two chunks, so the catalog has to merge them
+    chunks = [(df.iloc[:300], 1, 2), (df.iloc[300:], 2, 2)]
+    database.store_chunks_to_sqlite(chunks, table_name="data", index_columns=["time", "latitude", "longitude"])
+    return df
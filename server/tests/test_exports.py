@@ -0,0 +1,99 @@
+import pandas as pd
+import pytest
+
+from app import database
+from test_query_timeout import SLOW_QUERY
+
+
+@pytest.mark.parametrize("backend", ["duckdb", "sqlite"])
+def test_export_stops_at_the_row_limit(data_table, monkeypatch, backend):
+    monkeypatch.setattr(database, "QUERY_BACKEND", backend)
+    batches = list(database.iter_query_batches("SELECT * FROM data", batch_rows=100, row_limit=250))
+    assert sum(len(b) for b in batches) == 250
+
+
+@pytest.mark.parametrize("backend", ["duckdb", "sqlite"])
+def test_export_times_out(data_table, monkeypatch, backend):
+    monkeypatch.setattr(database, "QUERY_BACKEND", backend)
+    with pytest.raises(database.QueryTimeout):
+        list(database.iter_query_batches(SLOW_QUERY, timeout=0.2))
+
+
+def test_sqlite_export_leaves_the_read_pool_free(data_table, monkeypatch):
+    monkeypatch.setattr(database, "QUERY_BACKEND", "sqlite")
+    exports = [database.iter_query_batches("SELECT * FROM data", batch_rows=10) for _ in range(2)]
+    for export in exports:
+        next(export)
+    # Every pooled connection is still available to chat queries
+    pool = database._get_read_pool()
+    for _ in range(database.READ_POOL_SIZE):
+        assert pool._slots.acquire(blocking=False)
+    with pytest.raises(database.ExportsBusy):
+        next(database.iter_query_batches("SELECT * FROM data"))
+    for export in exports:
+        export.close()
+    next(database.iter_query_batches("SELECT * FROM data"))
+
+
+@pytest.mark.parametrize("backend", ["duckdb", "sqlite"])
+def test_pages_cover_the_result_exactly_once(data_table, monkeypatch, backend):
+    monkeypatch.setattr(database, "QUERY_BACKEND", backend)
+    sql = "SELECT cycle, platform FROM data"
+    pages = [database.page_sql_query(sql, offset, 100, n_columns=2) for offset in range(0, 500, 100)]
+    paged = pd.concat(pages).fillna("")
+    expected = data_table[["cycle", "platform"]].fillna("")
+    assert sorted(map(tuple, paged.to_numpy())) == sorted(map(tuple, expected.to_numpy()))
+
+
+@pytest.mark.parametrize("backend", ["duckdb", "sqlite"])
+@pytest.mark.parametrize("sql, expected_rows", [
+    ("SELECT cycle, temp FROM data WHERE temp IS NOT NULL ORDER BY temp DESC", None),
+    ("SELECT platform, COUNT(*) AS n FROM data GROUP BY platform ORDER BY COUNT(*) DESC LIMIT 2", 2),
+    ("SELECT cycle, temp FROM data WHERE temp IS NOT NULL ORDER BY temp DESC LIMIT 150 OFFSET 10;", 150),
+])
+def test_pages_keep_the_query_order(data_table, monkeypatch, backend, sql, expected_rows):
+    monkeypatch.setattr(database, "QUERY_BACKEND", backend)
+    whole = database.execute_sql_query(sql, use_catalog=False)
+    pages = [database.page_sql_query(sql, offset, 40, n_columns=2) for offset in range(0, 520, 40)]
+    paged = pd.concat(pages, ignore_index=True)
+    exported = pd.concat(database.iter_query_batches(database.ordered_sql(sql, 2), batch_rows=40), ignore_index=True)
+    assert len(whole) == (expected_rows or len(whole))
+    pd.testing.assert_frame_equal(paged, whole, check_dtype=False)
+    pd.testing.assert_frame_equal(exported, whole, check_dtype=False)
+
+
+def test_clauses_inside_subqueries_and_strings_are_not_the_query_order():
+    order, limit = database._top_level_clauses(
+        "SELECT * FROM (SELECT * FROM data ORDER BY temp LIMIT 5) AS t WHERE platform = 'ORDER BY x'"
+    )
+    assert order is None and limit is None
+    assert database.ordered_sql("SELECT cycle FROM data", 1).endswith("ORDER BY 1")
+    assert database.ordered_sql("SELECT cycle FROM data ORDER BY cycle DESC", 1) == (
+        "SELECT cycle FROM data ORDER BY cycle DESC"
+    )
+
+
+@pytest.mark.parametrize("fmt", ["arrow", "parquet"])
+def test_later_batches_are_cast_to_the_first_batch_types(fmt):
+    import io
+
+    import numpy as np
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    from app.results import export_stream
+
+    batches = [
+        pd.DataFrame({"empty_first": [None, None], "ints_first": [1, 2]}),
+        pd.DataFrame({"empty_first": [1.5, 2.0], "ints_first": [3.0, np.nan]}),
+    ]
+    body = b"".join(export_stream(batches, fmt))
+    table = pa.ipc.open_stream(body).read_all() if fmt == "arrow" else pq.read_table(io.BytesIO(body))
+    assert table.column("empty_first").to_pylist() == [None, None, "1.5", "2"]
+    assert table.column("ints_first").to_pylist() == [1, 2, 3, None]
+
+
+def test_row_limit_of_zero_still_yields_the_columns(data_table):
+    batches = list(database.iter_query_batches("SELECT cycle, temp FROM data", row_limit=0))
+    assert len(batches) == 1 and batches[0].empty
+    assert list(batches[0].columns) == ["cycle", "temp"]
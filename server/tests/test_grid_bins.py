@@ -0,0 +1,12 @@
+import numpy as np
+
+from app.visualizations import grid_bins
+
+
+def test_elongated_extents_use_most_of_the_budget():
+    rng = np.random.default_rng(0)
+    for lat_range, lon_range in [((0, 1), (60, 80)), ((-60, 60), (70, 70.5)), ((-30, 30), (40, 100))]:
+        lat, lon = rng.uniform(*lat_range, 20000), rng.uniform(*lon_range, 20000)
+        _, _, counts = grid_bins(lat, lon, 5000)
+        assert 4000 <= len(counts) <= 5000
+        assert counts.sum() == 20000
@@ -0,0 +1,31 @@
+import time
+
+from app.jobs import IngestJob, IngestJobManager
+
+
+def test_a_superseded_swap_is_not_activated():
+    activated = []
+    manager = IngestJobManager(on_complete=lambda job, *_: activated.append(job.filename) or {}, max_workers=1)
+    a, b = IngestJob("a.nc", "a.nc"), IngestJob("b.nc", "b.nc")
+    # A swaps, B swaps, B finishes first
+    manager._record_swap(a)
+    manager._record_swap(b)
+    assert manager._complete(b, [], None, 0) == {}
+    assert manager._complete(a, [], None, 0) is None
+    assert activated == ["b.nc"]
+
+
+def test_finished_jobs_are_pruned():
+    manager = IngestJobManager(on_complete=lambda *_: {}, max_workers=1, job_ttl_s=60, job_history=2)
+    now = time.time()
+    for i, finished in enumerate([now - 120, now - 3, now - 2, now - 1]):
+        job = IngestJob(f"{i}.nc", f"{i}.nc")
+        job.stage, job.finished = "done", finished
+        manager.jobs[job.id] = job
+    running = IngestJob("running.nc", "running.nc")
+    running.stage = "converting"
+    manager.jobs[running.id] = running
+
+    with manager._lock:
+        manager._prune()
+    assert sorted(job.filename for job in manager.jobs.values()) == ["2.nc", "3.nc", "running.nc"]
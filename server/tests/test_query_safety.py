@@ -0,0 +1,48 @@
+import sqlite3
+
+import pytest
+
+from app import columnar, database
+
+pytestmark = pytest.mark.skipif(not columnar.available(), reason="DuckDB is not installed")
+
+REFUSED = [
+    "SELECT * FROM read_text('/etc/hostname');",
+    "SELECT 1; COPY (SELECT 42 AS x) TO '{out}';",
+    "COPY (SELECT 42 AS x) TO '{out}';",
+    "ATTACH '{db}' AS other;",
+    "SET enable_external_access = true;",
+]
+
+
+@pytest.mark.parametrize("sql", REFUSED)
+def test_duckdb_refuses_file_access(data_table, tmp_path, sql):
+    sql = sql.format(out=tmp_path / "pwned.csv", db=tmp_path / "other.db")
+    backend = database._get_columnar_backend()
+    with pytest.raises((columnar.QueryRejected, columnar.duckdb.Error)):
+        backend.execute(sql)
+    assert database.execute_sql_query(sql).empty
+    assert not (tmp_path / "pwned.csv").exists()
+    assert not (tmp_path / "other.db").exists()
+
+
+@pytest.mark.parametrize("sql", ["ATTACH '{db}' AS other", "PRAGMA table_info(data)", "SELECT 1; SELECT 2"])
+def test_sqlite_refuses_anything_but_select(data_table, tmp_path, sql):
+    sqlite3.connect(tmp_path / "other.db").close()
+    with pytest.raises(columnar.QueryRejected):
+        database._sqlite_query(sql.format(db=tmp_path / "other.db"))
+
+
+def test_select_still_runs_on_both_backends(data_table):
+    sql = "SELECT COUNT(*) AS n FROM data WHERE latitude BETWEEN -10 AND 10"
+    expected = int(data_table["latitude"].between(-10, 10).sum())
+    assert database._get_columnar_backend().execute(sql).iloc[0, 0] == expected
+    assert database._sqlite_query(sql).iloc[0, 0] == expected
+
+
+def test_sqlite_spatial_index_query_still_runs(data_table):
+    sql = (
+        "SELECT COUNT(*) FROM data WHERE rowid IN "
+        "(SELECT id FROM data_rtree WHERE min_lat >= -10 AND max_lat <= 10 AND min_lon >= 60 AND max_lon <= 100)"
+    )
+    assert database._sqlite_query(sql).iloc[0, 0] == int(data_table["latitude"].between(-10, 10).sum())
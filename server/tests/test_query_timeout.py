@@ -0,0 +1,18 @@
+import pytest
+
+from app import database
+
+SLOW_QUERY = (
+    "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 100000000) "
+    "SELECT SUM(i) FROM n, data"
+)
+
+
+@pytest.mark.parametrize("backend", ["duckdb", "sqlite"])
+def test_timeout_is_raised_not_returned_as_no_data(data_table, monkeypatch, backend):
+    monkeypatch.setattr(database, "QUERY_BACKEND", backend)
+    monkeypatch.setattr(database, "QUERY_TIMEOUT_S", 0.2)
+    with pytest.raises(database.QueryTimeout):
+        database.execute_sql_query(SLOW_QUERY, use_catalog=False)
+    # The row count behind a preview gives up instead
+    assert database.count_query_rows(SLOW_QUERY) is None
@@ -0,0 +1,23 @@
+import numpy as np
+import pandas as pd
+
+from app import database
+
+
+def test_hint_query_keeps_points_on_the_box_edge(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(database, "QUERY_BACKEND", "sqlite")
+    monkeypatch.setattr(database, "_read_pool", None)
+    # 0.1 and 70.3 are not float32 values, so their R*Tree bounds are rounded outwards
+    df = pd.DataFrame({"latitude": [0.1, 0.1, 0.5, 1.0], "longitude": [70.3, 70.2, 70.25, 70.3]})
+    database.store_chunks_to_sqlite([(df, 1, 1)], index_columns=["latitude", "longitude"])
+
+    hint = database.spatial_index_hint("data")
+    condition = hint[hint.index("rowid IN"):]
+    for south, north, west, east in [(0.1, 0.5, 70.2, 70.3), (0.1, 0.1, 70.3, 70.3), (-1, 0.09, 60, 80)]:
+        sql = "SELECT COUNT(*) FROM data WHERE " + (
+            condition.replace("<south>", repr(south)).replace("<north>", repr(north))
+            .replace("<west>", repr(west)).replace("<east>", repr(east))
+        )
+        expected = int((df["latitude"].between(south, north) & df["longitude"].between(west, east)).sum())
+        assert database._sqlite_query(sql).iloc[0, 0] == expected
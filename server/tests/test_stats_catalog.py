@@ -0,0 +1,49 @@
+import pytest
+
+from app import database, stats
+
+AGGREGATES = [
+    "SELECT COUNT(*) FROM data",
+    "SELECT MIN(cycle), MAX(cycle), COUNT(cycle), AVG(cycle) FROM data",
+    "SELECT MIN(temp), MAX(temp), COUNT(temp), AVG(temp) FROM data",
+    "SELECT MIN(time), MAX(time), COUNT(time) FROM data",
+    "SELECT COUNT(platform) FROM data",
+    'SELECT MAX("latitude") AS north, min(longitude) AS "west edge" FROM "data";',
+]
+
+
+@pytest.mark.parametrize("sql", AGGREGATES)
+def test_catalog_answers_match_sqlite(data_table, sql):
+    answer = stats.load_catalog("data").answer(sql)
+    assert answer is not None
+    expected = database._sqlite_query(sql)
+    assert list(answer.columns) == list(expected.columns)
+    for column in expected.columns:
+        got, want = answer[column].iloc[0], expected[column].iloc[0]
+        if isinstance(want, float):
+            assert got == pytest.approx(want, rel=1e-9)
+        else:
+            assert got == want
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT MAX(temp) FROM data WHERE latitude > 0",
+    "SELECT platform, COUNT(*) FROM data GROUP BY platform",
+    "SELECT MIN(cycle) FROM data LIMIT 1",
+    "SELECT MIN(platform) FROM data",
+    "SELECT AVG(time) FROM data",
+    "SELECT MAX(salinity) FROM data",
+    "SELECT COUNT(*) FROM other",
+])
+def test_other_queries_need_the_table(data_table, sql):
+    assert stats.load_catalog("data").answer(sql) is None
+
+
+def test_execute_sql_query_only_bypasses_the_table_for_whole_columns(data_table, monkeypatch):
+    monkeypatch.setattr(stats, "_bypass", {"answered": 0, "table": 0})
+    filtered = database.execute_sql_query("SELECT MAX(temp) FROM data WHERE latitude > 0")
+    expected = data_table.loc[data_table["latitude"] > 0, "temp"].max()
+    assert filtered.iloc[0, 0] == pytest.approx(expected)
+    database.execute_sql_query("SELECT MAX(temp) FROM data")
+    assert stats.bypass_stats()["answered_from_catalog"] == 1
+    assert stats.bypass_stats()["ran_on_table"] == 1
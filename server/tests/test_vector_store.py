@@ -0,0 +1,48 @@
+import asyncio
+
+import numpy as np
+
+from app import ai_core
+from app.ai_core import EMBEDDING_DIM, VectorDB
+
+
+def _embedder(failing):
+    async def embed(texts, batch_size=32):
+        return np.array(
+            [np.zeros(EMBEDDING_DIM) if t in failing else np.ones(EMBEDDING_DIM) for t in texts], dtype="float32"
+        )
+    return embed
+
+
+def test_failed_embeddings_are_not_saved_and_are_retried(tmp_path, monkeypatch):
+    failing = {"salinity"}
+    monkeypatch.setattr(ai_core, "get_ollama_embeddings", _embedder(failing))
+    store = VectorDB(path=str(tmp_path))
+    asyncio.run(store.add_documents([{"text": "temperature"}, {"text": "salinity"}], dataset="a.nc"))
+    assert [d["text"] for d in store.documents] == ["temperature"]
+    assert [d["text"] for d in store.pending] == ["salinity"]
+    assert store.index.ntotal == 1
+
+    reloaded = VectorDB(path=str(tmp_path))
+    assert reloaded.load() == 2
+    assert not (np.load(tmp_path / "vectors.npy") == 0).all(axis=1).any()
+
+    failing.clear()
+    asyncio.run(reloaded.embed_pending(force=True))
+    assert [d["text"] for d in reloaded.documents] == ["temperature", "salinity"]
+    assert reloaded.pending == [] and reloaded.index.ntotal == 2
+
+
+def test_zero_vectors_from_older_stores_become_pending(tmp_path, monkeypatch):
+    monkeypatch.setattr(ai_core, "get_ollama_embeddings", _embedder(set()))
+    store = VectorDB(path=str(tmp_path))
+    asyncio.run(store.add_documents([{"text": "temperature"}, {"text": "salinity"}]))
+    vectors = np.load(tmp_path / "vectors.npy")
+    vectors[1] = 0
+    np.save(tmp_path / "vectors.npy", vectors)
+    (tmp_path / "pending.json").unlink()
+
+    reloaded = VectorDB(path=str(tmp_path))
+    reloaded.load()
+    assert [d["text"] for d in reloaded.documents] == ["temperature"]
+    assert [d["text"] for d in reloaded.pending] == ["salinity"]